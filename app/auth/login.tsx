@@ -2,7 +2,7 @@
 import React, { useState } from "react";
 import { View, Text, TextInput, TouchableOpacity, Alert, ActivityIndicator, StyleSheet } from "react-native";
 import { useRouter } from "expo-router";
-import { saveUserId } from "../../services/authService"; // Import session-based service
+import { saveUserId, saveTokens } from "../../services/authService"; // Import session-based service
 import { loginUser } from "../../services/api"; // Import loginUser from api
 
 const LOGIN_URL = process.env.EXPO_PUBLIC_LOGIN_URL || "http://192.168.0.114:5002/login"; // Use env variable
@@ -30,7 +30,8 @@ const LoginScreen: React.FC = () => {
       const data = await response.json();
 
       if (response.ok) {
-        await saveUserId(data.user_id); // Save user ID instead of token
+        await saveUserId(data.user_id);
+        await saveTokens(data.access_token, data.refresh_token);
         router.replace("../home"); // Navigate to home on success
       } else {
         Alert.alert("Login Failed", data.error || "Invalid credentials");
@@ -4,6 +4,7 @@ import { useRouter } from "expo-router";
 import { isUserLoggedIn, getUserId } from "../../services/authService";
 import Constants from 'expo-constants';
 import TreatmentsList from "@/components/TreatmentsList";
+import { authFetch } from "@/services/api";
 
 interface Medicine {
   _id: string;
@@ -30,7 +31,7 @@ export default function HomeScreen() {
       if (!userId) {
         return;
       }
-      const response = await fetch(`${MEDICINES_URL}?userId=${userId}`);
+      const response = await authFetch(MEDICINES_URL);
       if (!response.ok) {
         throw new Error("Failed to fetch active medicines");
       }
@@ -1,61 +1,87 @@
-from flask import Flask, request, jsonify, session
-from pymongo import MongoClient
+from flask import Flask, Request, request, Response, stream_with_context
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from werkzeug.security import generate_password_hash, check_password_hash
-import jwt
-import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
 import logging
-import numpy as np
-from PIL import Image
-import io
-from ocr import preprocess_image, resize_image, convert_to_png, pytesseract
+import time
+from logging_setup import configure_logging
+from metrics import registry, observe_request, observe_ocr_result, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from ocr import decode_image, decode_width, ocr_image, timed, ImageTooLarge, TIMEOUT_TEXT, TESSERACT_CMD
+from ocr_cache import cache as ocr_cache
+from ocr_pool import extract_batch, MAX_BATCH_IMAGES
+from ocr_jobs import submit_job, get_job, cancel_job, QueueFull
+from uploads import spool_stream, upload_buffer, read_upload, MAX_REQUEST_BYTES
+from db import create_client, DB_NAME
+from db_indexes import ensure_indexes
+from health import HealthProbe, mongo_check
+from expiry import expire_one, expire_many, expired_query
+from expiry_sweeper import start_sweeper
+import auth_pool
+from auth_pool import AuthOverloaded, RateLimited
+from tokens import TokenAuth, TokenError, bearer_token
+from validation import ValidationError, with_user, build_medicine, build_medicine_batch, resolve_batch_results, build_treatment, form_flag, ocr_options
+from serialization import json_response, dumps
+from response_cache import response_cache, etag_matches
+from pagination import parse_page_args, parse_projection, find_page, stream_json_array
+from medicine_parser import parse_medicines, get_index as load_drug_index
 from dotenv import load_dotenv
 import os
 from bson.objectid import ObjectId  # For handling MongoDB's ObjectId
-from flask_bcrypt import Bcrypt 
-from datetime import datetime, timedelta, timezone  # Import timezone
+from bson.errors import InvalidId
 import functools #add this import
+import threading
  
  #send request with valid token
 # send request with valid token
+
+
+class UploadRequest(Request):
+    """Spools file uploads to a temporary file unless the whole request is small."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return spool_stream(total_content_length)
+
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+# Werkzeug stops reading the body past this and answers 413, chunked uploads included
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 # Explicit CORS configuration
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
-bcrypt = Bcrypt(app)  # Initialize bcrypt with your Flask app
+CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True,
+     expose_headers=["X-Next-Cursor", "ETag"])
 
 load_dotenv()  # Load environment variables from .env file
+configure_logging()
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY") #get secret key.
 if app.config['SECRET_KEY'] is None: #check if secret key is set.
     raise ValueError("SECRET_KEY is not set. Please set the environment variable.")
 
-# def token_required(f):
-#     @functools.wraps(f)
-#     def decorated(*args, **kwargs):
-#         token = None
-#         if 'Authorization' in request.headers:
-#             token = request.headers['Authorization'].split(" ")[1]
-
-#         if not token:
-#             return jsonify({'message': 'Token is missing!'}), 401
-
-#         try:
-#             data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-#             # Add user_id to the request context
-#             request.user_id = data['phone'] #change to phone, as this is what is stored in the JWT.
-#         except jwt.ExpiredSignatureError:
-#             return jsonify({'message': 'Token has expired!'}), 401
-#         except jwt.InvalidTokenError:
-#             return jsonify({'message': 'Token is invalid!'}), 401
-#         except Exception as e:
-#             logging.error(f"Error decoding token: {str(e)}")
-#             return jsonify({'message': 'Something went wrong'}), 500
+token_auth = TokenAuth(os.getenv("JWT_SECRET_KEY") or app.config['SECRET_KEY'])
 
-#         return f(*args, **kwargs)
 
-#     return decorated
+def token_required(f):
+    """Reject requests without a valid access token, and put its user id on request.user_id."""
+    @functools.wraps(f)
+    def decorated(*args, **kwargs):
+        try:
+            claims = token_auth.verify(bearer_token(request.headers.get('Authorization')))
+        except TokenError as e:
+            return json_response({'message': str(e)}), 401, {'WWW-Authenticate': 'Bearer'}
+        # The user id comes from the signed token, never from the request body or query string
+        request.user_id = claims['sub']
+        return f(*args, **kwargs)
 
+    return decorated
 
 
+@app.errorhandler(RequestEntityTooLarge)
+def too_large(e):
+    """413 for a request body over MAX_CONTENT_LENGTH, or one image over the byte or pixel limit."""
+    if isinstance(e, ImageTooLarge):
+        return json_response({"error": str(e)}), 413
+    logging.warning(f"Request body over {MAX_REQUEST_BYTES} bytes refused")
+    return json_response({"error": f"Request is larger than {MAX_REQUEST_BYTES // (1024 * 1024)} MB"}), 413
 
 
 @app.route('/extract-text', methods=['POST'])
@@ -66,89 +92,275 @@ def extract_text():
         # Check if an image is uploaded
         if 'image' not in request.files:
             logging.warning("No image uploaded")
-            return jsonify({"error": "No image uploaded"}), 400
+            return json_response({"error": "No image uploaded"}), 400
 
         file = request.files['image']
 
         if file.filename == '':
             logging.warning("Empty file uploaded")
-            return jsonify({"error": "Empty file uploaded"}), 400
-
-        # Read and decode image
-        img = np.array(Image.open(io.BytesIO(file.read())))
-
-        if img is None:
-            logging.error("Invalid image format or corrupted file")
-            return jsonify({"error": "Invalid image format or corrupted file"}), 400
+            return json_response({"error": "Empty file uploaded"}), 400
+
+        options = ocr_options(request.form)
+        parse = form_flag(request.form, 'parse')
+        # Size and pixel limits are checked from the header, then the spooled file is decoded in place
+        report = {}
+        with upload_buffer(file.stream) as data:
+            # Repeat uploads of the same photo skip decoding and OCR entirely
+            cache_key = ocr_cache.key(data, **options)
+            result = ocr_cache.get(cache_key)
+            if result is None:
+                with timed(report, 'decode'):
+                    img = decode_image(data, max_width=decode_width(options['resolution']))
+        if result is not None:
+            logging.info("OCR cache hit")
+            if parse:
+                result['medicines'] = parse_medicines(result['extracted_text'])
+            return json_response(dict(result, cached=True))
 
         logging.info(f"Image received, shape: {img.shape}")
 
-        # Process the image
-        img = resize_image(img)
-        img = convert_to_png(img)
-        processed_img = preprocess_image(img)
+        # Process the image and perform OCR
+        text = ocr_image(img, report=report, **options)
+        result = dict(report, extracted_text=text)
+        if text != TIMEOUT_TEXT:
+            ocr_cache.set(cache_key, result)
 
-        # Perform OCR
-        custom_config = r'--oem 3 --psm 6'  
-        text = pytesseract.image_to_string(processed_img, config=custom_config).strip()
+        observe_ocr_result(result)
+        logging.debug(f"Extracted {len(text)} characters")
+        logging.info(f"OCR profile {report['profile']}, confidence {report['confidence']}, "
+                     f"stage timings (ms): {report['timings']}")
 
-        # Log extracted text
-        logging.debug(f"Extracted text: {text}")
+        if parse:
+            result['medicines'] = parse_medicines(text)
 
-        return jsonify({"extracted_text": text})
+        return json_response(result)
 
+    except (ImageTooLarge, RequestEntityTooLarge) as e:
+        return too_large(e)
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error processing request: {e}")
-        return jsonify({"error": str(e)}), 500
+        return json_response({"error": str(e)}), 500
+
+
+@app.route('/extract-text/batch', methods=['POST'])
+def extract_text_batch():
+    try:
+        files = request.files.getlist('images')
+        logging.info(f"Received request to /extract-text/batch with {len(files)} images")
+
+        if not files:
+            logging.warning("No images uploaded")
+            return json_response({"error": "No images uploaded"}), 400
+
+        if len(files) > MAX_BATCH_IMAGES:
+            logging.warning(f"Too many images in batch: {len(files)}")
+            return json_response({"error": f"At most {MAX_BATCH_IMAGES} images per batch"}), 400
+
+        if any(file.filename == '' for file in files):
+            logging.warning("Empty file uploaded")
+            return json_response({"error": "Empty file uploaded"}), 400
+
+        options = ocr_options(request.form)
+
+        # Check and read each upload up front, the worker processes only get raw bytes.
+        # An empty, oversized or unreadable image gets its own error, the rest are still OCRed.
+        results = [None] * len(files)
+        uploads = []
+        for index, file in enumerate(files):
+            try:
+                uploads.append((index, read_upload(file.stream)))
+            except ValueError as e:
+                logging.warning(f"Batch image {index} rejected: {e}")
+                results[index] = {"index": index, "error": str(e)}
+        if uploads:
+            extracted = extract_batch([data for _, data in uploads], **options)
+            for (index, _), result in zip(uploads, extracted):
+                results[index] = dict(result, index=index)
+        for result, file in zip(results, files):
+            result['filename'] = file.filename
+
+        return json_response({"results": results})
+
+    except (ImageTooLarge, RequestEntityTooLarge) as e:
+        return too_large(e)
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error processing batch request: {e}")
+        return json_response({"error": str(e)}), 500
+
+
+@app.route('/parse-medicines', methods=['POST'])
+def parse_medicines_route():
+    try:
+        data = request.json
+        if not data or not isinstance(data.get('text'), str):
+            logging.warning("No text provided to parse")
+            return json_response({'error': 'Text is required'}), 400
+
+        medicines_list = parse_medicines(data['text'])
+        logging.info(f"Parsed {len(medicines_list)} medicines from text")
+
+        return json_response({'medicines': medicines_list}), 200
+
+    except Exception as e:
+        logging.error(f"Error in /parse-medicines: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
 
 
-MONGO_URI = os.getenv("MONGO_URI")
-if not MONGO_URI:
-    raise ValueError("MONGO_URI is not set. Please set the environment variable.")
+# Cache and token stats describe the whole server, not the caller, so they are not public like /metrics
+@app.route('/ocr/cache/stats', methods=['GET'])
+@token_required
+def ocr_cache_stats():
+    return json_response(ocr_cache.stats()), 200
 
 
-# Create a new client and connect to the MongoDB server
-client = MongoClient(MONGO_URI)
-db = client["medi-copilot"]  # Ensure a database is selected
+@app.route('/response-cache/stats', methods=['GET'])
+@token_required
+def response_cache_stats():
+    return json_response(response_cache.stats()), 200
+
+
+@app.route('/ocr/jobs', methods=['POST'])
+def create_ocr_job():
+    try:
+        if 'image' not in request.files:
+            logging.warning("No image uploaded")
+            return json_response({"error": "No image uploaded"}), 400
+
+        file = request.files['image']
+
+        if file.filename == '':
+            logging.warning("Empty file uploaded")
+            return json_response({"error": "Empty file uploaded"}), 400
+
+        priority = request.form.get('priority', 'normal')
+        job = submit_job(read_upload(file.stream), priority, **ocr_options(request.form))
+        logging.info(f"Queued OCR job {job.id} with priority {priority}")
+
+        return json_response(job.to_dict()), 202
+
+    except (ImageTooLarge, RequestEntityTooLarge) as e:
+        return too_large(e)
+    except ValueError as e:
+        return json_response({"error": str(e)}), 400
+    except QueueFull as e:
+        logging.warning("OCR job queue is full")
+        return json_response({"error": str(e)}), 429, {'Retry-After': '5'}
+    except Exception as e:
+        logging.error(f"Error in /ocr/jobs: {e}")
+        return json_response({"error": str(e)}), 500
+
+
+@app.route('/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return json_response({"error": "Job not found"}), 404
+    return json_response(job.to_dict()), 200
+
+
+@app.route('/ocr/jobs/<job_id>', methods=['DELETE'])
+def cancel_ocr_job(job_id):
+    job = cancel_job(job_id)
+    if job is None:
+        return json_response({"error": "Job not found"}), 404
+    return json_response(job.to_dict()), 200
+
+
+# Create a new client, pool size and timeouts come from the environment (see db.py)
+client = create_client()
+db = client[DB_NAME]  # Ensure a database is selected
 users = db.users  # Select the `users` collection
 medicines = db.medicines  # Select the `medicines` collection
 medicines_history = db.medicines_history  # Select the `medicines_history` collection
 treatments = db.treatments  # Select the `treatments` collection
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+# Probes ping Mongo on their own schedule, /readyz only reads the last result
+health_probe = HealthProbe({'mongo': mongo_check(client)})
+expiry_sweeper = None
+
+
+def start_background_work():
+    """Start this process's background threads.
+
+    Threads do not survive a fork, so under the preloading server (serve.py)
+    this runs in each worker after the fork instead of at import.
+    """
+    global expiry_sweeper
+    # Build or load the drug index in the background so the first parse is fast
+    threading.Thread(target=load_drug_index, name="drug-index-loader", daemon=True).start()
+    # Create missing indexes in the background, so an unreachable database does not block startup
+    threading.Thread(target=ensure_indexes, args=(db,), name="index-bootstrap", daemon=True).start()
+    # Move expired medicines to history in the background, one replica at a time
+    expiry_sweeper = start_sweeper(db)
+    health_probe.start()
+    # Share this worker's numbers with the others' /metrics, when METRICS_DIR is set
+    registry.start_flusher()
+
+
+def stop_background_work():
+    if expiry_sweeper:
+        expiry_sweeper.stop(timeout=5)
+    health_probe.stop()
+
+
+if not os.getenv("DEFER_BACKGROUND_WORK"):
+    start_background_work()
+
+@app.before_request
+def start_request_timer():
+    request.started_at = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    # Label by route pattern, not by path, so ids in URLs do not create a series each
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(request.method, route, response.status_code, time.perf_counter() - request.started_at)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype=METRICS_CONTENT_TYPE)
 
 @app.route('/test-connection', methods=['GET'])
 def test_connection():
-    try:
-        # Ping MongoDB to test the connection
-        client.admin.command('ping')
-        return jsonify({"message": "Connected to MongoDB", "database": db.name}), 200
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    # Last background ping, rather than a round trip per call
+    ready, status = health_probe.readiness()
+    if ready:
+        return json_response({"message": "Connected to MongoDB", "database": db.name}), 200
+    return json_response({"error": status['checks']['mongo']['error']}), 500
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return json_response(health_probe.liveness()), 200
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, status = health_probe.readiness()
+    return json_response(status), 200 if ready else 503
 
 @app.route('/register', methods=['POST'])
 def register():
     try:
         data = request.json
-        logging.debug(f"Received data: {data}")
 
         # Check for required fields
         required_fields = ('name', 'phone', 'password')
         if not all(k in data for k in required_fields):
             logging.warning("Missing required fields")
-            return jsonify({'error': 'Missing required fields'}), 400
+            return json_response({'error': 'Missing required fields'}), 400
 
         # Check if user already exists
-        existing_user = users.find_one({'phone': data['phone']})
-        logging.debug(f"Existing user check: {existing_user}")
+        existing_user = users.find_one({'phone': data['phone']}, {'_id': 1})
         if existing_user:
             logging.warning(f"Phone number {data['phone']} already registered")
-            return jsonify({'error': 'Phone number already registered'}), 400
+            return json_response({'error': 'Phone number already registered'}), 400
 
-        # Hash password securely
-        hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
-        logging.debug(f"Generated hashed password: {hashed_password}")
+        # Hash password securely, on the bounded hashing pool rather than this thread
+        hashed_password = auth_pool.hash_password(data['password'])
 
         # Create user document
         user = {
@@ -159,20 +371,25 @@ def register():
             'age': None,
             'anonymity': True
         }
-        logging.debug(f"User object to insert: {user}")
 
-        # Insert into MongoDB
-        inserted_id = users.insert_one(user).inserted_id
+        # Insert into MongoDB, the unique phone index catches a concurrent registration
+        try:
+            inserted_id = users.insert_one(user).inserted_id
+        except DuplicateKeyError:
+            logging.warning(f"Phone number {data['phone']} already registered")
+            return json_response({'error': 'Phone number already registered'}), 400
         logging.info(f"User registered successfully with ID: {inserted_id}")
 
-        return jsonify({
+        return json_response({
             'message': 'User registered successfully',
             'user_id': str(inserted_id)
         }), 201
 
+    except AuthOverloaded as e:
+        return json_response({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         logging.error(f"Error in /register: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -182,219 +399,302 @@ def login():
     required_fields = ('phone', 'password')
     if not all(k in data for k in required_fields):
         logging.error("Missing required fields in login request: %s", data)
-        return jsonify({'error': 'Missing required fields'}), 400
+        return json_response({'error': 'Missing required fields'}), 400
+
+    # Limit attempts per phone before doing any work for them
+    try:
+        auth_pool.check_login_rate(data['phone'])
+    except RateLimited as e:
+        logging.warning("Login attempt rate limited: %s", data['phone'])
+        return json_response({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
 
     # Find user by phone
-    user = users.find_one({'phone': data['phone']})
+    user = users.find_one({'phone': data['phone']}, {'password': 1})
 
     if not user:
         logging.warning("Login attempt failed - User not found: %s", data['phone'])
-        return jsonify({'error': 'Invalid phone or password'}), 401
+        return json_response({'error': 'Invalid phone or password'}), 401
 
     # Check password hash
-    if not bcrypt.check_password_hash(user['password'], data['password']):
+    try:
+        password_ok = auth_pool.check_password(user['password'], data['password'])
+    except AuthOverloaded as e:
+        return json_response({'error': str(e)}), 503, {'Retry-After': '1'}
+    if not password_ok:
         logging.warning("Login attempt failed - Incorrect password for user: %s", data['phone'])
-        return jsonify({'error': 'Invalid phone or password'}), 401
+        return json_response({'error': 'Invalid phone or password'}), 401
 
-    # Store user ID in session
+    # Hand out signed tokens, any replica can verify them without a session store
     try:
-        session['user_id'] = str(user['_id']) # Store user_id in session
         logging.info(f"User logged in successfully: {data['phone']}")
-        return jsonify({
-            'message': 'Login successful',
-            'user_id': str(user['_id'])
-        }), 200
+        return json_response(dict(
+            token_auth.issue(user['_id']),
+            message='Login successful',
+            user_id=str(user['_id'])
+        )), 200
     except Exception as e:
         logging.error(f"Error during login: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return json_response({'error': 'Internal server error'}), 500
+
+@app.route('/token/refresh', methods=['POST'])
+def refresh_token():
+    data = request.json or {}
+    try:
+        return json_response(token_auth.refresh(data.get('refresh_token'))), 200
+    except TokenError as e:
+        return json_response({'error': str(e)}), 401
+
+@app.route('/auth/tokens/stats', methods=['GET'])
+@token_required
+def token_stats():
+    return json_response(token_auth.stats()), 200
 
 @app.route('/logout', methods=['POST'])
 def logout():
-    session.pop('user_id', None)
-    return jsonify({'message': 'Logged out successfully'}), 200
+    # Tokens are stateless, logging out means the client drops them
+    return json_response({'message': 'Logged out successfully'}), 200
 
 # Example of a protected route
 @app.route('/protected', methods=['GET'])
+@token_required
 def protected():
-    user_id = session.get('user_id')
-    if not user_id:
-        return jsonify({'message': 'Unauthorized'}), 401
-    return jsonify({'message': f'Protected route accessed by user {user_id}'}), 200
+    return json_response({'message': f'Protected route accessed by user {request.user_id}'}), 200
 
 @app.route('/medicines', methods=['POST'])
+@token_required
 def add_medicine():
     try:
         data = request.json
-        logging.debug(f"Received medicine data: {data}")
-
-        # Check for required fields (including userId)
-        required_fields = ('title', 'qty', 'purchaseDate', 'expiryDate', 'userId')
-        if not all(k in data for k in required_fields):
-            logging.warning("Missing required medicine fields")
-            return jsonify({'error': 'Missing required fields'}), 400
 
-        # Validate date formats
         try:
-            datetime.strptime(data['purchaseDate'], '%Y-%m-%d')
-            datetime.strptime(data['expiryDate'], '%Y-%m-%d')
-        except ValueError:
-            logging.warning("Invalid date format")
-            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
-
-        # Validate quantity
-        try:
-            int(data['qty'])
-        except ValueError:
-            logging.warning("Invalid quantity format")
-            return jsonify({'error': 'Invalid quantity, must be a number'}), 400
-
-        # Create medicine document with medicineActive set to True
-        medicine = {
-            'user_id': data['userId'], # Get user_id from the request body
-            'title': data['title'],
-            'qty': int(data['qty']),
-            'purchaseDate': data['purchaseDate'],
-            'expiryDate': data['expiryDate'],
-            'medicineActive': True  # Default value
-        }
-
-        logging.debug(f"Medicine object to insert: {medicine}")
+            medicine = build_medicine(with_user(data, 'userId', request.user_id))
+        except ValidationError as e:
+            logging.warning(f"Invalid medicine data: {e}")
+            return json_response({'error': str(e)}), 400
 
         # Insert into MongoDB
         inserted_id = medicines.insert_one(medicine).inserted_id
+        response_cache.invalidate('medicines', medicine['user_id'])
         logging.info(f"Medicine added successfully with ID: {inserted_id}")
 
-        return jsonify({
+        return json_response({
             'message': 'Medicine added successfully',
             'medicine_id': str(inserted_id)
         }), 201
 
     except Exception as e:
         logging.error(f"Error in /medicines: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
     
-@app.route('/medicines/active', methods=['GET'])
-def get_active_medicines():
+@app.route('/medicines/bulk', methods=['POST'])
+@token_required
+def add_medicines_bulk():
     try:
-        user_id = request.args.get('userId')
-        if not user_id:
-            return jsonify({'error': 'User ID is required'}), 400
+        data = request.json
+        logging.debug(f"Received bulk medicine data for {len((data or {}).get('medicines') or [])} items")
 
-        medicines_list = list(medicines.find({'user_id': user_id, 'medicineActive': True}))
+        try:
+            documents, results = build_medicine_batch(data, user_id=request.user_id)
+        except ValidationError as e:
+            logging.warning(f"Invalid bulk medicine data: {e}")
+            return json_response({'error': str(e)}), 400
+
+        # One unordered round trip, a failed document does not stop the rest
+        write_errors = {}
+        if documents:
+            try:
+                medicines.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error['index']: error['errmsg'] for error in e.details['writeErrors']}
+
+        inserted = resolve_batch_results(documents, results, write_errors)
+        if inserted:
+            response_cache.invalidate('medicines', *(document['user_id'] for document in documents))
+        logging.info(f"Bulk insert added {inserted} of {len(results)} medicines")
+
+        status = 201 if inserted == len(results) else 207 if inserted else 400
+        return json_response({
+            'message': f'{inserted} of {len(results)} medicines added',
+            'results': results
+        }), status
 
-        # Convert ObjectId to string for JSON serialization
-        for medicine in medicines_list:
-            medicine['_id'] = str(medicine['_id'])
+    except Exception as e:
+        logging.error(f"Error in /medicines/bulk: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
+
+# Fields clients may request with ?fields=, _id is always returned
+MEDICINE_FIELDS = ('user_id', 'title', 'qty', 'purchaseDate', 'expiryDate', 'medicineActive')
+TREATMENT_FIELDS = ('user_id', 'treatment_name', 'medicines', 'start_date', 'end_date', 'notes', 'added_on')
+HISTORY_FIELDS = MEDICINE_FIELDS + ('medicine_id', 'added_on')
+
+def list_response(collection, query, allowed_fields, key=None, message=None, cache_scope=None):
+    """Respond with one page of query results, or stream them all when ?stream=true.
+
+    Pages are returned as a plain array (or {message, key: [...]} when key is given)
+    with the next page's token in the X-Next-Cursor header. With cache_scope, pages
+    are served from the response cache of query's user_id and carry an ETag.
+    """
+    limit, after = parse_page_args(request.args)
+    projection = parse_projection(request.args, allowed_fields)
+
+    if form_flag(request.args, 'stream'):
+        prefix, suffix = b'[', b']'
+        if key:
+            prefix, suffix = b'{"message":' + dumps(message) + b',"' + key.encode() + b'":[', b']}'
+        chunks = stream_json_array(collection, query, after, projection,
+                                   limit if 'limit' in request.args else None, prefix, suffix)
+        return Response(stream_with_context(chunks), mimetype='application/json')
+
+    cache_key = response_cache.key(cache_scope, query['user_id'], request.query_string) if cache_scope else None
+    entry = response_cache.get(cache_key)
+    if entry is None:
+        documents, next_cursor = find_page(collection, query, limit, after, projection)
+        body = {'message': message, key: documents, 'next': next_cursor} if key else documents
+        entry = response_cache.set(cache_key, dumps(body), next_cursor)
+    return cached_response(entry)
+
+
+def cached_response(entry):
+    """Send a CachedResponse, or 304 with no body when the client already has it."""
+    headers = {'ETag': entry.etag, 'Cache-Control': 'private, no-cache'}
+    if entry.next_cursor:
+        headers['X-Next-Cursor'] = entry.next_cursor
+    if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+        return Response(status=304, headers=headers)
+    return Response(entry.body, headers=headers, mimetype='application/json'), 200
 
-        return jsonify(medicines_list), 200
+@app.route('/medicines/active', methods=['GET'])
+@token_required
+def get_active_medicines():
+    try:
+        return list_response(medicines, {'user_id': request.user_id, 'medicineActive': True}, MEDICINE_FIELDS,
+                             cache_scope='medicines')
 
+    except ValueError as e:
+        return json_response({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error in /medicines/active: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
     
 @app.route('/medicines/expire', methods=['PUT'])
-# @token_required
+@token_required
 def expire_medicine():
     try:
-        data = request.json
+        data = request.json or {}
         medicine_id = data.get('medicine_id')
 
         if not medicine_id:
-            return jsonify({'error': 'Medicine ID is required'}), 400
+            return json_response({'error': 'Medicine ID is required'}), 400
 
-        medicine_obj_id = ObjectId(medicine_id)
+        try:
+            medicine_obj_id = ObjectId(medicine_id)
+        except (InvalidId, TypeError):
+            return json_response({'error': 'Invalid medicine ID'}), 400
 
-        # Retrieve the medicine from the active collection
-        medicine = medicines.find_one({'_id': medicine_obj_id, 'medicineActive': True})
+        # Deactivate and copy to history in two round trips, only one caller can win the update
+        medicine = expire_one(medicines, medicines_history, medicine_obj_id, request.user_id)
 
         if not medicine:
-            return jsonify({'error': 'Medicine not found or already expired'}), 404
-
-        # Update medicineActive to False in active collection
-        medicines.update_one({'_id': medicine_obj_id}, {'$set': {'medicineActive': False}})
-
-        # Move medicine to history collection
-        medicines_history.insert_one(medicine)
+            return json_response({'error': 'Medicine not found or already expired'}), 404
+        response_cache.invalidate('medicines', medicine['user_id'])
 
-        return jsonify({'message': 'Medicine expired successfully'}), 200
+        return json_response({'message': 'Medicine expired successfully'}), 200
 
     except Exception as e:
         logging.error(f"Error in /medicines/expire: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
     
+@app.route('/medicines/expire/batch', methods=['PUT'])
+@token_required
+def expire_medicines_batch():
+    try:
+        data = request.json or {}
+        medicine_ids = data.get('medicine_ids') or []
+        user_id = request.user_id
+
+        if not medicine_ids and not data.get('expired'):
+            return json_response({'error': 'Provide medicine_ids or expired: true'}), 400
+
+        # Callers can only ever expire their own medicines
+        query = {'user_id': user_id}
+        if medicine_ids:
+            try:
+                query['_id'] = {'$in': [ObjectId(medicine_id) for medicine_id in medicine_ids]}
+            except (InvalidId, TypeError):
+                return json_response({'error': 'Invalid medicine ID'}), 400
+        if data.get('expired'):
+            # Everything past its expiresAt
+            query.update(expired_query(user_id))
+
+        expired_count = expire_many(medicines, medicines_history, query)
+        if expired_count:
+            response_cache.invalidate('medicines', user_id)
+        logging.info(f"Batch expired {expired_count} medicines")
+
+        return json_response({
+            'message': 'Medicines expired successfully',
+            'expired_count': expired_count
+        }), 200
+
+    except Exception as e:
+        logging.error(f"Error in /medicines/expire/batch: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
+
 @app.route('/add_treatment', methods=['POST'])
+@token_required
 def add_treatment():
     try:
         data = request.json
-        logging.debug(f"Received data: {data}")
 
-        # Check for required fields
-        required_fields = ('user_id', 'treatment_name', 'medicines')
-        if not all(k in data for k in required_fields):
-            logging.warning("Missing required fields")
-            return jsonify({'error': 'Missing required fields'}), 400
-
-        # Validate the medicines list
-        medicines_list = data.get('medicines', [])
-        if not medicines_list:
-            logging.warning("No medicines provided in the treatment")
-            return jsonify({'error': 'No medicines provided in the treatment'}), 400
-
-        # Create treatment document
-        treatment = {
-            'user_id': data['user_id'],
-            'treatment_name': data['treatment_name'],
-            'medicines': medicines_list,
-            'start_date': data.get('start_date', datetime.now()),
-            'end_date': data.get('end_date'),
-            'notes': data.get('notes', ''),
-            'added_on': datetime.now()
-        }
-        logging.debug(f"Treatment object to insert: {treatment}")
+        try:
+            treatment = build_treatment(with_user(data, 'user_id', request.user_id))
+        except ValidationError as e:
+            logging.warning(f"Invalid treatment data: {e}")
+            return json_response({'error': str(e)}), 400
 
         # Insert into MongoDB
         inserted_id = treatments.insert_one(treatment).inserted_id
+        response_cache.invalidate('treatments', treatment['user_id'])
         logging.info(f"Treatment added successfully with ID: {inserted_id}")
 
-        return jsonify({
+        return json_response({
             'message': 'Treatment added successfully',
             'treatment_id': str(inserted_id)
         }), 201
 
     except Exception as e:
         logging.error(f"Error in /add_treatment: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
 
 @app.route('/treatments', methods=['GET'])
+@token_required
 def get_treatments():
     try:
-        user_id = request.args.get('user_id')  # Get user_id from query parameters
+        # Fetch the token user's treatments from MongoDB
+        return list_response(treatments, {'user_id': request.user_id}, TREATMENT_FIELDS, cache_scope='treatments')
 
-        if not user_id:
-            logging.warning("User ID is required")
-            return jsonify({'error': 'User ID is required'}), 400
-
-        # Fetch treatments from MongoDB based on user_id
-        user_treatments = list(treatments.find({'user_id': user_id}))
-
-        # Convert ObjectId and datetime objects to string for JSON serialization
-        for treatment in user_treatments:
-            treatment['_id'] = str(treatment['_id'])
-            if 'start_date' in treatment and isinstance(treatment['start_date'], datetime):
-                treatment['start_date'] = treatment['start_date'].isoformat()
-            if 'end_date' in treatment and isinstance(treatment['end_date'], datetime):
-                treatment['end_date'] = treatment['end_date'].isoformat()
-            if 'added_on' in treatment and isinstance(treatment['added_on'], datetime):
-                treatment['added_on'] = treatment['added_on'].isoformat()
+    except ValueError as e:
+        return json_response({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in /treatments: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
 
-        return jsonify(user_treatments), 200
+@app.route('/medicine_history', methods=['GET'])
+@token_required
+def get_medicine_history():
+    try:
+        return list_response(medicines_history, {'user_id': request.user_id}, HISTORY_FIELDS,
+                             key='history', message='Medicine history fetched successfully')
 
+    except ValueError as e:
+        return json_response({'error': str(e)}), 400
     except Exception as e:
-        logging.error(f"Error in /treatments: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+        logging.error(f"Error in /medicine_history (GET): {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}), 500
 
 
 if __name__ == '__main__':
-    logging.info(f"Tesseract Path: {pytesseract.pytesseract.tesseract_cmd}")
-    app.run(host="0.0.0.0", port=5002, debug=True, threaded=True)  # Disable debug in production
+    logging.info(f"Tesseract Path: {TESSERACT_CMD}")
+    # Development server only, production runs under serve.py. FLASK_DEBUG=1 turns on the reloader and debugger.
+    app.run(host="0.0.0.0", port=5002, debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
 
@@ -0,0 +1,632 @@
+"""ASGI variant of the backend on Starlette and Motor.
+
+Serves the same routes as app.py, but a request waiting on Mongo only holds
+a coroutine, not an OS thread. CPU-bound work is handed to executors: OCR
+to the shared OCR process pool and bcrypt to the bounded hashing pool in
+auth_pool.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5002 --workers 2
+"""
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextlib
+
+from dotenv import load_dotenv
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from logging_setup import configure_logging
+from metrics import registry, observe_request, observe_ocr_result, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from ocr import ocr_image_bytes, ImageTooLarge, OCR_TIMEOUT, TIMEOUT_TEXT
+from ocr_cache import cache as ocr_cache
+import ocr_pool
+from ocr_pool import submit, abandon, BATCH_GRACE_SECONDS
+from uploads import read_upload, MAX_REQUEST_BYTES
+from db import create_client, create_async_client, DB_NAME
+from db_indexes import ensure_indexes_async
+from health import HealthProbe, mongo_check
+from expiry import expire_one_async, expire_many_async, expired_query
+from expiry_sweeper import start_sweeper
+from medicine_parser import parse_medicines
+from response_cache import response_cache, etag_matches
+from pagination import parse_page_args, parse_projection, page_query, encode_cursor, STREAM_BATCH_SIZE
+from serialization import dumps
+import auth_pool
+from auth_pool import AuthOverloaded, RateLimited
+from tokens import TokenAuth, TokenError, bearer_token
+from validation import (ValidationError, with_user, build_medicine, build_medicine_batch, resolve_batch_results,
+                        build_treatment, form_flag, ocr_options)
+
+load_dotenv()  # Load environment variables from .env file
+configure_logging()
+SECRET_KEY = os.getenv("SECRET_KEY")
+if SECRET_KEY is None:
+    raise ValueError("SECRET_KEY is not set. Please set the environment variable.")
+# Same secret as the Flask app, so a token from either is accepted by both
+token_auth = TokenAuth(os.getenv("JWT_SECRET_KEY") or SECRET_KEY)
+
+client = create_async_client()
+db = client[DB_NAME]
+users = db.users
+medicines = db.medicines
+medicines_history = db.medicines_history
+treatments = db.treatments
+
+# Fields clients may request with ?fields=, _id is always returned
+MEDICINE_FIELDS = ('user_id', 'title', 'qty', 'purchaseDate', 'expiryDate', 'medicineActive')
+TREATMENT_FIELDS = ('user_id', 'treatment_name', 'medicines', 'start_date', 'end_date', 'notes', 'added_on')
+HISTORY_FIELDS = MEDICINE_FIELDS + ('medicine_id', 'added_on')
+
+
+def json_response(obj, status=200, headers=None):
+    return Response(dumps(obj), status_code=status, headers=headers, media_type='application/json')
+
+
+async def run_in(executor, func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+async def await_auth(future):
+    """Await a hashing pool future without blocking the event loop."""
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=auth_pool.AUTH_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        raise AuthOverloaded("Authentication is busy, try again shortly")
+
+
+def token_required(handler):
+    """Reject requests without a valid access token, and put its user id on request.state.user_id."""
+    @functools.wraps(handler)
+    async def decorated(request):
+        try:
+            claims = token_auth.verify(bearer_token(request.headers.get('authorization')))
+        except TokenError as e:
+            return json_response({'message': str(e)}, 401, {'WWW-Authenticate': 'Bearer'})
+        request.state.user_id = claims['sub']
+        return await handler(request)
+
+    return decorated
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def test_connection(request):
+    # Last background ping, rather than a round trip per call
+    ready, status = health_probe.readiness()
+    if ready:
+        return json_response({"message": "Connected to MongoDB", "database": db.name})
+    return json_response({"error": status['checks']['mongo']['error']}, 500)
+
+
+async def healthz(request):
+    return json_response(health_probe.liveness())
+
+
+async def readyz(request):
+    ready, status = health_probe.readiness()
+    return json_response(status, 200 if ready else 503)
+
+
+async def register(request):
+    try:
+        data = await read_json(request)
+
+        # Check for required fields
+        if not isinstance(data, dict) or not all(k in data for k in ('name', 'phone', 'password')):
+            logging.warning("Missing required fields")
+            return json_response({'error': 'Missing required fields'}, 400)
+
+        if await users.find_one({'phone': data['phone']}, {'_id': 1}):
+            logging.warning(f"Phone number {data['phone']} already registered")
+            return json_response({'error': 'Phone number already registered'}, 400)
+
+        user = {
+            'name': data['name'],
+            'phone': data['phone'],
+            'password': await await_auth(auth_pool.submit_hash(data['password'])),
+            'gender': None,
+            'age': None,
+            'anonymity': True
+        }
+
+        try:
+            inserted_id = (await users.insert_one(user)).inserted_id
+        except DuplicateKeyError:
+            logging.warning(f"Phone number {data['phone']} already registered")
+            return json_response({'error': 'Phone number already registered'}, 400)
+        logging.info(f"User registered successfully with ID: {inserted_id}")
+
+        return json_response({
+            'message': 'User registered successfully',
+            'user_id': str(inserted_id)
+        }, 201)
+
+    except AuthOverloaded as e:
+        return json_response({'error': str(e)}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        logging.error(f"Error in /register: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+async def login(request):
+    try:
+        data = await read_json(request)
+
+        if not isinstance(data, dict) or not all(k in data for k in ('phone', 'password')):
+            logging.error("Missing required fields in login request")
+            return json_response({'error': 'Missing required fields'}, 400)
+
+        try:
+            # The limiter's buckets are shared through SQLite, BEGIN IMMEDIATE can wait on other workers
+            await run_in(None, auth_pool.check_login_rate, data['phone'])
+        except RateLimited as e:
+            logging.warning("Login attempt rate limited: %s", data['phone'])
+            return json_response({'error': str(e)}, 429, {'Retry-After': str(e.retry_after)})
+
+        user = await users.find_one({'phone': data['phone']}, {'password': 1})
+        if not user:
+            logging.warning("Login attempt failed - User not found: %s", data['phone'])
+            return json_response({'error': 'Invalid phone or password'}, 401)
+
+        if not await await_auth(auth_pool.submit_check(user['password'], data['password'])):
+            logging.warning("Login attempt failed - Incorrect password for user: %s", data['phone'])
+            return json_response({'error': 'Invalid phone or password'}, 401)
+
+        logging.info(f"User logged in successfully: {data['phone']}")
+        return json_response(dict(
+            token_auth.issue(user['_id']),
+            message='Login successful',
+            user_id=str(user['_id'])
+        ))
+
+    except AuthOverloaded as e:
+        return json_response({'error': str(e)}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        logging.error(f"Error during login: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error'}, 500)
+
+
+async def refresh_token(request):
+    data = await read_json(request) or {}
+    try:
+        return json_response(token_auth.refresh(data.get('refresh_token')))
+    except TokenError as e:
+        return json_response({'error': str(e)}, 401)
+
+
+async def logout(request):
+    # Tokens are stateless, logging out means the client drops them
+    return json_response({'message': 'Logged out successfully'})
+
+
+@token_required
+async def add_medicine(request):
+    try:
+        try:
+            medicine = build_medicine(with_user(await read_json(request), 'userId', request.state.user_id))
+        except ValidationError as e:
+            logging.warning(f"Invalid medicine data: {e}")
+            return json_response({'error': str(e)}, 400)
+
+        inserted_id = (await medicines.insert_one(medicine)).inserted_id
+        await run_in(None, response_cache.invalidate, 'medicines', medicine['user_id'])
+        logging.info(f"Medicine added successfully with ID: {inserted_id}")
+
+        return json_response({
+            'message': 'Medicine added successfully',
+            'medicine_id': str(inserted_id)
+        }, 201)
+
+    except Exception as e:
+        logging.error(f"Error in /medicines: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+@token_required
+async def add_medicines_bulk(request):
+    try:
+        try:
+            documents, results = build_medicine_batch(await read_json(request), user_id=request.state.user_id)
+        except ValidationError as e:
+            logging.warning(f"Invalid bulk medicine data: {e}")
+            return json_response({'error': str(e)}, 400)
+
+        write_errors = {}
+        if documents:
+            try:
+                await medicines.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {error['index']: error['errmsg'] for error in e.details['writeErrors']}
+
+        inserted = resolve_batch_results(documents, results, write_errors)
+        if inserted:
+            await run_in(None, response_cache.invalidate, 'medicines', *(document['user_id'] for document in documents))
+        logging.info(f"Bulk insert added {inserted} of {len(results)} medicines")
+
+        status = 201 if inserted == len(results) else 207 if inserted else 400
+        return json_response({
+            'message': f'{inserted} of {len(results)} medicines added',
+            'results': results
+        }, status)
+
+    except Exception as e:
+        logging.error(f"Error in /medicines/bulk: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+async def stream_json_array(cursor, prefix=b'[', suffix=b']'):
+    yield prefix
+    index = 0
+    async for document in cursor:
+        yield (b',' if index else b'') + dumps(document)
+        index += 1
+    yield suffix
+
+
+async def list_response(request, collection, query, allowed_fields, key=None, message=None, cache_scope=None):
+    """Async twin of app.list_response: one page, or the whole result streamed with ?stream=true."""
+    limit, after = parse_page_args(request.query_params)
+    projection = parse_projection(request.query_params, allowed_fields)
+    cursor = collection.find(page_query(query, after), projection).sort('_id', 1)
+
+    if form_flag(request.query_params, 'stream'):
+        if 'limit' in request.query_params:
+            cursor = cursor.limit(limit)
+        prefix, suffix = b'[', b']'
+        if key:
+            prefix, suffix = b'{"message":' + dumps(message) + b',"' + key.encode() + b'":[', b']}'
+        chunks = stream_json_array(cursor.batch_size(STREAM_BATCH_SIZE), prefix, suffix)
+        return StreamingResponse(chunks, media_type='application/json')
+
+    # Generations live in SQLite or Redis and bodies may be in Redis, all blocking calls kept off the loop
+    cache_key = None
+    if cache_scope:
+        cache_key = await run_in(None, response_cache.key, cache_scope, query['user_id'], request.url.query)
+    entry = await run_in(None, response_cache.get, cache_key)
+    if entry is None:
+        documents = await cursor.limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(documents[-1]['_id'])
+        body = {'message': message, key: documents, 'next': next_cursor} if key else documents
+        entry = await run_in(None, response_cache.set, cache_key, dumps(body), next_cursor)
+    return cached_response(request, entry)
+
+
+def cached_response(request, entry):
+    """Send a CachedResponse, or 304 with no body when the client already has it."""
+    headers = {'ETag': entry.etag, 'Cache-Control': 'private, no-cache'}
+    if entry.next_cursor:
+        headers['X-Next-Cursor'] = entry.next_cursor
+    if etag_matches(request.headers.get('if-none-match'), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, headers=headers, media_type='application/json')
+
+
+@token_required
+async def get_active_medicines(request):
+    try:
+        return await list_response(request, medicines, {'user_id': request.state.user_id, 'medicineActive': True}, MEDICINE_FIELDS,
+                                   cache_scope='medicines')
+
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    except Exception as e:
+        logging.error(f"Error in /medicines/active: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+@token_required
+async def expire_medicine(request):
+    try:
+        data = await read_json(request) or {}
+        medicine_id = data.get('medicine_id')
+        if not medicine_id:
+            return json_response({'error': 'Medicine ID is required'}, 400)
+
+        try:
+            medicine_obj_id = ObjectId(medicine_id)
+        except (InvalidId, TypeError):
+            return json_response({'error': 'Invalid medicine ID'}, 400)
+
+        medicine = await expire_one_async(medicines, medicines_history, medicine_obj_id, request.state.user_id)
+        if not medicine:
+            return json_response({'error': 'Medicine not found or already expired'}, 404)
+        await run_in(None, response_cache.invalidate, 'medicines', medicine['user_id'])
+
+        return json_response({'message': 'Medicine expired successfully'})
+
+    except Exception as e:
+        logging.error(f"Error in /medicines/expire: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+@token_required
+async def expire_medicines_batch(request):
+    try:
+        data = await read_json(request) or {}
+        medicine_ids = data.get('medicine_ids') or []
+        user_id = request.state.user_id
+
+        if not medicine_ids and not data.get('expired'):
+            return json_response({'error': 'Provide medicine_ids or expired: true'}, 400)
+
+        # Callers can only ever expire their own medicines
+        query = {'user_id': user_id}
+        if medicine_ids:
+            try:
+                query['_id'] = {'$in': [ObjectId(medicine_id) for medicine_id in medicine_ids]}
+            except (InvalidId, TypeError):
+                return json_response({'error': 'Invalid medicine ID'}, 400)
+        if data.get('expired'):
+            query.update(expired_query(user_id))
+
+        expired_count = await expire_many_async(medicines, medicines_history, query)
+        if expired_count:
+            await run_in(None, response_cache.invalidate, 'medicines', user_id)
+        return json_response({'message': 'Medicines expired successfully', 'expired_count': expired_count})
+
+    except Exception as e:
+        logging.error(f"Error in /medicines/expire/batch: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+@token_required
+async def add_treatment(request):
+    try:
+        try:
+            treatment = build_treatment(with_user(await read_json(request), 'user_id', request.state.user_id))
+        except ValidationError as e:
+            logging.warning(f"Invalid treatment data: {e}")
+            return json_response({'error': str(e)}, 400)
+
+        inserted_id = (await treatments.insert_one(treatment)).inserted_id
+        await run_in(None, response_cache.invalidate, 'treatments', treatment['user_id'])
+        logging.info(f"Treatment added successfully with ID: {inserted_id}")
+
+        return json_response({
+            'message': 'Treatment added successfully',
+            'treatment_id': str(inserted_id)
+        }, 201)
+
+    except Exception as e:
+        logging.error(f"Error in /add_treatment: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+@token_required
+async def get_treatments(request):
+    try:
+        return await list_response(request, treatments, {'user_id': request.state.user_id}, TREATMENT_FIELDS,
+                                   cache_scope='treatments')
+
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    except Exception as e:
+        logging.error(f"Error in /treatments: {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+@token_required
+async def get_medicine_history(request):
+    try:
+        return await list_response(request, medicines_history, {'user_id': request.state.user_id}, HISTORY_FIELDS,
+                                   key='history', message='Medicine history fetched successfully')
+
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    except Exception as e:
+        logging.error(f"Error in /medicine_history (GET): {str(e)}", exc_info=True)
+        return json_response({'error': 'Internal server error', 'details': str(e)}, 500)
+
+
+async def extract_text(request):
+    try:
+        form = await request.form()
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            logging.warning("No image uploaded")
+            return json_response({"error": "No image uploaded"}, 400)
+        if file.filename == '':
+            logging.warning("Empty file uploaded")
+            return json_response({"error": "Empty file uploaded"}, 400)
+
+        options = ocr_options(form)
+        # Starlette has spooled the part to a temporary file, check its size and header before reading it
+        data = await run_in(None, read_upload, file.file)
+
+        cache_key = ocr_cache.key(data, **options)
+        result = ocr_cache.get(cache_key)
+        if result is not None:
+            logging.info("OCR cache hit")
+            result['cached'] = True
+        else:
+            # Decode, preprocess and Tesseract all run in the OCR process pool
+            future = submit(ocr_image_bytes, data, OCR_TIMEOUT, **options)
+            try:
+                result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=OCR_TIMEOUT + BATCH_GRACE_SECONDS)
+            except asyncio.TimeoutError:
+                # A worker still busy past the timeout is stuck, the pool replaces it
+                abandon(future)
+                raise
+            observe_ocr_result(result)
+            if result['extracted_text'] != TIMEOUT_TEXT:
+                ocr_cache.set(cache_key, result)
+
+        if form_flag(form, 'parse'):
+            result['medicines'] = parse_medicines(result['extracted_text'])
+
+        return json_response(result)
+
+    except asyncio.TimeoutError:
+        return json_response({"extracted_text": TIMEOUT_TEXT})
+    except (ImageTooLarge, RequestTooLarge) as e:
+        return json_response({"error": str(e)}, 413)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+    except Exception as e:
+        logging.error(f"Error processing request: {e}")
+        return json_response({"error": str(e)}, 500)
+
+
+async def metrics(request):
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """Records the latency of every HTTP request, labelled by the route pattern it matched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router puts the matched endpoint on the scope
+            route = ROUTE_PATHS.get(scope.get('endpoint'), 'unmatched')
+            observe_request(scope['method'], route, status, time.perf_counter() - started)
+
+
+class RequestTooLarge(Exception):
+    """A streamed request body went past MAX_REQUEST_BYTES."""
+
+
+class BodyLimitMiddleware:
+    """Refuses request bodies over MAX_REQUEST_BYTES with 413.
+
+    A Content-Length over the limit is refused before the app runs. Chunked
+    bodies are counted as they arrive, and reading past the limit raises
+    RequestTooLarge out of receive.
+    """
+
+    def __init__(self, app, max_bytes=MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def refuse(self, scope, receive, send):
+        response = json_response({"error": f"Request is larger than {self.max_bytes // (1024 * 1024)} MB"}, 413)
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        length = dict(scope['headers']).get(b'content-length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            logging.warning(f"Request body of {int(length)} bytes refused")
+            return await self.refuse(scope, receive, send)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    raise RequestTooLarge(f"Request is larger than {self.max_bytes // (1024 * 1024)} MB")
+            return message
+
+        async def send_started(message):
+            nonlocal started
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, send_started)
+        except RequestTooLarge:
+            logging.warning("Streamed request body over the limit refused")
+            if not started:
+                await self.refuse(scope, receive, send)
+
+
+# Set up in startup, so no blocking client exists before a server forks its workers
+health_probe = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Start the background work when the server starts, and stop it when the server shuts down."""
+    global health_probe
+    # Index creation must not hold up serving, an unreachable database only gets logged
+    indexes = asyncio.get_running_loop().create_task(ensure_indexes_async(db))
+    # The sweeper and the probe run on threads, so they share a small blocking client
+    sync_client = create_client(maxPoolSize=4)
+    sweeper = start_sweeper(sync_client[DB_NAME])
+    health_probe = HealthProbe({'mongo': mongo_check(sync_client)}).start()
+    registry.start_flusher()
+    try:
+        yield
+    finally:
+        indexes.cancel()
+        if sweeper:
+            await run_in(None, sweeper.stop, timeout=5)
+        health_probe.stop()
+        # Under gunicorn worker_exit does this too, both are safe to repeat
+        ocr_pool.shutdown(wait=False)
+        if registry.directory:
+            registry.flush()
+        sync_client.close()
+
+
+routes = [
+    Route('/test-connection', test_connection, methods=['GET']),
+    Route('/healthz', healthz, methods=['GET']),
+    Route('/readyz', readyz, methods=['GET']),
+    Route('/register', register, methods=['POST']),
+    Route('/login', login, methods=['POST']),
+    Route('/token/refresh', refresh_token, methods=['POST']),
+    Route('/logout', logout, methods=['POST']),
+    Route('/medicines', add_medicine, methods=['POST']),
+    Route('/medicines/bulk', add_medicines_bulk, methods=['POST']),
+    Route('/medicines/active', get_active_medicines, methods=['GET']),
+    Route('/medicines/expire', expire_medicine, methods=['PUT']),
+    Route('/medicines/expire/batch', expire_medicines_batch, methods=['PUT']),
+    Route('/add_treatment', add_treatment, methods=['POST']),
+    Route('/treatments', get_treatments, methods=['GET']),
+    Route('/medicine_history', get_medicine_history, methods=['GET']),
+    Route('/extract-text', extract_text, methods=['POST']),
+    Route('/metrics', metrics, methods=['GET']),
+]
+ROUTE_PATHS = {route.endpoint: route.path for route in routes}
+
+middleware = [
+    Middleware(MetricsMiddleware),
+    Middleware(BodyLimitMiddleware),
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+               expose_headers=['X-Next-Cursor', 'ETag']),
+]
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run("asgi_app:app", host="0.0.0.0", port=int(os.getenv("PORT", 5002)))
@@ -0,0 +1,169 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+
+from metrics import AUTH_REJECTED, BCRYPT_LATENCY
+from shared_sqlite import SharedSQLite, default_path
+
+# Same cost factor Flask-Bcrypt uses, so existing hashes keep working
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+# bcrypt releases the GIL, so threads hash in parallel. Leave cores for everything else.
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+# Hashes running plus waiting. Past this, requests are turned away instead of queued.
+AUTH_QUEUE_LIMIT = int(os.getenv("AUTH_QUEUE_LIMIT", AUTH_WORKERS * 4))
+AUTH_WAIT_SECONDS = float(os.getenv("AUTH_WAIT_SECONDS", 5))
+
+# Per-phone login attempts: a burst of LOGIN_BURST, refilled at LOGIN_PER_MINUTE.
+# The buckets live in LOGIN_LIMITER_DB, shared by every worker on the host, so these
+# are limits per host: behind a load balancer with N hosts a phone gets N times as many.
+LOGIN_BURST = int(os.getenv("LOGIN_BURST", 5))
+LOGIN_PER_MINUTE = float(os.getenv("LOGIN_PER_MINUTE", 5))
+LIMITER_MAX_KEYS = 100_000
+# gunicorn.conf.py points every worker at one file. Unset, the file belongs to this process.
+LOGIN_LIMITER_DB = default_path("LOGIN_LIMITER_DB", "login-limiter")
+
+
+class AuthOverloaded(Exception):
+    """Raised when the hashing pool is saturated. Maps to 503."""
+
+
+class RateLimited(Exception):
+    """Raised when a phone number has run out of login attempts. Maps to 429."""
+
+    def __init__(self, retry_after):
+        super().__init__("Too many login attempts, try again later")
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """In-memory token buckets keyed by an arbitrary string."""
+
+    def __init__(self, capacity, per_second, max_keys=LIMITER_MAX_KEYS):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, tokens, last, now):
+        return min(self.capacity, tokens + (now - last) * self.per_second)
+
+    def acquire(self, key):
+        """Take a token for key, or raise RateLimited with the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.capacity, now))
+            tokens = self._refill(tokens, last, now)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                raise RateLimited(retry_after=max(1, int((1 - tokens) / self.per_second + 0.999)))
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now):
+        """Drop buckets that have refilled completely, they are the same as no bucket. Caller holds the lock."""
+        self._buckets = {
+            key: (tokens, last) for key, (tokens, last) in self._buckets.items()
+            if self._refill(tokens, last, now) < self.capacity
+        }
+
+
+class SharedTokenBucketLimiter(TokenBucketLimiter):
+    """The same token buckets in a SQLite file, so all processes on the host spend from one bucket per key."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, last REAL);
+    CREATE INDEX IF NOT EXISTS buckets_last ON buckets (last);
+    """
+
+    def __init__(self, capacity, per_second, path=LOGIN_LIMITER_DB):
+        super().__init__(capacity, per_second)
+        self.path = path
+        self._db = SharedSQLite(path, self.SCHEMA)
+
+    def acquire(self, key):
+        """Take a token for key, or raise RateLimited with the seconds until one is available."""
+        # Wall clock, the processes sharing the file must agree on it
+        now = time.time()
+        # Read, refill and spend in one write transaction, so concurrent workers cannot both take the last token
+        with self._db.transaction() as conn:
+            row = conn.execute("SELECT tokens, last FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, last = row if row else (self.capacity, now)
+            tokens = self._refill(tokens, last, now)
+            allowed = tokens >= 1
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, last) VALUES (?, ?, ?)",
+                         (key, tokens - 1 if allowed else tokens, now))
+            # A bucket untouched for a full refill is the same as no bucket
+            conn.execute("DELETE FROM buckets WHERE last < ?", (now - self.capacity / self.per_second,))
+        if not allowed:
+            raise RateLimited(retry_after=max(1, int((1 - tokens) / self.per_second + 0.999)))
+
+
+login_limiter = SharedTokenBucketLimiter(LOGIN_BURST, LOGIN_PER_MINUTE / 60)
+
+_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(AUTH_QUEUE_LIMIT)
+
+
+def _hash(password):
+    with BCRYPT_LATENCY.time(operation='hash'):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    with BCRYPT_LATENCY.time(operation='check'):
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def _submit(func, *args):
+    if not _slots.acquire(blocking=False):
+        AUTH_REJECTED.inc(reason='overloaded')
+        logging.warning("Password hashing pool is saturated")
+        raise AuthOverloaded("Authentication is busy, try again shortly")
+    future = _executor.submit(func, *args)
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def submit_hash(password):
+    """Queue a bcrypt hash and return its Future. Raises AuthOverloaded when the queue is full."""
+    return _submit(_hash, password)
+
+
+def submit_check(password_hash, password):
+    """Queue a bcrypt check and return its Future. Raises AuthOverloaded when the queue is full."""
+    return _submit(_check, password_hash, password)
+
+
+def _wait(future):
+    try:
+        return future.result(timeout=AUTH_WAIT_SECONDS)
+    except FutureTimeoutError:
+        raise AuthOverloaded("Authentication is busy, try again shortly")
+
+
+def hash_password(password):
+    return _wait(submit_hash(password))
+
+
+def check_password(password_hash, password):
+    return _wait(submit_check(password_hash, password))
+
+
+def check_login_rate(phone):
+    """Spend one login attempt for phone. Raises RateLimited when none are left."""
+    try:
+        login_limiter.acquire(str(phone))
+    except RateLimited:
+        AUTH_REJECTED.inc(reason='rate_limited')
+        raise
+    except sqlite3.Error as e:
+        # Failing open: the limiter guards against guessing, it must not lock everyone out
+        logging.error(f"Login limiter unavailable: {e}")
+
@@ -0,0 +1,7 @@
+"""Benchmarks for the backend. Run them from the backend directory, e.g.
+
+    python -m benchmarks.engines path/to/images
+    python -m benchmarks.pipeline --count 40 --output results/before.json
+    python -m benchmarks.compare results/before.json results/after.json
+    python -m benchmarks.geometry --count 150 --seed 11
+"""
@@ -0,0 +1,197 @@
+"""Run load profiles against the Flask routes, in process, on mongomock or a local mongod.
+
+The app is driven through Flask's test client from a pool of threads, so no
+server, network or worker processes are involved. The numbers are what the
+route code, serialization and database calls cost. Users, tokens and a
+starting set of medicines are created first. Requests are then drawn from the
+profile's route mix with a seeded generator, so two runs send the same requests.
+
+    python -m benchmarks.api --profile read-heavy --requests 2000 --concurrency 8
+    python -m benchmarks.api --mongo mongodb://localhost:27017 --profile mixed,ocr --output results/api.json
+
+With a mongod, the run uses a throwaway database that is dropped at the end.
+Needs mongomock for the default --mongo, and Pillow for the ocr profile's corpus.
+"""
+import io
+import os
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.corpus import add_corpus_arguments, corpus_from_args
+from benchmarks.results import summarize, run_info, write_results
+
+# Route mixes, weights are relative
+PROFILES = {
+    'read-heavy': {'GET /medicines/active': 70, 'GET /treatments': 20, 'POST /medicines': 10},
+    'write-heavy': {'POST /medicines': 45, 'POST /medicines/bulk': 20, 'POST /add_treatment': 25,
+                    'GET /medicines/active': 10},
+    'mixed': {'GET /medicines/active': 40, 'GET /treatments': 15, 'POST /medicines': 15,
+              'POST /add_treatment': 10, 'POST /parse-medicines': 10, 'POST /extract-text': 5, 'POST /login': 5},
+    'ocr': {'POST /extract-text': 80, 'POST /parse-medicines': 20},
+    'auth': {'POST /login': 100},
+}
+BULK_SIZE = 20
+PASSWORD = 'benchmark-password'
+
+
+def medicine_payload(rng):
+    return {
+        'title': f'Medicine {rng.randrange(10_000)}',
+        'qty': rng.randint(1, 60),
+        'purchaseDate': '2024-01-15',
+        'expiryDate': f'20{rng.randint(25, 29)}-{rng.randint(1, 12):02d}-28',
+    }
+
+
+def treatment_payload(rng):
+    return {
+        'treatment_name': f'Treatment {rng.randrange(10_000)}',
+        'medicines': [{'medicine_name': 'Amoxicillin', 'dosage': '500 mg', 'frequency': '1-0-1'}],
+        'notes': 'After food',
+    }
+
+
+def build_request(route, rng, user, corpus):
+    """Arguments for test_client.open for one request to route."""
+    method, path = route.split(' ', 1)
+    request = {'method': method, 'path': path, 'headers': {'Authorization': f"Bearer {user['access_token']}"}}
+    if route == 'POST /medicines':
+        request['json'] = medicine_payload(rng)
+    elif route == 'POST /medicines/bulk':
+        request['json'] = {'medicines': [medicine_payload(rng) for _ in range(BULK_SIZE)]}
+    elif route == 'POST /add_treatment':
+        request['json'] = treatment_payload(rng)
+    elif route == 'POST /parse-medicines':
+        request['json'] = {'text': rng.choice(corpus)['text']}
+    elif route == 'POST /extract-text':
+        entry = rng.choice(corpus)
+        request['data'] = {'image': (io.BytesIO(entry['data']), entry['file'])}
+        request['content_type'] = 'multipart/form-data'
+    elif route == 'POST /login':
+        request['json'] = {'phone': user['phone'], 'password': PASSWORD}
+    return request
+
+
+def configure_environment(args):
+    """Settings the app reads at import time, so this runs before app is imported."""
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+    # No sweeper, index bootstrap or health probe threads competing with the load
+    os.environ['DEFER_BACKGROUND_WORK'] = '1'
+    # The login profile would otherwise spend its time on 429s
+    os.environ.setdefault('LOGIN_BURST', '1000000000')
+    os.environ['MONGO_DB_NAME'] = f'benchmark-{os.getpid()}'
+    if args.no_ocr_cache:
+        os.environ['OCR_CACHE_MAX_BYTES'] = '0'
+        os.environ.pop('OCR_CACHE_DIR', None)
+    if args.mongo == 'mongomock':
+        import mongomock
+        import db
+        os.environ['MONGO_URI'] = 'mongodb://localhost'
+        # Pool and timeout options do not apply to an in-memory database
+        db.MongoClient = lambda uri, **options: mongomock.MongoClient(uri)
+    else:
+        os.environ['MONGO_URI'] = args.mongo
+
+
+def create_users(client, count, seed_medicines, rng):
+    users = []
+    for number in range(count):
+        phone = f'9{os.getpid() % 1000:03d}{number:06d}'
+        client.post('/register', json={'name': f'Benchmark {number}', 'phone': phone, 'password': PASSWORD})
+        response = client.post('/login', json={'phone': phone, 'password': PASSWORD})
+        if response.status_code != 200:
+            raise RuntimeError(f"Login failed during setup: {response.status_code} {response.get_data(as_text=True)}")
+        user = dict(response.get_json(), phone=phone)
+        headers = {'Authorization': f"Bearer {user['access_token']}"}
+        for start in range(0, seed_medicines, BULK_SIZE):
+            batch = [medicine_payload(rng) for _ in range(min(BULK_SIZE, seed_medicines - start))]
+            client.post('/medicines/bulk', json={'medicines': batch}, headers=headers)
+        users.append(user)
+    return users
+
+
+def run_profile(app, name, users, corpus, args):
+    rng = random.Random(args.seed)
+    routes, weights = zip(*PROFILES[name].items())
+    plan = [(route, build_request(route, rng, rng.choice(users), corpus))
+            for route in rng.choices(routes, weights, k=args.requests)]
+    latencies, statuses = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    requests = iter(plan)
+
+    def client_loop():
+        client = app.test_client()
+        while True:
+            with lock:
+                item = next(requests, None)
+            if item is None:
+                return
+            route, request = item
+            request = dict(request)
+            method, path = request.pop('method'), request.pop('path')
+            start = time.perf_counter()
+            response = client.open(path, method=method, **request)
+            response.close()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies[route].append(elapsed)
+                statuses[route][str(response.status_code)] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [pool.submit(client_loop) for _ in range(args.concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'seconds': round(wall, 2),
+        'rps': round(args.requests / wall, 1),
+        'routes': {route: {'latency_ms': summarize(latencies[route]), 'statuses': dict(statuses[route])}
+                   for route in sorted(latencies)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_corpus_arguments(parser)
+    parser.add_argument('--profile', default='read-heavy', help=f"Comma separated, from {', '.join(PROFILES)}")
+    parser.add_argument('--mongo', default='mongomock', help="'mongomock', or the URI of a mongod to use")
+    parser.add_argument('--requests', type=int, default=1000, help="Requests per profile")
+    parser.add_argument('--concurrency', type=int, default=8, help="Client threads")
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--seed-medicines', type=int, default=100, help="Medicines per user before the run")
+    parser.add_argument('--no-ocr-cache', action='store_true', help="OCR every upload, even repeats")
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    profiles = args.profile.split(',')
+    unknown = [name for name in profiles if name not in PROFILES]
+    if unknown:
+        parser.error(f"Unknown profile: {', '.join(unknown)}")
+
+    configure_environment(args)
+    import app as flask_app
+
+    # Only the OCR and parsing routes need the corpus, and only building it needs Pillow
+    corpus_routes = ('POST /extract-text', 'POST /parse-medicines')
+    needs_corpus = any(route in PROFILES[name] for name in profiles for route in corpus_routes)
+    corpus = corpus_from_args(args) if needs_corpus else []
+    rng = random.Random(args.seed)
+    results = {'run': run_info(args), 'profiles': {}}
+    try:
+        users = create_users(flask_app.app.test_client(), args.users, args.seed_medicines, rng)
+        for name in profiles:
+            results['profiles'][name] = run_profile(flask_app.app, name, users, corpus, args)
+    finally:
+        flask_app.client.drop_database(flask_app.db.name)
+    write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Compare two JSON result files from the same benchmark, number by number.
+
+    python -m benchmarks.compare results/before.json results/after.json --threshold 5
+
+Prints every numeric field present in both files with the relative change.
+Fields that changed by less than --threshold percent are left out.
+"""
+import json
+import argparse
+
+# Run metadata differs on every run and says nothing about performance
+SKIPPED = ('run',)
+
+
+def flatten(value, path=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numbers only."""
+    if isinstance(value, bool):
+        return {}
+    if isinstance(value, (int, float)):
+        return {path: value}
+    items = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, list) else ()
+    flat = {}
+    for key, item in items:
+        if not path and key in SKIPPED:
+            continue
+        flat.update(flatten(item, f'{path}.{key}' if path else str(key)))
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=0, help="Hide changes smaller than this percentage")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = flatten(json.load(f))
+    with open(args.after) as f:
+        after = flatten(json.load(f))
+
+    rows = []
+    for path in sorted(before.keys() & after.keys()):
+        old, new = before[path], after[path]
+        change = (new - old) / abs(old) * 100 if old else (0.0 if new == old else float('inf'))
+        if abs(change) >= args.threshold:
+            rows.append((path, old, new, change))
+
+    width = max((len(row[0]) for row in rows), default=10)
+    for path, old, new, change in rows:
+        print(f"{path:<{width}}  {old:>12g}  {new:>12g}  {change:+8.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Generate a synthetic corpus of prescription-like images with known text.
+
+Each image is a rendered prescription: a header, a patient line and a few
+medicine lines built from the bundled drug dictionary. The rendering DPI,
+orientation, skew, blur and Gaussian noise vary per image. Everything is drawn from
+one seeded generator, so the same seed, font and Pillow version always give
+the same corpus. No network or external dataset is needed.
+
+    python -m benchmarks.corpus corpus/ --count 60 --seed 7
+    python -m benchmarks.corpus corpus-jpeg/ --format jpeg
+
+The directory gets one image per prescription plus manifest.json, which holds
+the ground truth text and the variant of each image.
+"""
+import io
+import os
+import json
+import random
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from medicine_parser import read_dictionary, DRUG_DICTIONARY_PATH
+
+MANIFEST = 'manifest.json'
+
+# Degradations, picked per image
+DPIS = (150, 200, 300)
+NOISE_SIGMAS = (0, 6, 15)  # Grey levels
+BLUR_RADII = (0, 0.7, 1.4)  # px at the rendered DPI
+ROTATIONS = (0, 0, 1.5, -2.5, 4)  # Degrees, straight pages are the common case
+ORIENTATIONS = (0, 0, 0, 0, 0, 90, 180, 270)  # Quarter turns counter-clockwise, for photos taken sideways
+
+# Page layout
+FONT_POINTS = 12
+LINE_SPACING = 1.6
+PAGE_WIDTH_INCHES = 6.5
+MARGIN_INCHES = 0.5
+INK = 30
+JPEG_QUALITY = 85  # About what a phone camera app writes
+FONT_CANDIDATES = ('DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'Arial.ttf')
+
+DOCTORS = ('A. Sharma', 'R. Menon', 'S. Iyer', 'K. Das', 'P. Nair', 'M. Rao')
+PATIENTS = ('Anita Verma', 'Rahul Gupta', 'Meera Pillai', 'John Mathew', 'Farah Khan', 'Vikram Singh')
+FORMS = ('Tab.', 'Cap.', 'Syr.', 'Inj.')
+DOSAGES = ('5 mg', '10 mg', '40 mg', '250 mg', '500 mg', '650 mg', '5 ml', '1 g')
+SCHEDULES = ('1-0-1', '1-1-1', '0-0-1', '1-0-0', 'twice daily', 'at bedtime', 'as needed')
+DURATIONS = ('3 days', '5 days', '7 days', '10 days', '1 month')
+
+
+def load_font(size, path=None):
+    """A TrueType font at size px, or Pillow's built-in font when none is installed."""
+    for candidate in ([path] if path else FONT_CANDIDATES):
+        try:
+            return ImageFont.truetype(candidate, size), os.path.basename(candidate)
+        except OSError:
+            continue
+    if path:
+        raise ValueError(f"Font not found: {path}")
+    try:
+        return ImageFont.load_default(size=size), 'pillow-default'
+    except TypeError:
+        # Pillow before 10.1 only has a fixed size bitmap font
+        return ImageFont.load_default(), 'pillow-bitmap'
+
+
+def prescription_lines(rng, drugs):
+    """Text lines of one prescription, and the medicine names on it."""
+    chosen = rng.sample(drugs, rng.randint(2, 5))
+    issued = date(2024, 1, 1) + timedelta(days=rng.randrange(365))
+    lines = [
+        f"Dr. {rng.choice(DOCTORS)}, MBBS",
+        f"Patient: {rng.choice(PATIENTS)}  Age: {rng.randint(18, 85)}",
+        f"Date: {issued:%d/%m/%Y}",
+        "Rx",
+    ]
+    for number, drug in enumerate(chosen, 1):
+        lines.append(f"{number}. {rng.choice(FORMS)} {drug} {rng.choice(DOSAGES)} "
+                     f"{rng.choice(SCHEDULES)} x {rng.choice(DURATIONS)}")
+    return lines, chosen
+
+
+def render(lines, dpi, font_path=None):
+    """Draw lines of dark text on a white greyscale page at the given DPI."""
+    size = round(FONT_POINTS * dpi / 72)
+    font, font_name = load_font(size, font_path)
+    line_height = round(size * LINE_SPACING)
+    margin = round(MARGIN_INCHES * dpi)
+    page = Image.new('L', (round(PAGE_WIDTH_INCHES * dpi), 2 * margin + line_height * len(lines)), 255)
+    draw = ImageDraw.Draw(page)
+    for row, line in enumerate(lines):
+        draw.text((margin, margin + row * line_height), line, fill=INK, font=font)
+    return page, font_name
+
+
+def degrade(page, orientation, rotation, blur, noise, seed):
+    """Turn, tilt, blur and add noise, in the order a sideways, soft, grainy photo gets them."""
+    if orientation:
+        # Quarter turns move pixels exactly, only the tilt resamples
+        page = page.transpose({90: Image.ROTATE_90, 180: Image.ROTATE_180, 270: Image.ROTATE_270}[orientation])
+    if rotation:
+        page = page.rotate(rotation, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if blur:
+        page = page.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = np.asarray(page, dtype=np.float32)
+        pixels += np.random.default_rng(seed).normal(0, noise, pixels.shape)
+        page = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return page
+
+
+def encode(page, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'jpeg':
+        page.save(buffer, format='JPEG', quality=JPEG_QUALITY)
+    else:
+        page.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def generate(count, seed=0, image_format='png', font_path=None):
+    """Build count images in memory. Returns a list of entries with the image bytes under 'data'."""
+    rng = random.Random(seed)
+    drugs = read_dictionary(DRUG_DICTIONARY_PATH)
+    extension = 'jpg' if image_format == 'jpeg' else 'png'
+    entries = []
+    for index in range(count):
+        lines, chosen = prescription_lines(rng, drugs)
+        variant = {
+            'dpi': rng.choice(DPIS),
+            'noise': rng.choice(NOISE_SIGMAS),
+            'blur': rng.choice(BLUR_RADII),
+            'rotation': rng.choice(ROTATIONS),
+            'orientation': rng.choice(ORIENTATIONS),
+        }
+        page, font_name = render(lines, variant['dpi'], font_path)
+        page = degrade(page, variant['orientation'], variant['rotation'], variant['blur'], variant['noise'],
+                       rng.randrange(2 ** 32))
+        entries.append(dict(
+            variant,
+            file=f'rx-{index:04d}.{extension}',
+            text='\n'.join(lines),
+            drugs=chosen,
+            font=font_name,
+            data=encode(page, image_format),
+        ))
+    return entries
+
+
+def write_corpus(directory, entries, seed):
+    os.makedirs(directory, exist_ok=True)
+    for entry in entries:
+        with open(os.path.join(directory, entry['file']), 'wb') as f:
+            f.write(entry['data'])
+    manifest = {'seed': seed, 'images': [{k: v for k, v in entry.items() if k != 'data'} for entry in entries]}
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_corpus(directory):
+    """Entries of a corpus written by write_corpus, with the image bytes under 'data'."""
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    entries = []
+    for entry in manifest['images']:
+        with open(os.path.join(directory, entry['file']), 'rb') as f:
+            entries.append(dict(entry, data=f.read()))
+    return entries
+
+
+def add_corpus_arguments(parser):
+    """The corpus options shared by the benchmarks that consume a corpus."""
+    parser.add_argument('--corpus', help="Directory written by benchmarks.corpus, default: generate in memory")
+    parser.add_argument('--count', type=int, default=30, help="Images to generate when --corpus is not given")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the generated corpus")
+
+
+def corpus_from_args(args):
+    return load_corpus(args.corpus) if args.corpus else generate(args.count, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', help="Where to write the images and manifest.json")
+    parser.add_argument('--count', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=('png', 'jpeg'), default='png')
+    parser.add_argument('--font', help="Path to a TrueType font, default: the first installed of "
+                                       + ', '.join(FONT_CANDIDATES))
+    args = parser.parse_args()
+
+    entries = generate(args.count, args.seed, args.format, args.font)
+    write_corpus(args.directory, entries, args.seed)
+    print(f"Wrote {len(entries)} images to {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compare the subprocess and tesserocr OCR engines on a fixed image corpus.
+
+Every image is decoded and preprocessed once up front, so the numbers only
+cover the engine itself. The first call per engine is reported separately
+because it includes loading the language model.
+
+    python -m benchmarks.engines path/to/images --repeat 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+from ocr import ENGINES, decode_image, resize_image, preprocess_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def load_corpus(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), 'rb') as f:
+                img = decode_image(f.read())
+            images.append((name, preprocess_image(resize_image(img))))
+    return images
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench_engine(engine, images, repeat):
+    start = time.perf_counter()
+    engine.warmup()
+    first_call_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(repeat):
+        for _, img in images:
+            start = time.perf_counter()
+            engine.recognize(img)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'engine': engine.name,
+        'images': len(images),
+        'repeat': repeat,
+        'warmup_ms': round(first_call_ms, 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'images_per_second': round(len(timings) / (sum(timings) / 1000), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', help="Directory of images to OCR")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the corpus per engine")
+    parser.add_argument('--engines', default=','.join(ENGINES), help="Comma separated engine names")
+    args = parser.parse_args()
+
+    images = load_corpus(args.corpus)
+    if not images:
+        sys.exit(f"No images found in {args.corpus}")
+
+    results = []
+    for name in args.engines.split(','):
+        try:
+            engine = ENGINES[name]()
+        except ImportError as e:
+            print(f"Skipping {name}: {e}", file=sys.stderr)
+            continue
+        results.append(bench_engine(engine, images, args.repeat))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
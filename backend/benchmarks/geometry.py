@@ -0,0 +1,86 @@
+"""Check the page geometry estimate against the corpus manifest, image by image.
+
+Every corpus image was turned by a known orientation and skew, so the
+rotation that uprights it is known. For each image this reports whether the
+text line estimate got it right, got it wrong while claiming to be sure (the
+case that matters: OSD is skipped and the page is OCRed sideways), or left
+it to OSD. With --osd the full estimate, OSD fallback included, is checked too.
+
+    python -m benchmarks.geometry --count 150 --seed 11
+    python -m benchmarks.geometry --corpus corpus/ --osd --output results/geometry.json
+
+Exits with status 1 when any image is wrong and trusted.
+"""
+import sys
+import argparse
+from collections import Counter
+
+from ocr import decode_image, decode_width, estimate_rotation, estimate_geometry, scale_image, GEOMETRY_SAMPLE_WIDTH
+from benchmarks.corpus import add_corpus_arguments, corpus_from_args
+from benchmarks.results import run_info, write_results
+
+# Degrees off the manifest that still count as right, about what MIN_SKEW and resampling leave
+TOLERANCE = 1.0
+
+
+def expected_rotation(entry):
+    """Counter-clockwise degrees that undo the corpus' quarter turn and skew, both counter-clockwise."""
+    return -(entry['orientation'] + entry['rotation'])
+
+
+def angle_error(got, expected):
+    return abs((got - expected + 180) % 360 - 180)
+
+
+def check_lines(gray, expected):
+    """'right', 'wrong' (trusted and off), 'unverified' (left to OSD) or 'none' for the line estimate."""
+    estimate = estimate_rotation(scale_image(gray, min(1.0, GEOMETRY_SAMPLE_WIDTH / gray.shape[1])))
+    if estimate is None:
+        return 'none', None
+    rotation, upright_known = estimate
+    if not upright_known:
+        return 'unverified', rotation
+    return ('right' if angle_error(rotation, expected) <= TOLERANCE else 'wrong'), rotation
+
+
+def check_corpus(entries, osd=False):
+    images = []
+    for entry in entries:
+        gray = decode_image(entry['data'], max_width=decode_width())
+        expected = expected_rotation(entry)
+        outcome, rotation = check_lines(gray, expected)
+        image = {'file': entry['file'], 'orientation': entry['orientation'], 'skew': entry['rotation'],
+                 'expected': expected, 'lines': outcome, 'lines_rotation': rotation}
+        if osd:
+            geometry = estimate_geometry(gray)
+            image.update(source=geometry['source'], rotation=geometry['rotation'],
+                         right=angle_error(geometry['rotation'], expected) <= TOLERANCE)
+        images.append(image)
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_corpus_arguments(parser)
+    parser.add_argument('--osd', action='store_true', help="Also check the full estimate, OSD fallback included")
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    images = check_corpus(corpus_from_args(args), args.osd)
+    wrong = [image for image in images if image['lines'] == 'wrong']
+    results = {
+        'run': run_info(args),
+        'images': len(images),
+        'lines': dict(Counter(image['lines'] for image in images)),
+        'wrong': wrong,
+    }
+    if args.osd:
+        results['sources'] = dict(Counter(image['source'] for image in images))
+        results['right'] = sum(image['right'] for image in images)
+    write_results(results, args.output)
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Closed-loop HTTP load test for comparing the Flask and ASGI backends.
+
+Each simulated client keeps one keep-alive connection and sends requests back
+to back. The client is a small asyncio HTTP/1.1 implementation, so thousands of
+concurrent clients cost one process and no extra dependencies.
+
+    python -m benchmarks.loadtest \\
+        --target flask=http://localhost:5002 --target asgi=http://localhost:8000 \\
+        --route "GET /medicines/active" --token "$ACCESS_TOKEN" \\
+        --concurrency 10,100,1000 --duration 15
+"""
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port, token=None):
+        self.host, self.port = host, port
+        self.token = token
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b''
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(payload)}\r\n"
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(head.encode() + b"\r\n" + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()  # Body runs until the server closes
+            self.close()
+
+        keep_alive = status_line.startswith(b'HTTP/1.1') or headers.get('connection', '').lower() == 'keep-alive'
+        if headers.get('connection', '').lower() == 'close' or not keep_alive:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def client_loop(url, method, path, body, deadline, latencies, errors, token=None):
+    parts = urlsplit(url)
+    connection = Connection(parts.hostname, parts.port or 80, token)
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status = await connection.request(method, path, body)
+            if status >= 500:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - start)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            await asyncio.sleep(0.05)
+    connection.close()
+
+
+async def run_load(url, method, path, body, concurrency, duration, token=None):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    started = time.monotonic()
+    await asyncio.gather(*(client_loop(url, method, path, body, deadline, latencies, errors, token)
+                           for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+
+
+def parse_route(route):
+    method, _, path = route.partition(' ')
+    return method.upper(), path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help="name=base_url, repeatable")
+    parser.add_argument('--route', action='append', required=True, help='"METHOD /path?query", repeatable')
+    parser.add_argument('--body', help="JSON body sent with every request")
+    parser.add_argument('--token', help="Access token from /login, sent as a Bearer token")
+    parser.add_argument('--concurrency', default='10,100', help="Comma separated client counts")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per run")
+    args = parser.parse_args()
+
+    body = json.loads(args.body) if args.body else None
+    results = []
+    for target in args.target:
+        name, _, url = target.partition('=')
+        for route in args.route:
+            method, path = parse_route(route)
+            for concurrency in (int(c) for c in args.concurrency.split(',')):
+                result = asyncio.run(run_load(url, method, path, body, concurrency, args.duration, args.token))
+                results.append(dict(result, target=name, route=route))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Time each OCR stage on the synthetic corpus and score the text against its ground truth.
+
+Every image goes through ocr_image_bytes, the same path the OCR routes and
+pool workers use, with each requested profile. Reported per profile:
+
+- stages_ms: time per stage (decode, resize, grayscale, threshold, denoise, tesseract, ...)
+- peak_memory_kib: Python and numpy allocations, measured by tracemalloc in a
+  separate pass so it does not slow the timed runs. Tesseract's own memory is not included.
+- cer: character error rate, the edit distance between the whitespace-normalized
+  OCR output and the ground truth, divided by the ground truth length
+- drug_recall: share of the prescribed medicine names that parse_medicines finds
+- cer_by_variant: mean CER for each DPI, noise, blur, skew and orientation setting
+- geometry_sources: how each page's orientation was settled: text lines, OSD, or neither
+- escalated: images the adaptive pipeline OCRed a second time at higher resolution
+
+    python -m benchmarks.pipeline --count 40 --seed 7 --profiles auto,fast,quality
+    python -m benchmarks.pipeline --corpus corpus/ --regions --output results/pipeline.json
+    python -m benchmarks.pipeline --resolution adaptive,fixed
+
+Set OCR_ENGINE to compare engines on the same corpus.
+"""
+import time
+import argparse
+import tracemalloc
+from collections import Counter, defaultdict
+
+from ocr import ocr_image_bytes, get_engine, TIMEOUT_TEXT, AUTO_PROFILE, PROFILES, RESOLUTIONS, OCR_RESOLUTION
+from medicine_parser import parse_medicines
+from benchmarks.corpus import add_corpus_arguments, corpus_from_args
+from benchmarks.results import summarize, run_info, write_results
+
+VARIANT_KEYS = ('dpi', 'noise', 'blur', 'rotation', 'orientation')
+
+
+def normalize_text(text):
+    return ' '.join(text.split())
+
+
+def edit_distance(a, b):
+    """Levenshtein distance, two rows at a time."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def character_error_rate(truth, text):
+    truth, text = normalize_text(truth), normalize_text(text)
+    return edit_distance(truth, text) / max(1, len(truth))
+
+
+def drug_recall(drugs, text):
+    found = {medicine['medicine_name'].lower() for medicine in parse_medicines(text)}
+    return sum(drug.lower() in found for drug in drugs) / len(drugs)
+
+
+def measure_memory(entries, options):
+    """Peak traced allocation per image, in KiB, above what was allocated before it."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for entry in entries:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            ocr_image_bytes(entry['data'], **options)
+            peaks.append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def bench_profile(entries, options, repeat, details):
+    stages = defaultdict(list)
+    totals, outputs = [], {}
+    for _ in range(repeat):
+        for entry in entries:
+            start = time.perf_counter()
+            result = ocr_image_bytes(entry['data'], **options)
+            totals.append((time.perf_counter() - start) * 1000)
+            for stage, ms in result.get('timings', {}).items():
+                stages[stage].append(ms)
+            # Output does not change between repeats, keep the last
+            outputs[entry['file']] = result
+
+    peaks = measure_memory(entries, options)
+
+    images, errors = [], defaultdict(lambda: defaultdict(list))
+    for entry, peak in zip(entries, peaks):
+        result = outputs[entry['file']]
+        cer = character_error_rate(entry['text'], result['extracted_text'])
+        for key in VARIANT_KEYS:
+            errors[key][str(entry[key])].append(cer)
+        images.append({
+            'file': entry['file'],
+            'profile': result.get('profile'),
+            'cer': round(cer, 4),
+            'drug_recall': round(drug_recall(entry['drugs'], result['extracted_text']), 4),
+            'peak_memory_kib': round(peak, 1),
+            'confidence': result.get('confidence'),
+            'passes': len(result.get('passes', [])) or 1,
+            'geometry': result.get('geometry', {}).get('source'),
+            'timeout': result['extracted_text'] == TIMEOUT_TEXT,
+        })
+
+    summary = {
+        'images': len(entries),
+        'repeat': repeat,
+        'images_per_second': round(len(totals) / (sum(totals) / 1000), 2),
+        'total_ms': summarize(totals),
+        'stages_ms': {stage: summarize(values) for stage, values in stages.items()},
+        'peak_memory_kib': summarize(peaks, 1),
+        'cer': summarize([image['cer'] for image in images], 4),
+        'drug_recall': round(sum(image['drug_recall'] for image in images) / len(images), 4),
+        'timeouts': sum(image['timeout'] for image in images),
+        'escalated': sum(image['passes'] > 1 for image in images),
+        'confidence': summarize([image['confidence'] for image in images if image['confidence'] is not None], 1),
+        # For auto, which profile the noise estimate picked how often
+        'profiles_used': dict(Counter(image['profile'] for image in images)),
+        'geometry_sources': dict(Counter(image['geometry'] for image in images)),
+        'cer_by_variant': {
+            key: {value: round(sum(cers) / len(cers), 4) for value, cers in sorted(values.items())}
+            for key, values in errors.items()
+        },
+    }
+    if details:
+        summary['images_detail'] = images
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_corpus_arguments(parser)
+    parser.add_argument('--profiles', default=AUTO_PROFILE,
+                        help=f"Comma separated, from {AUTO_PROFILE}, {', '.join(PROFILES)}")
+    parser.add_argument('--regions', action='store_true', help="OCR detected text regions only")
+    parser.add_argument('--resolution', default=OCR_RESOLUTION, help=f"Comma separated, from {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed passes over the corpus per profile")
+    parser.add_argument('--details', action='store_true', help="Include per-image results")
+    parser.add_argument('--output', help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    entries = corpus_from_args(args)
+    if not entries:
+        parser.error("The corpus is empty")
+
+    # Keep the engine's start-up cost out of the first image's time
+    get_engine().warmup()
+
+    results = {'run': run_info(args), 'engine': get_engine().name, 'profiles': {}}
+    for resolution in args.resolution.split(','):
+        for profile in args.profiles.split(','):
+            options = {'profile': profile, 'regions': args.regions, 'resolution': resolution}
+            results['profiles'][f'{profile}/{resolution}'] = bench_profile(entries, options, args.repeat, args.details)
+    write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Shared output for the benchmarks: summaries, run metadata and JSON files that can be diffed.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.engines import percentile
+
+
+def summarize(values, digits=2):
+    """mean, p50, p95 and max of a list of numbers, or None for an empty list."""
+    if not values:
+        return None
+    return {
+        'mean': round(sum(values) / len(values), digits),
+        'p50': round(percentile(values, 50), digits),
+        'p95': round(percentile(values, 95), digits),
+        'max': round(max(values), digits),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_info(args):
+    """Where and how a run was made, so two result files can be told apart."""
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'args': {key: value for key, value in vars(args).items() if key != 'token'},
+    }
+
+
+def write_results(results, output=None):
+    """Write results as JSON to output, or to stdout."""
+    encoded = json.dumps(results, indent=2, default=str)
+    if output:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            f.write(encoded + '\n')
+        print(f"Results written to {output}", file=sys.stderr)
+    else:
+        print(encoded)
@@ -0,0 +1,80 @@
+"""Compare the serialization module with the old patch-then-jsonify loop.
+
+Builds treatment-like documents with ObjectId and datetime fields, as they come
+back from PyMongo, and times both ways of turning a list of them into a response body.
+
+    python -m benchmarks.serialization --docs 1000 --repeat 50
+"""
+import copy
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from flask import Flask
+
+import serialization
+
+
+def make_documents(count):
+    start = datetime(2024, 1, 1, 8, 30)
+    return [{
+        '_id': ObjectId(),
+        'user_id': '65f0c0ffee0000000000beef',
+        'treatment_name': f'Treatment {i}',
+        'medicines': [
+            {'medicine_name': 'Amoxicillin', 'dosage': '500 mg', 'frequency': '1-0-1'},
+            {'medicine_name': 'Paracetamol', 'dosage': '650 mg', 'frequency': 'as needed'},
+        ],
+        'start_date': start + timedelta(days=i),
+        'end_date': start + timedelta(days=i + 7),
+        'notes': 'After food',
+        'added_on': start + timedelta(days=i, minutes=5),
+    } for i in range(count)]
+
+
+def patch_and_jsonify(documents, provider):
+    """What the read routes used to do: fix up each field by hand, then jsonify."""
+    for treatment in documents:
+        treatment['_id'] = str(treatment['_id'])
+        for field in ('start_date', 'end_date', 'added_on'):
+            if field in treatment and isinstance(treatment[field], datetime):
+                treatment[field] = treatment[field].isoformat()
+    return provider.dumps(documents).encode('utf-8')
+
+
+def bench(name, func, documents, repeat):
+    timings = []
+    for _ in range(repeat):
+        batch = copy.deepcopy(documents)  # The old path mutates its input
+        start = time.perf_counter()
+        func(batch)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        'encoder': name,
+        'docs': len(documents),
+        'best_ms': round(best * 1000, 3),
+        'docs_per_second': round(len(documents) / best),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs)
+    provider = Flask(__name__).json
+
+    results = [
+        bench('patch + jsonify', lambda docs: patch_and_jsonify(docs, provider), documents, args.repeat),
+        bench('serialization.dumps' + ('' if serialization.orjson else ' (json fallback)'),
+              serialization.dumps, documents, args.repeat),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Measure cold start: how long a fresh interpreter takes to import each app module.
+
+Every run is a new Python process, as with a freshly scheduled container, so
+nothing is warm except the OS page cache. Reports the median import time, the
+slowest imports from -X importtime, and whether the OCR stack (cv2, numpy,
+pytesseract) was actually executed or only deferred.
+
+    python -m benchmarks.startup --module app --module asgi_app --runs 5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('cv2', 'numpy', 'pytesseract', 'PIL.Image')
+
+# Runs in the child: import the module, then report the time and which heavy modules really ran
+CHILD = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+import json, types
+loaded = {{name: type(sys.modules[name]) is types.ModuleType for name in {heavy!r} if name in sys.modules}}
+print(json.dumps({{"import_ms": elapsed * 1000, "loaded": loaded}}))
+'''
+
+
+def child_env():
+    """Enough configuration for the apps to import, without starting background work."""
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'startup-benchmark')
+    env.setdefault('MONGO_URI', 'mongodb://127.0.0.1:27017')
+    env.setdefault('EXPIRY_SWEEPER', '0')
+    return env
+
+
+def parse_importtime(stderr, module, top):
+    """Slowest direct imports of module from -X importtime output, as (name, cumulative ms)."""
+    children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        # One leading space, then two more per nesting level. Children are listed before their parent.
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(cumulative) / 1000))
+        elif depth == 0:
+            if name.strip() == module:
+                return sorted(children, key=lambda row: row[1], reverse=True)[:top]
+            children = []
+    return []
+
+
+def measure(module, runs, top):
+    times, loaded, slowest = [], {}, []
+    for run in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True, timeout=120,
+        )
+        if result.returncode != 0:
+            errors = '\n'.join(line for line in result.stderr.splitlines() if not line.startswith('import time:'))
+            raise RuntimeError(f"Importing {module} failed:\n{errors[-2000:]}")
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(report['import_ms'])
+        loaded = report['loaded']
+        if run == 0:
+            slowest = parse_importtime(result.stderr, module, top)
+    return {
+        'module': module,
+        'runs': runs,
+        'median_ms': round(statistics.median(times), 1),
+        'min_ms': round(min(times), 1),
+        'max_ms': round(max(times), 1),
+        # True means the module ran at import, False means it is still deferred
+        'heavy_modules_executed': loaded,
+        'slowest_imports_ms': [{'module': name, 'ms': round(ms, 1)} for name, ms in slowest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append', help="Module to import, repeatable (default: ocr and app)")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="How many of the slowest imports to list")
+    args = parser.parse_args()
+
+    results = [measure(module, args.runs, args.top) for module in (args.module or ['ocr', 'app'])]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
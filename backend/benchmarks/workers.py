@@ -0,0 +1,105 @@
+"""Measure how throughput scales with the number of server workers.
+
+Starts serve.py once per worker count, waits for /healthz, drives every route
+with the closed-loop client from benchmarks.loadtest, then stops the server
+with SIGTERM so it drains like a real deploy. Prints JSON with rps and p99 for
+every (workers, route, concurrency) combination.
+
+    python -m benchmarks.workers --route "GET /medicines/active" --token "$ACCESS_TOKEN" \\
+        --workers 1,2,4,N --concurrency 50 --duration 15
+"""
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+
+from benchmarks.loadtest import run_load, parse_route
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 60
+
+
+def worker_counts(spec):
+    """'1,2,4,N' with N meaning one worker per core."""
+    counts = []
+    for part in spec.split(','):
+        count = (os.cpu_count() or 1) if part.strip().upper() == 'N' else int(part)
+        if count not in counts:
+            counts.append(count)
+    return counts
+
+
+def wait_until_up(url, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before it came up")
+        try:
+            with urllib.request.urlopen(url + '/healthz', timeout=1) as response:
+                if response.status == 200:
+                    return time.monotonic()
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not answer /healthz within {STARTUP_TIMEOUT}s")
+
+
+def start_server(workers, port, asgi):
+    command = [sys.executable, 'serve.py', '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    if asgi:
+        command.append('--asgi')
+    return subprocess.Popen(command, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(process):
+    """SIGTERM and wait, as an orchestrator would. Returns the seconds the drain took."""
+    started = time.monotonic()
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    return round(time.monotonic() - started, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--route', action='append', required=True, help='"METHOD /path?query", repeatable')
+    parser.add_argument('--workers', default='1,2,4,N', help="Comma separated worker counts, N = cores")
+    parser.add_argument('--concurrency', default='50', help="Comma separated client counts")
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per run")
+    parser.add_argument('--port', type=int, default=5090)
+    parser.add_argument('--body', help="JSON body sent with every request")
+    parser.add_argument('--token', help="Access token from /login, sent as a Bearer token")
+    parser.add_argument('--asgi', action='store_true', help="Benchmark asgi_app instead of the Flask app")
+    args = parser.parse_args()
+
+    body = json.loads(args.body) if args.body else None
+    url = f'http://127.0.0.1:{args.port}'
+    results = []
+    for workers in worker_counts(args.workers):
+        launched = time.monotonic()
+        process = start_server(workers, args.port, args.asgi)
+        try:
+            startup_seconds = round(wait_until_up(url, process) - launched, 2)
+            for route in args.route:
+                method, path = parse_route(route)
+                for concurrency in (int(c) for c in args.concurrency.split(',')):
+                    result = asyncio.run(run_load(url, method, path, body, concurrency, args.duration, args.token))
+                    results.append(dict(result, workers=workers, route=route, startup_seconds=startup_seconds))
+        finally:
+            drain_seconds = stop_server(process)
+        for result in results:
+            if result['workers'] == workers:
+                result['shutdown_seconds'] = drain_seconds
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
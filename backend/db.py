@@ -0,0 +1,84 @@
+"""MongoDB client settings shared by the Flask app, the ASGI app and scripts.
+
+Every pool setting comes from the environment, so each deployment can size it
+to its worker count without a code change:
+
+    MONGO_MAX_POOL_SIZE          connections per process (default 50)
+    MONGO_MIN_POOL_SIZE          connections kept open while idle (default 0)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS  how long a request waits for a free connection (default 2000)
+    MONGO_COMPRESSORS            e.g. "zstd,snappy,zlib", unset for none
+    MONGO_READ_PREFERENCE        e.g. "primaryPreferred" (default "primary")
+"""
+import os
+
+from pymongo import MongoClient, monitoring
+
+from metrics import MONGO_COMMAND_LATENCY
+
+DB_NAME = os.getenv("MONGO_DB_NAME", "medi-copilot")
+
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+# Fail fast with a 500 rather than queueing requests behind a saturated pool
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60_000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+# zstd and snappy need the zstandard and python-snappy packages, zlib is always available
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+MONGO_APP_NAME = os.getenv("MONGO_APP_NAME", "medi-copilot-backend")
+
+
+def mongo_uri():
+    uri = os.getenv("MONGO_URI")
+    if not uri:
+        raise ValueError("MONGO_URI is not set. Please set the environment variable.")
+    return uri
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Feeds the driver's own round-trip timing of every command into /metrics."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome='ok')
+
+    def failed(self, event):
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome='error')
+
+
+def client_options(**overrides):
+    """Keyword arguments for MongoClient or AsyncIOMotorClient, built from the environment."""
+    options = {
+        'event_listeners': [CommandTimer()],
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'readPreference': MONGO_READ_PREFERENCE,
+        'appname': MONGO_APP_NAME,
+    }
+    if MONGO_COMPRESSORS:
+        options['compressors'] = MONGO_COMPRESSORS
+    options.update(overrides)
+    return options
+
+
+def create_client(uri=None, **overrides):
+    """A MongoClient with the configured pool.
+
+    It connects on first use, so a preloaded app can fork its workers before
+    any socket or monitor thread exists.
+    """
+    return MongoClient(uri or mongo_uri(), **client_options(**{'connect': False, **overrides}))
+
+
+def create_async_client(uri=None, **overrides):
+    """Motor twin of create_client, for the ASGI app."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(uri or mongo_uri(), **client_options(**{'connect': False, **overrides}))
@@ -0,0 +1,122 @@
+"""Index declarations for every collection the routes query, plus plan verification.
+
+Run directly to apply the indexes and check that each hot query is served by an
+index scan:
+
+    python db_indexes.py
+
+tests/test_db_indexes.py runs the same checks against a local mongod (MONGO_TEST_URI).
+"""
+import sys
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# Indexes each route needs, by collection
+INDEXES = {
+    'users': [
+        # login/register look users up by phone, unique also stops duplicate registrations
+        IndexModel([('phone', ASCENDING)], name='phone_unique', unique=True),
+    ],
+    # Read routes page through a user's documents in _id order, so _id closes each index
+    'medicines': [
+        # get_active_medicines
+        IndexModel([('user_id', ASCENDING), ('medicineActive', ASCENDING), ('_id', ASCENDING)],
+                   name='user_active_id'),
+        # expiry sweeper, only active medicines are ever looked up by expiresAt
+        IndexModel([('expiresAt', ASCENDING)], name='active_expires_at',
+                   partialFilterExpression={'medicineActive': True}),
+        # repair_history looks up recently expired medicines by their expire tag
+        IndexModel([('expiredBy', ASCENDING)], name='expired_by', sparse=True),
+    ],
+    'treatments': [
+        # get_treatments
+        IndexModel([('user_id', ASCENDING), ('_id', ASCENDING)], name='user_id'),
+    ],
+    'medicines_history': [
+        # get_medicine_history
+        IndexModel([('user_id', ASCENDING), ('_id', ASCENDING)], name='user_id'),
+    ],
+}
+
+# Representative filters and sorts of the hot queries, each must be answered by an IXSCAN
+HOT_QUERIES = [
+    ('users', {'phone': '0000000000'}, None),
+    ('medicines', {'user_id': '000000000000000000000000', 'medicineActive': True}, '_id'),
+    ('medicines', {'medicineActive': True, 'expiresAt': {'$lte': datetime(2000, 1, 1)}}, 'expiresAt'),
+    ('treatments', {'user_id': '000000000000000000000000'}, '_id'),
+    ('medicines_history', {'user_id': '000000000000000000000000'}, '_id'),
+]
+
+
+def ensure_indexes(db):
+    """Create any missing indexes. Safe to call on every startup, existing indexes are left alone."""
+    created = []
+    for collection, models in INDEXES.items():
+        try:
+            created += db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. existing duplicate phone numbers block the unique index
+            logging.error(f"Could not create indexes on {collection}: {e}")
+    logging.info(f"Indexes ensured: {created}")
+    return created
+
+
+async def ensure_indexes_async(db):
+    """ensure_indexes for a Motor database."""
+    created = []
+    for collection, models in INDEXES.items():
+        try:
+            created += await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            logging.error(f"Could not create indexes on {collection}: {e}")
+    logging.info(f"Indexes ensured: {created}")
+    return created
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from plan_stages(child)
+
+
+def verify_query_plans(db):
+    """Explain each hot query and report whether its winning plan uses an index scan."""
+    results = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort, ASCENDING)
+        stages = list(plan_stages(cursor.explain()['queryPlanner']['winningPlan']))
+        results.append({
+            'collection': collection,
+            'query': sorted(query),
+            'stages': stages,
+            # A blocking SORT stage would mean reading the whole result set before the first page
+            'ok': 'IXSCAN' in stages and 'COLLSCAN' not in stages and 'SORT' not in stages,
+        })
+    return results
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from db import create_client, DB_NAME
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    db = create_client()[DB_NAME]
+    ensure_indexes(db)
+
+    failed = False
+    for result in verify_query_plans(db):
+        status = 'ok' if result['ok'] else 'NOT INDEXED'
+        print(f"{status:12} {result['collection']} {result['query']}: {' <- '.join(result['stages'])}")
+        failed = failed or not result['ok']
+    sys.exit(1 if failed else 0)
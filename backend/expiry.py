@@ -0,0 +1,121 @@
+"""Moving medicines from the active list to medicines_history.
+
+Each transition costs two round trips, however many medicines it covers. The
+first flips medicineActive and tags the matched documents with a fresh
+ObjectId. Only one caller can flip a given medicine, so two concurrent
+requests never both copy it. The second copies the tagged documents into
+history server side with $merge, keyed on _id, so repeating it is harmless.
+History rows are the documents as they were while active, medicineActive
+still true, the same shape the routes have always written there.
+If a process dies between the two steps, repair_history finds the tagged
+documents that never reached history.
+"""
+from datetime import datetime, timedelta, timezone
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+EXPIRE_TAG = 'expiredBy'
+
+
+def _merge_pipeline(match, history_name):
+    return [
+        {'$match': match},
+        # Undo the flip and the tag in the copy, history holds the documents as they were while active
+        {'$set': {'medicineActive': True}},
+        {'$unset': EXPIRE_TAG},
+        {'$merge': {'into': history_name, 'on': '_id', 'whenMatched': 'keepExisting', 'whenNotMatched': 'insert'}},
+    ]
+
+
+def _active_medicine(medicine_id, user_id=None):
+    query = {'_id': medicine_id, 'medicineActive': True}
+    if user_id:
+        query['user_id'] = user_id
+    return query
+
+
+def expire_one(medicines, medicines_history, medicine_id, user_id=None):
+    """Expire one active medicine, of user_id if given.
+
+    Returns the document as it was before expiring, which is what goes into history, or None if it was not active.
+    """
+    tag = ObjectId()
+    medicine = medicines.find_one_and_update(
+        _active_medicine(medicine_id, user_id),
+        {'$set': {'medicineActive': False, EXPIRE_TAG: tag}},
+        projection={EXPIRE_TAG: 0},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if medicine:
+        # We already hold the pre-update document, so write it directly instead of a $merge
+        medicines_history.replace_one({'_id': medicine['_id']}, medicine, upsert=True)
+    return medicine
+
+
+def merge_tagged(medicines, medicines_history, tag):
+    """Copy the medicines expired under tag into history."""
+    medicines.aggregate(_merge_pipeline({EXPIRE_TAG: tag}, medicines_history.name))
+
+
+def expire_many(medicines, medicines_history, query, tag=None):
+    """Expire every active medicine matching query. Returns how many were expired.
+
+    Pass tag to know it before the update runs, e.g. to checkpoint it first.
+    """
+    tag = tag or ObjectId()
+    result = medicines.update_many(
+        dict(query, medicineActive=True),
+        {'$set': {'medicineActive': False, EXPIRE_TAG: tag}},
+    )
+    if result.modified_count:
+        merge_tagged(medicines, medicines_history, tag)
+    return result.modified_count
+
+
+async def expire_one_async(medicines, medicines_history, medicine_id, user_id=None):
+    """expire_one for Motor collections."""
+    tag = ObjectId()
+    medicine = await medicines.find_one_and_update(
+        _active_medicine(medicine_id, user_id),
+        {'$set': {'medicineActive': False, EXPIRE_TAG: tag}},
+        projection={EXPIRE_TAG: 0},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if medicine:
+        await medicines_history.replace_one({'_id': medicine['_id']}, medicine, upsert=True)
+    return medicine
+
+
+async def expire_many_async(medicines, medicines_history, query):
+    """expire_many for Motor collections."""
+    tag = ObjectId()
+    result = await medicines.update_many(
+        dict(query, medicineActive=True),
+        {'$set': {'medicineActive': False, EXPIRE_TAG: tag}},
+    )
+    if result.modified_count:
+        # Motor cursors are lazy, the $merge only runs once the cursor is read
+        await medicines.aggregate(_merge_pipeline({EXPIRE_TAG: tag}, medicines_history.name)).to_list(None)
+    return result.modified_count
+
+
+def expires_at(expiry_date):
+    """The moment a medicine with this expiryDate (YYYY-MM-DD) expires: the end of that day, UTC."""
+    day = datetime.strptime(expiry_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    return day + timedelta(days=1)
+
+
+def expired_query(user_id=None, now=None):
+    """Active medicines whose expiresAt has passed."""
+    query = {'expiresAt': {'$lte': now or datetime.now(timezone.utc)}}
+    if user_id:
+        query['user_id'] = user_id
+    return query
+
+
+def repair_history(medicines, medicines_history, window=timedelta(hours=1)):
+    """Copy medicines expired within window that never reached history, e.g. after a crash."""
+    since = ObjectId.from_datetime(datetime.now(timezone.utc) - window)
+    medicines.aggregate(_merge_pipeline(
+        {'medicineActive': False, EXPIRE_TAG: {'$gte': since}}, medicines_history.name
+    ))
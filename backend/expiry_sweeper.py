@@ -0,0 +1,161 @@
+"""Background job that moves medicines past their expiresAt into medicines_history.
+
+Every replica starts a sweeper, but each run first takes a lease document in
+the sweeper_state collection, so only one replica sweeps at a time. Work is
+done in bounded batches. Before a batch is flipped its tag is written to the
+lease document, so a run that dies halfway is finished by the next one.
+"""
+import os
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from expiry import expire_many, merge_tagged, repair_history
+from response_cache import response_cache
+
+SWEEP_INTERVAL_SECONDS = float(os.getenv("EXPIRY_SWEEP_SECONDS", 300))
+SWEEP_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", 500))
+# Batches per run, whatever is left waits for the next run
+SWEEP_MAX_BATCHES = int(os.getenv("EXPIRY_MAX_BATCHES", 20))
+LEASE_SECONDS = float(os.getenv("EXPIRY_LEASE_SECONDS", 60))
+# Medicines stored before expiresAt existed are backfilled this many at a time
+BACKFILL_BATCH_SIZE = 1000
+
+LEASE_ID = 'medicine-expiry'
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+class ExpirySweeper:
+    def __init__(self, db, interval=SWEEP_INTERVAL_SECONDS, batch_size=SWEEP_BATCH_SIZE,
+                 max_batches=SWEEP_MAX_BATCHES, lease_seconds=LEASE_SECONDS):
+        self.medicines = db.medicines
+        self.medicines_history = db.medicines_history
+        self.state = db.sweeper_state
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.lease = timedelta(seconds=lease_seconds)
+        self.owner = f"{os.uname().nodename}:{os.getpid()}:{ObjectId()}"
+        self._backfilled = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        """Take or renew the lease. Returns the lease document, or None if another replica holds it."""
+        now = utcnow()
+        try:
+            return self.state.find_one_and_update(
+                {'_id': LEASE_ID, '$or': [{'leaseUntil': {'$lte': now}}, {'owner': self.owner}]},
+                {'$set': {'owner': self.owner, 'leaseUntil': now + self.lease}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease exists and is someone else's, so the upsert tried to insert a second one
+            return None
+
+    def checkpoint(self, **fields):
+        """Save progress and extend the lease. Returns False if the lease was lost."""
+        result = self.state.update_one(
+            {'_id': LEASE_ID, 'owner': self.owner},
+            {'$set': dict(fields, leaseUntil=utcnow() + self.lease)},
+        )
+        return result.matched_count == 1
+
+    def release(self):
+        self.state.update_one({'_id': LEASE_ID, 'owner': self.owner}, {'$set': {'leaseUntil': utcnow()}})
+
+    def backfill(self):
+        """Set expiresAt on active medicines that only have the expiryDate string."""
+        filled = 0
+        while True:
+            ids = [doc['_id'] for doc in self.medicines.find(
+                {'medicineActive': True, 'expiresAt': {'$exists': False}}, {'_id': 1}
+            ).limit(BACKFILL_BATCH_SIZE)]
+            if not ids:
+                break
+            # Unparseable dates end up as null, which the sweep query never matches
+            self.medicines.update_many({'_id': {'$in': ids}}, [{'$set': {'expiresAt': {'$add': [
+                {'$dateFromString': {'dateString': '$expiryDate', 'format': '%Y-%m-%d',
+                                     'onError': None, 'onNull': None}},
+                DAY_MS,
+            ]}}}])
+            filled += len(ids)
+        if filled:
+            logging.info(f"Backfilled expiresAt on {filled} medicines")
+        self._backfilled = True
+
+    def sweep(self, now=None):
+        """Expire everything past its expiresAt, up to max_batches batches. Returns how many were expired."""
+        now = now or utcnow()
+        state = self.acquire()
+        if state is None:
+            return 0
+
+        if state.get('pendingTag'):
+            # The last run stopped between flipping a batch and copying it to history
+            merge_tagged(self.medicines, self.medicines_history, state['pendingTag'])
+            self.checkpoint(pendingTag=None)
+        repair_history(self.medicines, self.medicines_history)
+        if not self._backfilled:
+            self.backfill()
+
+        expired = 0
+        for _ in range(self.max_batches):
+            batch = list(self.medicines.find(
+                {'medicineActive': True, 'expiresAt': {'$lte': now}}, {'expiresAt': 1, 'user_id': 1}
+            ).sort('expiresAt', ASCENDING).limit(self.batch_size))
+            if not batch:
+                break
+            tag = ObjectId()
+            if not self.checkpoint(pendingTag=tag):
+                logging.warning("Expiry sweeper lost its lease, stopping this run")
+                break
+            expired += expire_many(
+                self.medicines, self.medicines_history, {'_id': {'$in': [doc['_id'] for doc in batch]}}, tag=tag
+            )
+            response_cache.invalidate('medicines', *(doc.get('user_id') for doc in batch))
+            if not self.checkpoint(pendingTag=None, expiredThrough=batch[-1]['expiresAt']):
+                break
+
+        self.checkpoint(lastRunAt=now, lastExpired=expired)
+        if expired:
+            logging.info(f"Expiry sweeper moved {expired} medicines to history")
+        return expired
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Expiry sweep failed: {e}", exc_info=True)
+            if self._stop.wait(self.interval):
+                break
+        try:
+            self.release()
+        except Exception:
+            pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="expiry-sweeper", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+def start_sweeper(db):
+    """Start the background sweeper unless EXPIRY_SWEEPER is turned off. Returns it, or None."""
+    if os.getenv("EXPIRY_SWEEPER", "1").lower() in ('0', 'false', 'no'):
+        return None
+    return ExpirySweeper(db).start()
@@ -0,0 +1,85 @@
+"""Gunicorn settings for production. Start the server with serve.py, or directly:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master and the workers are forked from it, so
+the OCR stack and the drug index code are shared copy-on-write. Anything that
+owns a thread or a socket is started per worker in post_fork.
+
+State that must agree between workers lives in SQLite files that all workers on
+the host open (see shared_sqlite.py): the OCR job queue (OCR_JOB_DB), response
+cache generations (RESPONSE_CACHE_DB) and login attempt buckets (LOGIN_LIMITER_DB).
+They are set below to a fresh directory per server unless given. Caches that only save work,
+OCR results and response bodies, stay per worker. Running on more than one
+host needs RESPONSE_CACHE_URL, and the job queue and login limits remain per host.
+"""
+import os
+import sys
+import logging
+import tempfile
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', 5002)}")
+# OCR runs in its own process pool, so one web worker per core is enough to keep the cores busy
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = os.getenv("WORKER_CLASS", "gthread")
+# Requests mostly wait on Mongo, bcrypt or the OCR pool, threads cover that waiting
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+
+# An OCR request can take the Tesseract timeout plus decode and queueing
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+# On SIGTERM workers stop accepting and finish in-flight requests for up to this long
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Recycle workers now and then to bound slow leaks, 0 turns it off
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# Read by app.py at import: the master must not start threads, they would not survive the fork
+os.environ.setdefault("DEFER_BACKGROUND_WORK", "1")
+# Split the cores between the workers' OCR pools instead of each worker claiming all of them
+os.environ.setdefault("OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+# Workers write metric snapshots here, so /metrics on any worker reports all of them
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="medi-copilot-metrics-"))
+# Response cache generations, so a write through one worker invalidates every worker's cached pages
+os.environ.setdefault("RESPONSE_CACHE_DB", os.path.join(tempfile.mkdtemp(prefix="medi-copilot-cache-"), "generations.db"))
+# Login attempt buckets, so the per-phone limit is not multiplied by the worker count
+os.environ.setdefault("LOGIN_LIMITER_DB", os.path.join(tempfile.mkdtemp(prefix="medi-copilot-auth-"), "login-limiter.db"))
+# One OCR job queue for all workers, so a job can be polled through any of them
+os.environ.setdefault("OCR_JOB_DB", os.path.join(tempfile.mkdtemp(prefix="medi-copilot-jobs-"), "ocr-jobs.db"))
+
+
+def on_starting(server):
+    # Runs after the app is preloaded: pull in the lazily imported OCR modules so workers inherit them
+    from ocr import load_ocr_modules
+    load_ocr_modules()
+
+
+def post_fork(server, worker):
+    # Pool processes load the OCR model in their initializer. The request threads that
+    # OCR inline load theirs on first use: tesserocr keeps one API per thread, so warming
+    # up this main thread, which never serves a request, would only waste the memory.
+    from ocr_pool import warmup
+    try:
+        warmup()
+    except Exception as e:
+        # OCR requests will report the problem, the rest of the app still works
+        logging.error(f"OCR pool warmup failed in worker {worker.pid}: {e}")
+
+    # The ASGI app starts and stops its background work in its lifespan handler
+    flask_app = sys.modules.get('app')
+    if flask_app is not None and hasattr(flask_app, 'start_background_work'):
+        flask_app.start_background_work()
+
+
+def worker_exit(server, worker):
+    # In-flight requests have drained by now, stop what the worker started
+    flask_app = sys.modules.get('app')
+    if flask_app is not None and hasattr(flask_app, 'stop_background_work'):
+        flask_app.stop_background_work()
+    from ocr_pool import shutdown
+    shutdown()
+    # Keep the exiting worker's counts in the totals
+    from metrics import registry
+    if registry.directory:
+        registry.flush()
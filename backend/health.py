@@ -0,0 +1,84 @@
+"""Liveness and readiness probes that answer from cached results.
+
+A background thread runs every check each HEALTH_PROBE_INTERVAL seconds and
+keeps the outcome. /healthz and /readyz only read that outcome, so an
+orchestrator polling every second costs the database one ping per interval
+per process, not one per poll.
+"""
+import os
+import time
+import logging
+import threading
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", 5))
+# A result older than this counts as failing, e.g. when the probe thread is stuck on a hung call
+HEALTH_PROBE_MAX_AGE = float(os.getenv("HEALTH_PROBE_MAX_AGE", HEALTH_PROBE_INTERVAL * 3))
+
+
+def mongo_check(client):
+    """Check that pings the admin database of a blocking MongoClient."""
+    def check():
+        client.admin.command('ping')
+    return check
+
+
+class HealthProbe:
+    def __init__(self, checks, interval=HEALTH_PROBE_INTERVAL, max_age=HEALTH_PROBE_MAX_AGE):
+        self.checks = dict(checks)
+        self.interval = interval
+        self.max_age = max_age
+        self.started_at = time.time()
+        self._results = {}  # name -> {'ok', 'error', 'latency_ms', 'checked_at'}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_checks(self):
+        for name, check in self.checks.items():
+            start = time.perf_counter()
+            try:
+                check()
+                result = {'ok': True, 'error': None}
+            except Exception as e:
+                result = {'ok': False, 'error': str(e)}
+            result['latency_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            result['checked_at'] = time.time()
+            with self._lock:
+                previous = self._results.get(name)
+                self._results[name] = result
+            if previous and previous['ok'] != result['ok']:
+                log = logging.info if result['ok'] else logging.warning
+                log(f"Health check {name} is now {'passing' if result['ok'] else 'failing'}: {result['error']}")
+
+    def _run(self):
+        while True:
+            self.run_checks()
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="health-probe", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def liveness(self):
+        """The process is up and serving. Never touches a dependency."""
+        return {'status': 'ok', 'uptime_seconds': round(time.time() - self.started_at, 1)}
+
+    def readiness(self):
+        """Cached check results. Returns (ready, body)."""
+        now = time.time()
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+        ready = bool(self.checks)
+        for name in self.checks:
+            result = results.setdefault(name, {'ok': False, 'error': 'Not checked yet'})
+            if result['ok'] and now - result['checked_at'] > self.max_age:
+                result.update(ok=False, error='Result is stale')
+            if 'checked_at' in result:
+                result['age_seconds'] = round(now - result.pop('checked_at'), 1)
+            ready = ready and result['ok']
+        return ready, {'status': 'ready' if ready else 'unavailable', 'checks': results}
@@ -0,0 +1,22 @@
+"""Deferred imports for heavy modules, so a process starts serving before it needs them."""
+import sys
+import importlib.util
+
+
+def lazy_import(name):
+    """Return module name, executed on its first attribute access instead of now.
+
+    Already imported modules are returned as they are. A missing module still
+    raises ModuleNotFoundError here, at import time.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
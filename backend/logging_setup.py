@@ -0,0 +1,89 @@
+"""Logging that stays off the request path.
+
+Request threads only put records on a bounded queue, and one background thread
+writes them out. When the queue is full, records are dropped and counted in
+/metrics instead of blocking the request. Under load, LOG_SAMPLE_RATE keeps
+only a share of the records below WARNING.
+
+    LOG_LEVEL        default INFO
+    LOG_FILE         default server.log, "-" for stderr
+    LOG_SAMPLE_RATE  share of DEBUG and INFO records kept, default 1
+"""
+import os
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import LOG_RECORDS_DROPPED
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "server.log")
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+LOG_FORMAT = "%(asctime)s - %(process)d - %(levelname)s - %(message)s"
+
+
+class SampleFilter(logging.Filter):
+    """Keep every WARNING and above, and a random share of the rest."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+_queue_handler = None
+_output_handler = None
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    # A fresh queue: a forked child cannot trust the parent's, its lock may have been held mid-fork
+    _queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    _listener = QueueListener(_queue_handler.queue, _output_handler)
+    _listener.start()
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        # Writes out whatever is still queued
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging():
+    """Route the root logger through the queue. Safe to call more than once."""
+    global _queue_handler, _output_handler
+    if _queue_handler is not None:
+        return
+
+    _output_handler = logging.StreamHandler() if LOG_FILE == '-' else logging.FileHandler(LOG_FILE)
+    _output_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    if LOG_SAMPLE_RATE < 1:
+        _queue_handler.addFilter(SampleFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _start_listener()
+    atexit.register(_stop_listener)
+    # The listener thread does not survive a fork, so each server worker and OCR process starts its own
+    os.register_at_fork(after_in_child=_start_listener)
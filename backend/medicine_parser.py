@@ -0,0 +1,223 @@
+import os
+import re
+import pickle
+import logging
+import threading
+
+# Bundled dictionary of medicine names, one per line
+DRUG_DICTIONARY_PATH = os.getenv(
+    "DRUG_DICTIONARY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "drugs.txt")
+)
+# Prebuilt index, rebuilt whenever the dictionary file changes
+DRUG_INDEX_PATH = os.getenv("DRUG_INDEX_PATH", DRUG_DICTIONARY_PATH + ".index")
+
+MAX_EDIT_DISTANCE = 2
+# Only the first few characters are used for deletes (the SymSpell prefix trick),
+# which keeps the index small with 100k+ names at no cost to recall
+PREFIX_LENGTH = 7
+MIN_TOKEN_LENGTH = 3
+
+TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9\-]*")
+DOSAGE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(mg|mcg|µg|ug|g|ml|iu|units?|%)(?![a-z])", re.IGNORECASE)
+# Frequencies written as morning-noon-night doses, e.g. 1-0-1
+DOSE_SCHEDULE_RE = re.compile(r"\b([0-3](?:\.5)?)\s*-\s*([0-3](?:\.5)?)\s*-\s*([0-3](?:\.5)?)\b")
+FREQUENCY_PATTERNS = [
+    (re.compile(r"\b(od|qd|once\s+(a|per)?\s*day|once\s+daily)\b", re.IGNORECASE), "once daily"),
+    (re.compile(r"\b(bd|bid|twice\s+(a|per)?\s*day|twice\s+daily)\b", re.IGNORECASE), "twice daily"),
+    (re.compile(r"\b(tds|tid|thrice\s+(a|per)?\s*day|thrice\s+daily|three\s+times\s+(a|per)?\s*day)\b", re.IGNORECASE), "three times daily"),
+    (re.compile(r"\b(qid|qds|four\s+times\s+(a|per)?\s*day)\b", re.IGNORECASE), "four times daily"),
+    (re.compile(r"\b(hs|at\s+bed\s*time|at\s+night)\b", re.IGNORECASE), "at bedtime"),
+    (re.compile(r"\b(sos|prn|as\s+needed|when\s+required)\b", re.IGNORECASE), "as needed"),
+    (re.compile(r"\bstat\b", re.IGNORECASE), "immediately"),
+    (re.compile(r"\bevery\s+(\d+)\s*(hours|hrs|h)\b", re.IGNORECASE), "every {0} hours"),
+    (re.compile(r"\bq(\d+)h\b", re.IGNORECASE), "every {0} hours"),
+]
+
+
+def normalize(name):
+    return ' '.join(name.lower().split())
+
+
+def max_distance_for(term):
+    """Short tokens get less slack, otherwise everyday words match drug names."""
+    if len(term) <= 4:
+        return 0
+    if len(term) <= 7:
+        return 1
+    return MAX_EDIT_DISTANCE
+
+
+def deletes(term, max_distance):
+    """Every string reachable from the term's prefix by deleting up to max_distance characters."""
+    results = {term[:PREFIX_LENGTH]}
+    frontier = set(results)
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        results |= frontier
+    return results
+
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class DrugIndex:
+    """SymSpell-style index over medicine names for fast fuzzy lookup."""
+
+    def __init__(self, names):
+        self.names = {}  # normalized -> display name
+        self.deletes = {}  # delete string -> tuple of normalized names
+        buckets = {}
+        for name in names:
+            term = normalize(name)
+            if term in self.names:
+                continue
+            self.names[term] = name
+            for delete in deletes(term, MAX_EDIT_DISTANCE):
+                buckets.setdefault(delete, []).append(term)
+        self.deletes = {delete: tuple(terms) for delete, terms in buckets.items()}
+        self.max_words = max((term.count(' ') + 1 for term in self.names), default=1)
+
+    def lookup(self, token):
+        """Return (display name, distance) of the closest medicine, or None."""
+        term = normalize(token)
+        if term in self.names:
+            return self.names[term], 0
+        max_distance = max_distance_for(term)
+        if max_distance == 0:
+            return None
+
+        best = None
+        seen = set()
+        for delete in deletes(term, max_distance):
+            for candidate in self.deletes.get(delete, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(term, candidate, max_distance)
+                if distance > max_distance:
+                    continue
+                rank = (distance, abs(len(candidate) - len(term)), candidate)
+                if best is None or rank < best[0]:
+                    best = (rank, candidate)
+        if best is None:
+            return None
+        return self.names[best[1]], best[0][0]
+
+
+def read_dictionary(path):
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def load_index(dictionary_path=DRUG_DICTIONARY_PATH, index_path=DRUG_INDEX_PATH):
+    """Load the prebuilt index if it matches the dictionary, otherwise build and save it."""
+    source = os.stat(dictionary_path)
+    signature = (source.st_size, source.st_mtime_ns, MAX_EDIT_DISTANCE, PREFIX_LENGTH)
+    try:
+        with open(index_path, 'rb') as f:
+            stored_signature, index = pickle.load(f)
+        if stored_signature == signature:
+            return index
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+
+    index = DrugIndex(read_dictionary(dictionary_path))
+    logging.info(f"Built drug index with {len(index.names)} names from {dictionary_path}")
+    try:
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((signature, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logging.warning(f"Could not save drug index to {index_path}: {e}")
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the shared drug index, loading it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = load_index()
+        return _index
+
+
+def find_frequency(line):
+    schedule = DOSE_SCHEDULE_RE.search(line)
+    if schedule:
+        return '-'.join(schedule.groups())
+    for pattern, label in FREQUENCY_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return label.format(*match.groups())
+    return ''
+
+
+def find_dosage(line):
+    match = DOSAGE_RE.search(line)
+    if not match:
+        return ''
+    return f"{match.group(1)} {match.group(2).lower()}"
+
+
+def find_medicine(line, index):
+    """Longest dictionary match among the line's word n-grams, earliest first."""
+    tokens = TOKEN_RE.findall(line)
+    for start in range(len(tokens)):
+        for size in range(min(index.max_words, len(tokens) - start), 0, -1):
+            phrase = ' '.join(tokens[start:start + size])
+            if len(phrase) < MIN_TOKEN_LENGTH:
+                continue
+            match = index.lookup(phrase)
+            if match:
+                return match[0]
+    return None
+
+
+def iter_medicines(lines, index=None):
+    """Yield {medicine_name, dosage, frequency} records from OCR text lines as they are read.
+
+    A dosage or frequency on a line without a medicine name is attached to the
+    previous medicine, since prescriptions often wrap instructions onto the next line.
+    """
+    index = index or get_index()
+    pending = None
+    for line in lines:
+        name = find_medicine(line, index)
+        dosage, frequency = find_dosage(line), find_frequency(line)
+        if name:
+            if pending:
+                yield pending
+            pending = {'medicine_name': name, 'dosage': dosage, 'frequency': frequency}
+        elif pending:
+            pending['dosage'] = pending['dosage'] or dosage
+            pending['frequency'] = pending['frequency'] or frequency
+    if pending:
+        yield pending
+
+
+def parse_medicines(text, index=None):
+    """Parse OCR text into a list shaped like the add_treatment medicines list."""
+    return list(iter_medicines(text.splitlines(), index))
@@ -0,0 +1,274 @@
+"""Counters and latency histograms, served in the Prometheus text format at /metrics.
+
+Recording is a dict lookup and a few additions under a lock, cheap enough for
+every request. Each process keeps its own numbers. When METRICS_DIR is set,
+each process also writes a snapshot there every few seconds, and /metrics
+adds up the snapshots of every process. That way one scrape covers all
+server workers, whichever of them answers it. Snapshots of processes that have
+exited are deleted, and ones not rewritten for METRICS_STALE_SECONDS (left by an
+earlier server whose pid was reused) are ignored.
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+# A live process rewrites its snapshot every METRICS_FLUSH_SECONDS, older ones are not counted
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", 12 * METRICS_FLUSH_SECONDS))
+
+# Upper bounds in seconds, from a cached API read to a slow OCR request
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 1, 2, 5)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {key: value for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(row) for key, row in self._values.items()}
+
+    @staticmethod
+    def merge(total, row):
+        if total is None:
+            return list(row)
+        return [a + b for a, b in zip(total, row)]
+
+    def render(self, values):
+        for key, row in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), row[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_number(float(bound)))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_number(row[-1])}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running as another user, only possible for a pid reused by an unrelated process
+        return True
+    return True
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._metrics = {}
+        self._flusher_pid = None
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        """Write this process's snapshot for the other processes' /metrics to read."""
+        encoded = json.dumps({name: [[list(key), value] for key, value in values.items()]
+                              for name, values in self.snapshot().items()})
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(encoded)
+        os.replace(tmp_path, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError as e:
+                logging.warning(f"Could not write metrics snapshot: {e}")
+
+    def start_flusher(self):
+        """Start writing snapshots to METRICS_DIR from this process, once per process."""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True).start()
+
+    def _is_live(self, path):
+        """Whether a snapshot belongs to a running process of this server. Deletes those of exited processes."""
+        pid = os.path.basename(path)[len('metrics-'):-len('.json')]
+        if pid.isdigit() and not _pid_exists(int(pid)):
+            os.remove(path)
+            return False
+        return time.time() - os.path.getmtime(path) <= METRICS_STALE_SECONDS
+
+    def _collect(self):
+        """This process's live values plus the latest snapshot of every other process."""
+        totals = self.snapshot()
+        if not self.directory:
+            return totals
+        own = os.path.basename(self._snapshot_path(os.getpid()))
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if not self._is_live(path):
+                    continue
+                with open(path) as f:
+                    others = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, rows in others.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                values = totals.setdefault(name, {})
+                for key, value in rows:
+                    key = tuple(key)
+                    values[key] = metric.merge(values.get(key), value)
+        return totals
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        self.start_flusher()
+        lines = []
+        for name, values in self._collect().items():
+            metric = self._metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route', ('method', 'route', 'status'))
+OCR_STAGE_LATENCY = registry.histogram(
+    'ocr_stage_duration_seconds', 'Time spent in each OCR pipeline stage', ('stage',))
+MONGO_COMMAND_LATENCY = registry.histogram(
+    'mongo_command_duration_seconds', 'MongoDB command round trips', ('command', 'outcome'))
+BCRYPT_LATENCY = registry.histogram(
+    'bcrypt_duration_seconds', 'Password hashing and checking time', ('operation',), BCRYPT_BUCKETS)
+AUTH_REJECTED = registry.counter(
+    'auth_rejected_total', 'Authentication requests turned away before hashing', ('reason',))
+OCR_GEOMETRY = registry.counter(
+    'ocr_geometry_total', 'Pages by how their orientation was settled, and whether they were rotated',
+    ('source', 'rotated'))
+OCR_PASSES = registry.counter('ocr_passes_total', 'OCR results by the number of resolution passes they took',
+                              ('passes',))
+LOG_RECORDS_DROPPED = registry.counter(
+    'log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+
+def observe_request(method, route, status, seconds):
+    REQUEST_LATENCY.observe(seconds, method=method, route=route, status=status)
+
+
+def observe_ocr_result(result):
+    """Record the stage timings (milliseconds), geometry and passes of a fresh OCR result.
+
+    Cached results carry none of these and record nothing.
+    """
+    result = result or {}
+    for stage, ms in result.get('timings', {}).items():
+        OCR_STAGE_LATENCY.observe(ms / 1000, stage=stage)
+    geometry = result.get('geometry')
+    if geometry:
+        OCR_GEOMETRY.inc(source=geometry['source'], rotated=bool(geometry['rotation']))
+    if 'passes' in result:
+        OCR_PASSES.inc(passes=len(result['passes']))
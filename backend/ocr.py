@@ -1,30 +1,210 @@
-import pytesseract
-import cv2
-import numpy as np
 import logging
 import subprocess
-from PIL import Image
 import io
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_import import lazy_import
+
+# cv2 and numpy alone take longer to import than the rest of the app, so they
+# are loaded by the first OCR request rather than at startup
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+pytesseract = lazy_import('pytesseract')
+Image = lazy_import('PIL.Image')
+
+
+def load_ocr_modules():
+    """Import the deferred modules now, e.g. in a server's master so forked workers share them."""
+    for module in (cv2, np, pytesseract, Image):
+        getattr(module, '__name__')
 
 # Set Tesseract Path (Update this based on your system)
-pytesseract.pytesseract.tesseract_cmd = "/usr/bin/tesseract"  # Change if needed
-
-# Configure logging
-logging.basicConfig(
-    filename="server.log",
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s")
-
-def preprocess_image(img):
-    """Convert image to grayscale, denoise, and apply adaptive thresholding."""
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    thresh = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "/usr/bin/tesseract")  # Change if needed
+
+# Tesseract settings shared by every OCR entry point
+OCR_CONFIG = r'--oem 3 --psm 6'
+OCR_TIMEOUT = 10  # Seconds before a single image is given up on
+TIMEOUT_TEXT = "Tesseract Timeout: Image too complex"
+# Which OCR engine to use: "subprocess", "tesserocr", or "auto" for tesserocr when installed
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+
+# Preprocessing parameters
+MAX_WIDTH = 800
+THRESHOLD_BLOCK_SIZE, THRESHOLD_C = 11, 2
+DENOISE_H, DENOISE_TEMPLATE, DENOISE_SEARCH = 30, 7, 21
+
+# Resolution: "adaptive" scales each image by its measured text size, "fixed" resizes to MAX_WIDTH
+RESOLUTIONS = ('adaptive', 'fixed')
+OCR_RESOLUTION = os.getenv("OCR_RESOLUTION", "adaptive")
+# x-height in px for the cheap first pass, and for the escalation pass. Tesseract
+# reads best around 20px (10pt at 300 DPI) and degrades quickly below about 14px.
+FAST_X_HEIGHT = float(os.getenv("OCR_FAST_X_HEIGHT", 16))
+FULL_X_HEIGHT = float(os.getenv("OCR_FULL_X_HEIGHT", 24))
+# Mean word confidence (0-100) at which the first pass is accepted
+MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", 75))
+MAX_UPSCALE = 2.0
+ADAPTIVE_MAX_WIDTH = 2500  # px, bounds the cost of a page of tiny print
+ESCALATION_MIN_GAIN = 1.15  # Skip a second pass that would barely change the scale
+# Text size estimation
+X_HEIGHT_SAMPLE_WIDTH = 1200
+GLYPH_MIN_HEIGHT = 3  # px in the sample, smaller components are specks
+GLYPH_MAX_ASPECT = 3  # Width over height, wider components are rules and underlines
+GLYPH_MIN_FILL = 0.15
+MIN_GLYPHS = 8
+# Report fields each adaptive pass overwrites
+PASS_FIELDS = ('profile', 'blocks')
+
+# Geometry normalization: level skewed lines and turn sideways or upside-down pages upright
+OCR_DESKEW = os.getenv("OCR_DESKEW", "1") == "1"
+GEOMETRY_SAMPLE_WIDTH = 1000  # Orientation and skew are measured on a copy this wide
+LINE_KERNEL_DIVISOR = 40  # Smearing kernel length as a fraction of the sample width
+LINE_MIN_ELONGATION = 4  # Length over thickness of a blob that counts as a text line
+MIN_TEXT_LINES = 3
+AXIS_MARGIN = 3.0  # Total line length along one axis over the other's before the axis is trusted
+MAX_SKEW_SPREAD = 3.0  # Degrees the lines may disagree by before the estimate is not trusted
+MIN_SKEW = 0.3  # Degrees, less is left alone rather than resampled
+UPRIGHT_RATIO = 1.5  # Ascender over descender ink that settles which way up the text is
+OSD_SAMPLE_WIDTH = 1600
+OSD_MIN_CONFIDENCE = 1.5
+OSD_TIMEOUT = 3
+GEOMETRY_CACHE_SIZE = 1024
+# cv2.rotate codes for counter-clockwise quarter turns, by name for the same reason as above
+QUARTER_TURNS = {90: 'ROTATE_90_COUNTERCLOCKWISE', 180: 'ROTATE_180', 270: 'ROTATE_90_CLOCKWISE'}
+
+# Preprocessing profiles, cheapest first. "auto" picks one from a noise estimate.
+PROFILES = ('fast', 'balanced', 'quality')
+AUTO_PROFILE = 'auto'
+# Estimated noise sigma (grey levels) up to which each profile is good enough
+FAST_MAX_NOISE = 4.0
+BALANCED_MAX_NOISE = 10.0
+NOISE_SAMPLE_WIDTH = 400
+
+# Text region detection
+REGION_KERNEL_DIVISOR = 30  # Closing kernel width as a fraction of page width
+REGION_MIN_SIZE = 8  # px, smaller components are specks
+REGION_MIN_FILL = 0.1  # Share of edge pixels below which a block is a photo or stamp
+REGION_MAX_HEIGHT_RATIO = 0.5
+REGION_PADDING = 4
+REGION_WORKERS = int(os.getenv("OCR_REGION_WORKERS", 4))
+
+# cv2 flags for decoding a JPEG straight to a fraction of its size in grayscale, largest
+# reduction first. Names rather than values, reading them would import cv2.
+REDUCED_DECODE_FLAGS = (
+    (8, 'IMREAD_REDUCED_GRAYSCALE_8'),
+    (4, 'IMREAD_REDUCED_GRAYSCALE_4'),
+    (2, 'IMREAD_REDUCED_GRAYSCALE_2'),
+)
+# Uploads with more pixels than this are refused from their header, before any decoding.
+# 40 MP is above any phone camera's default and still only 40 MB decoded in grayscale.
+MAX_IMAGE_PIXELS = int(os.getenv("OCR_MAX_IMAGE_PIXELS", 40_000_000))
+
+
+class ImageTooLarge(ValueError):
+    """An upload over the byte or pixel limit. Routes answer it with 413 rather than 400."""
+
+def check_profile(profile):
+    """Raise ValueError for an unknown profile name."""
+    if profile != AUTO_PROFILE and profile not in PROFILES:
+        raise ValueError(f"Profile must be one of: {AUTO_PROFILE}, {', '.join(PROFILES)}")
+
+def check_resolution(resolution):
+    """Raise ValueError for an unknown resolution mode."""
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Resolution must be one of: {', '.join(RESOLUTIONS)}")
+
+@contextmanager
+def timed(report, stage):
+    """Record how long a stage took, in milliseconds, into report['timings'].
+
+    A stage that runs more than once, as on an escalated OCR pass, adds up.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if report is not None:
+            timings = report.setdefault('timings', {})
+            timings[stage] = round(timings.get(stage, 0) + (time.perf_counter() - start) * 1000, 2)
+
+def estimate_noise(gray):
+    """Estimate the noise sigma of a grayscale image (Immerkaer's Laplacian method).
+
+    Runs on a strided sample so it stays cheap on large photos. Striding keeps
+    pixel-level noise intact, unlike an area resize which would average it away.
+    """
+    step = max(1, gray.shape[1] // NOISE_SAMPLE_WIDTH)
+    sample = gray[::step, ::step].astype(np.float32)
+    height, width = sample.shape
+    if height < 3 or width < 3:
+        return 0.0
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = cv2.filter2D(sample, -1, kernel)[1:-1, 1:-1]
+    return float(np.sqrt(np.pi / 2) * np.abs(response).sum() / (6 * (width - 2) * (height - 2)))
+
+def select_profile(gray):
+    """Pick the cheapest profile that copes with the image's noise level."""
+    noise = estimate_noise(gray)
+    if noise <= FAST_MAX_NOISE:
+        return 'fast'
+    if noise <= BALANCED_MAX_NOISE:
+        return 'balanced'
+    return 'quality'
+
+def threshold_image(gray):
+    return cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, THRESHOLD_BLOCK_SIZE, THRESHOLD_C
     )
-    denoised = cv2.fastNlMeansDenoising(thresh, None, 30, 7, 21)
+
+def denoise_fast(thresh):
+    """Median filter, removes isolated specks left by thresholding a clean photo."""
+    return cv2.medianBlur(thresh, 3)
+
+def denoise_balanced(thresh):
+    """Morphological open of the dark text, drops specks smaller than the kernel."""
+    # Text is black on white, so closing the image is an open of the text
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+    return cv2.morphologyEx(cv2.medianBlur(thresh, 3), cv2.MORPH_CLOSE, kernel)
+
+def denoise_quality(thresh):
+    """Non-local means denoising, slow but the most robust on grainy photos."""
+    return cv2.fastNlMeansDenoising(thresh, None, DENOISE_H, DENOISE_TEMPLATE, DENOISE_SEARCH)
+
+DENOISERS = {
+    'fast': denoise_fast,
+    'balanced': denoise_balanced,
+    'quality': denoise_quality,
+}
+
+def preprocess_image(img, profile=AUTO_PROFILE, report=None):
+    """Convert image to grayscale, apply adaptive thresholding, and denoise.
+
+    profile names the denoising stage to use, or "auto" to pick one from a noise
+    estimate. If report is a dict, the chosen profile and per-stage timings are
+    written into it.
+    """
+    check_profile(profile)
+
+    with timed(report, 'grayscale'):
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if profile == AUTO_PROFILE:
+        with timed(report, 'noise_estimate'):
+            profile = select_profile(gray)
+    with timed(report, 'threshold'):
+        thresh = threshold_image(gray)
+    with timed(report, 'denoise'):
+        denoised = DENOISERS[profile](thresh)
+
+    if report is not None:
+        report['profile'] = profile
     return denoised
 
-def resize_image(img, max_width=800):
+def resize_image(img, max_width=MAX_WIDTH):
     """Resize image to a reasonable size for OCR."""
     height, width = img.shape[:2]
     if width > max_width:
@@ -32,20 +212,628 @@ def resize_image(img, max_width=800):
         return cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
     return img
 
-def convert_to_png(img):
-    """Convert image to PNG format."""
-    is_success, buffer = cv2.imencode(".png", img)
-    if is_success:
-        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+def scale_image(img, scale):
+    """Scale by a factor, area-averaging down and cubic up."""
+    if abs(scale - 1) < 0.01:
+        return img
+    height, width = img.shape[:2]
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=interpolation)
+
+def to_gray(img):
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+def estimate_x_height(gray):
+    """Median height in px of the glyph-sized connected components, or None if too few are found.
+
+    Lowercase letters without ascenders outnumber the rest in running text, so
+    the median lands near the x-height. Measured on a downsampled copy and
+    scaled back to gray's resolution.
+    """
+    sample_scale = min(1.0, X_HEIGHT_SAMPLE_WIDTH / gray.shape[1])
+    sample = scale_image(gray, sample_scale)
+    _, ink = cv2.threshold(sample, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    widths = stats[1:count, cv2.CC_STAT_WIDTH]
+    heights = stats[1:count, cv2.CC_STAT_HEIGHT]
+    areas = stats[1:count, cv2.CC_STAT_AREA]
+    glyphs = ((heights >= GLYPH_MIN_HEIGHT) & (heights <= sample.shape[0] // 4)
+              & (widths <= heights * GLYPH_MAX_ASPECT) & (areas >= widths * heights * GLYPH_MIN_FILL))
+    if np.count_nonzero(glyphs) < MIN_GLYPHS:
+        return None
+    return float(np.median(heights[glyphs])) / sample_scale
+
+def scale_for_x_height(x_height, target, width):
+    """Scale that brings text to the target x-height, within the upscale and width limits."""
+    return min(target / x_height, MAX_UPSCALE, ADAPTIVE_MAX_WIDTH / width)
+
+def decode_width(resolution=OCR_RESOLUTION):
+    """Smallest width decode_image may reduce a JPEG to, so a later pass still has the pixels it needs."""
+    return MAX_WIDTH if resolution == 'fixed' else ADAPTIVE_MAX_WIDTH
+
+def rotate_image(img, degrees, border=255, interpolation=None):
+    """Rotate counter-clockwise about the centre, growing the canvas so no corner is cut off.
+
+    Quarter turns are exact pixel moves, anything else is one affine warp.
+    """
+    degrees %= 360
+    if degrees == 0:
+        return img
+    if degrees in QUARTER_TURNS:
+        return cv2.rotate(img, getattr(cv2, QUARTER_TURNS[degrees]))
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), degrees, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width, new_height = round(height * sin + width * cos), round(height * cos + width * sin)
+    matrix[0, 2] += (new_width - width) / 2
+    matrix[1, 2] += (new_height - height) / 2
+    return cv2.warpAffine(img, matrix, (new_width, new_height),
+                          flags=cv2.INTER_LINEAR if interpolation is None else interpolation,
+                          borderMode=cv2.BORDER_CONSTANT,
+                          borderValue=border if img.ndim == 2 else (border,) * img.shape[2])
+
+def text_ink(gray):
+    """Text pixels as white on black."""
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return ink
+
+def find_text_lines(ink):
+    """Roughly horizontal text lines as (angle, length, bounding box).
+
+    A wide closing smears the characters of a line into one blob. The angle of
+    its minimum area rectangle's long side is the line's skew in degrees,
+    positive when the line drops to the right.
+    """
+    length = max(9, ink.shape[1] // LINE_KERNEL_DIVISOR)
+    smeared = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (length, 1)))
+    contours, _ = cv2.findContours(smeared, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    lines = []
+    for contour in contours:
+        corners = cv2.boxPoints(cv2.minAreaRect(contour))
+        sides = sorted((corners[1] - corners[0], corners[2] - corners[1]), key=lambda side: -np.hypot(*side))
+        long_side, short_side = np.hypot(*sides[0]), np.hypot(*sides[1])
+        if short_side < 2 or long_side < LINE_MIN_ELONGATION * short_side:
+            continue
+        angle = (np.degrees(np.arctan2(sides[0][1], sides[0][0])) + 90) % 180 - 90
+        if abs(angle) <= 45:
+            lines.append((float(angle), float(long_side), cv2.boundingRect(contour)))
+    return lines
+
+def weighted_median(values, weights):
+    order = np.argsort(values)
+    cumulative = np.cumsum(np.asarray(weights, dtype=np.float64)[order])
+    return float(np.asarray(values)[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+def upright_ratio(ink, lines):
+    """Ink above the x-height band over ink below it, summed over the lines.
+
+    Latin text has far more ascenders, capitals and digits reaching up than
+    descenders reaching down, so upright text scores above 1 and upside-down text below.
+    """
+    above = below = 0.0
+    for _, _, (x, y, w, h) in lines:
+        profile = ink[y:y + h, x:x + w].sum(axis=1, dtype=np.float64)
+        core = np.flatnonzero(profile >= profile.max() / 2)
+        if core.size == 0:
+            continue
+        above += profile[:core[0]].sum()
+        below += profile[core[-1] + 1:].sum()
+    return (above + 1) / (below + 1)
+
+def level_lines(ink, quarter):
+    """Text lines of ink turned by quarter, and their skew, or None when they are too few or disagree."""
+    ink = rotate_image(ink, quarter, border=0)
+    lines = find_text_lines(ink)
+    if len(lines) < MIN_TEXT_LINES:
+        return None
+    angles, lengths, _ = zip(*lines)
+    skew = weighted_median(angles, lengths)
+    if weighted_median([abs(angle - skew) for angle in angles], lengths) > MAX_SKEW_SPREAD:
+        return None
+    return {'ink': ink, 'skew': skew, 'length': sum(lengths)}
+
+def estimate_rotation(sample):
+    """Rotation that levels and uprights the text lines of a small grayscale copy.
+
+    Lines are looked for both as they are and turned a quarter. Along the
+    right axis the characters of a line smear into long blobs, across it only
+    into short ones, so the axis is taken when its lines are AXIS_MARGIN times
+    longer in total than the other's. Returns (counter-clockwise degrees,
+    upright_known), or None when neither axis clearly wins.
+    """
+    ink = text_ink(sample)
+    candidates = {quarter: level_lines(ink, quarter) for quarter in (0, 90)}
+    lengths = {quarter: found['length'] if found else 0.0 for quarter, found in candidates.items()}
+    quarter = max(lengths, key=lengths.get)
+    if candidates[quarter] is None or lengths[quarter] < AXIS_MARGIN * lengths[90 - quarter]:
+        return None
+    skew = candidates[quarter]['skew']
+    if abs(skew) < MIN_SKEW:
+        skew = 0.0
+
+    # Level the sample to see which way up the lines are
+    level = rotate_image(candidates[quarter]['ink'], skew, border=0, interpolation=cv2.INTER_NEAREST)
+    ratio = upright_ratio(level, find_text_lines(level))
+    if ratio >= UPRIGHT_RATIO:
+        return quarter + skew, True
+    if ratio <= 1 / UPRIGHT_RATIO:
+        return quarter + skew + 180, True
+    return quarter + skew, False
+
+def estimate_geometry(gray):
+    """The transform that uprights a page: {'rotation': counter-clockwise degrees, 'source'}.
+
+    Text line geometry on a downsampled copy decides it when it can. Tesseract
+    OSD, which costs an extra Tesseract run, only decides what the lines
+    cannot: pages with too little line structure, and which way up the lines are.
+    source is 'lines' or 'osd' for whichever settled the orientation, 'level'
+    when the lines only leveled the page, and 'none' when nothing was found.
+    """
+    sample = scale_image(gray, min(1.0, GEOMETRY_SAMPLE_WIDTH / gray.shape[1]))
+    estimate = estimate_rotation(sample)
+    if estimate is not None and estimate[1]:
+        rotation, source = estimate[0], 'lines'
+    else:
+        base = estimate[0] if estimate else 0.0
+        osd_sample = rotate_image(scale_image(gray, min(1.0, OSD_SAMPLE_WIDTH / gray.shape[1])), base)
+        turn = get_engine().detect_orientation(osd_sample)
+        if turn is not None:
+            rotation, source = base + turn, 'osd'
+        else:
+            # Nothing better to go on, upright is the likeliest. The lines leveled the
+            # page but could not tell which way up it is, so they are not the source.
+            rotation, source = base, 'level' if estimate else 'none'
+    return {'rotation': round((rotation + 180) % 360 - 180, 2), 'source': source}
+
+_geometry_cache = OrderedDict()
+_geometry_lock = threading.Lock()
+
+def normalize_geometry(img, report=None):
+    """Level and upright a page before thresholding, with at most one rotation.
+
+    The transform is cached by a hash of the pixels, so the same photo sent
+    again, for example with other OCR options, skips the estimate. A rotated
+    page comes back as grayscale, which is all preprocessing needs and is a
+    third of the pixels to warp.
+    """
+    with timed(report, 'geometry'):
+        gray = to_gray(img)
+        digest = hashlib.blake2b(gray.tobytes(), digest_size=16)
+        digest.update(repr(gray.shape).encode())
+        key = digest.hexdigest()
+        with _geometry_lock:
+            transform = _geometry_cache.get(key)
+            if transform is not None:
+                _geometry_cache.move_to_end(key)
+        cached = transform is not None
+        if not cached:
+            transform = estimate_geometry(gray)
+            with _geometry_lock:
+                _geometry_cache[key] = transform
+                while len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+                    _geometry_cache.popitem(last=False)
+        if transform['rotation']:
+            img = rotate_image(gray, transform['rotation'])
+    if report is not None:
+        report['geometry'] = dict(transform, cached=cached)
+    return img
+
+def flatten_alpha(img):
+    """Composite an image with an alpha channel onto white and drop the alpha."""
+    if img.dtype != np.uint8:
+        img = (img >> 8).astype(np.uint8)  # 16-bit PNGs
+    color, alpha = img[..., :-1], img[..., -1:].astype(np.float32) / 255
+    flat = (color.astype(np.float32) * alpha + 255 * (1 - alpha)).astype(np.uint8)
+    return flat[..., 0] if flat.shape[-1] == 1 else flat
+
+def header_source(data):
+    """A file object over data for PIL. Bytes are wrapped without a copy, an mmap is already one."""
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    data.seek(0)
+    return data
+
+def read_image_header(data):
+    """Format, mode, (width, height) and whether there is alpha, from the header alone.
+
+    data is bytes, an mmap or a seekable file. PIL only parses the header here,
+    the pixels are never decoded by it. Raises ImageTooLarge past MAX_IMAGE_PIXELS
+    and ValueError for anything that is not an image.
+    """
+    try:
+        with Image.open(header_source(data)) as header:
+            image_format, mode, size = header.format, header.mode, header.size
+            has_alpha = mode in ('RGBA', 'LA', 'PA') or (mode == 'P' and 'transparency' in header.info)
+    except Image.DecompressionBombError:
+        raise ImageTooLarge(f"Image has more than {MAX_IMAGE_PIXELS} pixels")
+    except Exception:
+        raise ValueError("Invalid image format or corrupted file")
+
+    if size[0] * size[1] > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"Image is {size[0]}x{size[1]}, more than {MAX_IMAGE_PIXELS} pixels")
+    return image_format, mode, size, has_alpha
+
+def decode_image(data, max_width=MAX_WIDTH):
+    """Decode an upload once into a grayscale array ready for preprocessing.
+
+    data is bytes or an mmap of a spooled upload, wrapped with np.frombuffer so
+    nothing is copied before cv2 decodes it. The pixel count is checked from the
+    header first. Every later stage works in grayscale, so the image is decoded
+    straight to it, a third of the memory of BGR. JPEGs are decoded at 1/2, 1/4
+    or 1/8 scale when that still leaves them at least max_width wide. Alpha is
+    flattened onto white so transparent backgrounds do not threshold to black.
+    """
+    image_format, mode, (width, _), has_alpha = read_image_header(data)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+
+    if has_alpha:
+        img = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+        if img is not None:
+            if img.ndim == 3 and img.shape[2] in (2, 4):
+                img = flatten_alpha(img)
+            img = to_gray(img)
+    else:
+        flags = cv2.IMREAD_GRAYSCALE
+        if image_format == 'JPEG':
+            for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+                if width // factor >= max_width:
+                    flags = getattr(cv2, reduced_flag)
+                    break
+        img = cv2.imdecode(buffer, flags)
+    del buffer
+
+    if img is None:
+        # Formats cv2 was built without (GIF, some WEBP) go through PIL instead
+        try:
+            with Image.open(header_source(data)) as pil_img:
+                gray = np.asarray(pil_img.convert('LA' if has_alpha else 'L'))
+        except Exception:
+            raise ValueError("Invalid image format or corrupted file")
+        img = flatten_alpha(gray) if has_alpha else gray
+
     return img
 
 def run_tesseract(image):
     """Run Tesseract OCR with a timeout."""
     try:
         result = subprocess.run(
-            ['tesseract', image, 'stdout', '--oem', '3', '--psm', '6'],
-            capture_output=True, text=True, timeout=10  # Set timeout to prevent hanging
+            ['tesseract', image, 'stdout', *OCR_CONFIG.split()],
+            capture_output=True, text=True, timeout=OCR_TIMEOUT  # Set timeout to prevent hanging
         )
         return result.stdout.strip()
     except subprocess.TimeoutExpired:
-        return "Tesseract Timeout: Image too complex"
\ No newline at end of file
+        return TIMEOUT_TEXT
+
+class SubprocessEngine:
+    """Runs the tesseract binary through pytesseract, one process per image."""
+
+    name = 'subprocess'
+
+    def __init__(self):
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+    def warmup(self):
+        pytesseract.get_tesseract_version()
+
+    def recognize(self, img, timeout=OCR_TIMEOUT):
+        try:
+            return pytesseract.image_to_string(img, config=OCR_CONFIG, timeout=timeout).strip()
+        except pytesseract.TesseractError:
+            raise
+        except RuntimeError:
+            # pytesseract kills the process and raises RuntimeError on timeout
+            return TIMEOUT_TEXT
+
+    def recognize_with_confidence(self, img, timeout=OCR_TIMEOUT):
+        """Text and mean word confidence (0-100) from a single Tesseract run."""
+        try:
+            data = pytesseract.image_to_data(img, config=OCR_CONFIG, timeout=timeout,
+                                             output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractError:
+            raise
+        except RuntimeError:
+            return TIMEOUT_TEXT, 0.0
+        lines, confidences = {}, []
+        for word, conf, *line in zip(data['text'], data['conf'], data['block_num'], data['par_num'], data['line_num']):
+            # Rows for pages, blocks and lines carry conf -1 and no text
+            if float(conf) < 0 or not word.strip():
+                continue
+            lines.setdefault(tuple(line), []).append(word)
+            confidences.append(float(conf))
+        text = '\n'.join(' '.join(words) for words in lines.values())
+        return text, (sum(confidences) / len(confidences) if confidences else 0.0)
+
+    def detect_orientation(self, img, timeout=OSD_TIMEOUT):
+        """Counter-clockwise quarter turn (0, 90, 180 or 270) that uprights the page, or None if unsure."""
+        try:
+            osd = pytesseract.image_to_osd(img, timeout=timeout, output_type=pytesseract.Output.DICT)
+        except (pytesseract.TesseractError, RuntimeError) as e:
+            # Too few characters, no osd.traineddata installed, or the timeout
+            logging.debug(f"Orientation detection failed: {e}")
+            return None
+        if float(osd['orientation_conf']) < OSD_MIN_CONFIDENCE:
+            return None
+        # "Rotate" is the clockwise turn that corrects the page
+        return -int(osd['rotate']) % 360
+
+
+class TesserocrEngine:
+    """Keeps one initialised Tesseract API per thread and reuses it for every image.
+
+    This skips the fork, the temp files and the eng.traineddata load that the
+    subprocess engine pays on each call. The timeout is handed to Tesseract's
+    own recognition deadline, which cancels the run from inside the C API.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+
+    def _api(self):
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            # Same settings as OCR_CONFIG: --oem 3 --psm 6
+            api = self._tesserocr.PyTessBaseAPI(
+                lang='eng', oem=self._tesserocr.OEM.DEFAULT, psm=self._tesserocr.PSM.SINGLE_BLOCK
+            )
+            self._local.api = api
+        return api
+
+    def warmup(self):
+        """Load the model for the calling thread only. Other threads load theirs on first use."""
+        self._api()
+
+    def _osd_api(self):
+        api = getattr(self._local, 'osd_api', None)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(psm=self._tesserocr.PSM.OSD_ONLY)
+            self._local.osd_api = api
+        return api
+
+    def _set_image(self, img, api=None):
+        api = api or self._api()
+        height, width = img.shape[:2]
+        channels = 1 if img.ndim == 2 else img.shape[2]
+        img = np.ascontiguousarray(img)
+        api.SetImageBytes(img.tobytes(), width, height, channels, img.strides[0])
+        return api
+
+    def _recognize(self, img, timeout):
+        """Set img and run recognition with a deadline. Returns the API, or None on timeout."""
+        api = self._set_image(img)
+        # Recognize takes milliseconds, 0 would mean no deadline at all
+        if not api.Recognize(timeout=max(1, int(timeout * 1000))):
+            logging.warning(f"Tesseract recognition stopped after {timeout}s")
+            api.Clear()
+            return None
+        return api
+
+    def recognize(self, img, timeout=OCR_TIMEOUT):
+        api = self._recognize(img, timeout)
+        return api.GetUTF8Text().strip() if api is not None else TIMEOUT_TEXT
+
+    def recognize_with_confidence(self, img, timeout=OCR_TIMEOUT):
+        api = self._recognize(img, timeout)
+        if api is None:
+            return TIMEOUT_TEXT, 0.0
+        # GetUTF8Text and MeanTextConf both read the results Recognize left
+        return api.GetUTF8Text().strip(), float(api.MeanTextConf())
+
+    def detect_orientation(self, img, timeout=OSD_TIMEOUT):
+        try:
+            osd = self._set_image(img, self._osd_api()).DetectOrientationScript()
+        except RuntimeError as e:
+            logging.debug(f"Orientation detection failed: {e}")
+            return None
+        if not osd or osd['orient_conf'] < OSD_MIN_CONFIDENCE:
+            return None
+        # orient_deg is how far the page is turned clockwise
+        return osd['orient_deg'] % 360
+
+
+def detect_text_regions(gray):
+    """Find text blocks on a grayscale page. Returns (x, y, w, h) boxes in reading order.
+
+    A morphological gradient lights up stroke edges, Otsu picks out the strong
+    ones, and a wide closing smears neighbouring characters and lines into
+    blocks that connected components can pick up. Logos and stamps tend to come
+    out as large sparse components and are dropped.
+    """
+    height, width = gray.shape
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, edges = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+    # Kernel scales with the page so the same text merges at any resolution
+    kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(3, width // REGION_KERNEL_DIVISOR), max(3, width // (REGION_KERNEL_DIVISOR * 3)))
+    )
+    blocks = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel)
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(blocks, connectivity=8)
+    boxes = []
+    for x, y, w, h, area in stats[1:count]:
+        if w < REGION_MIN_SIZE or h < REGION_MIN_SIZE:
+            continue
+        fill = cv2.countNonZero(edges[y:y + h, x:x + w]) / (w * h)
+        if fill < REGION_MIN_FILL or h > height * REGION_MAX_HEIGHT_RATIO:
+            continue
+        x0, y0 = max(0, x - REGION_PADDING), max(0, y - REGION_PADDING)
+        x1, y1 = min(width, x + w + REGION_PADDING), min(height, y + h + REGION_PADDING)
+        boxes.append((int(x0), int(y0), int(x1 - x0), int(y1 - y0)))
+
+    return sort_reading_order(boxes)
+
+def sort_reading_order(boxes):
+    """Order boxes top to bottom, then left to right within boxes that share a line."""
+    lines = []
+    for box in sorted(boxes, key=lambda b: b[1]):
+        center = box[1] + box[3] / 2
+        if lines and lines[-1]['top'] <= center <= lines[-1]['bottom']:
+            line = lines[-1]
+            line['boxes'].append(box)
+            line['bottom'] = max(line['bottom'], box[1] + box[3])
+        else:
+            lines.append({'top': box[1], 'bottom': box[1] + box[3], 'boxes': [box]})
+    return [box for line in lines for box in sorted(line['boxes'], key=lambda b: b[0])]
+
+_region_executor = None
+
+def ocr_regions(img, boxes, timeout=OCR_TIMEOUT):
+    """OCR each box of a preprocessed image in parallel. Returns blocks in the order given."""
+    global _region_executor
+    if _region_executor is None:
+        # Threads are enough: the subprocess engine waits on tesseract and tesserocr drops the GIL.
+        # The pool is kept so tesserocr's per-thread APIs are reused across requests.
+        _region_executor = ThreadPoolExecutor(max_workers=REGION_WORKERS, thread_name_prefix="ocr-region")
+    engine = get_engine()
+    crops = [img[y:y + h, x:x + w] for x, y, w, h in boxes]
+    results = _region_executor.map(lambda crop: engine.recognize_with_confidence(crop, timeout=timeout), crops)
+    return [{'text': text, 'confidence': round(confidence, 1), 'box': list(box)}
+            for (text, confidence), box in zip(results, boxes)]
+
+ENGINES = {
+    'subprocess': SubprocessEngine,
+    'tesserocr': TesserocrEngine,
+}
+
+_engine = None
+
+def create_engine(name):
+    if name == 'auto':
+        try:
+            return TesserocrEngine()
+        except ImportError:
+            return SubprocessEngine()
+    if name not in ENGINES:
+        raise ValueError(f"OCR engine must be one of: auto, {', '.join(ENGINES)}")
+    return ENGINES[name]()
+
+def get_engine():
+    """Return this process's OCR engine, created on first use."""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(OCR_ENGINE)
+        logging.info(f"Using OCR engine: {_engine.name}")
+    return _engine
+
+def pipeline_config(profile=AUTO_PROFILE, regions=False, resolution=OCR_RESOLUTION):
+    """Every setting that changes the OCR output for a given upload. Used to key cached results."""
+    config = {
+        'max_width': MAX_WIDTH,
+        'threshold': [THRESHOLD_BLOCK_SIZE, THRESHOLD_C],
+        'profile': profile,
+        'noise_limits': [FAST_MAX_NOISE, BALANCED_MAX_NOISE],
+        'denoise': [DENOISE_H, DENOISE_TEMPLATE, DENOISE_SEARCH],
+        'tesseract': OCR_CONFIG,
+        'engine': get_engine().name,
+        'regions': regions,
+        'resolution': resolution,
+        'decode': 'grayscale',
+    }
+    if resolution == 'adaptive':
+        config['adaptive'] = [FAST_X_HEIGHT, FULL_X_HEIGHT, MIN_CONFIDENCE, MAX_UPSCALE, ADAPTIVE_MAX_WIDTH]
+    if OCR_DESKEW:
+        config['geometry'] = [GEOMETRY_SAMPLE_WIDTH, MAX_SKEW_SPREAD, MIN_SKEW, UPRIGHT_RATIO, OSD_MIN_CONFIDENCE]
+    return config
+
+def recognize_page(img, timeout=OCR_TIMEOUT, profile=AUTO_PROFILE, regions=False, report=None):
+    """Preprocess and OCR an image already at its final size. Returns (text, mean confidence)."""
+    processed_img = preprocess_image(img, profile=profile, report=report)
+
+    if not regions:
+        with timed(report, 'tesseract'):
+            return get_engine().recognize_with_confidence(processed_img, timeout=timeout)
+
+    with timed(report, 'regions'):
+        boxes = detect_text_regions(to_gray(img))
+    if not boxes:
+        # Nothing looked like text, let Tesseract have the whole page
+        height, width = processed_img.shape[:2]
+        boxes = [(0, 0, width, height)]
+    with timed(report, 'tesseract'):
+        blocks = ocr_regions(processed_img, boxes, timeout=timeout)
+    if report is not None:
+        report['blocks'] = blocks
+    # Weighted by text length, so an empty speck of a block does not drag the page down
+    weight = sum(len(block['text']) for block in blocks)
+    confidence = sum(block['confidence'] * len(block['text']) for block in blocks) / weight if weight else 0.0
+    return '\n'.join(block['text'] for block in blocks if block['text']), confidence
+
+def ocr_adaptive(img, timeout=OCR_TIMEOUT, profile=AUTO_PROFILE, regions=False, report=None):
+    """OCR at the smallest scale that keeps text readable, escalating only when confidence is low.
+
+    The first pass scales the text to FAST_X_HEIGHT. If Tesseract's mean word
+    confidence stays under MIN_CONFIDENCE, the image is OCRed again at
+    FULL_X_HEIGHT and the more confident result wins. Both passes share the one timeout.
+    """
+    deadline = time.monotonic() + timeout
+    with timed(report, 'x_height'):
+        x_height = estimate_x_height(to_gray(img))
+    width = img.shape[1]
+    if x_height is None:
+        # Nothing glyph-like to measure, use the fixed width in a single pass
+        scales = [min(1.0, MAX_WIDTH / width)]
+    else:
+        scales = [scale_for_x_height(x_height, FAST_X_HEIGHT, width)]
+        full_scale = scale_for_x_height(x_height, FULL_X_HEIGHT, width)
+        if full_scale >= scales[0] * ESCALATION_MIN_GAIN:
+            scales.append(full_scale)
+
+    passes, best = [], None
+    for scale in scales:
+        remaining = deadline - time.monotonic()
+        if best is not None and remaining <= 0:
+            break
+        with timed(report, 'resize'):
+            page = scale_image(img, scale)
+        text, confidence = recognize_page(page, timeout=max(1, remaining), profile=profile,
+                                          regions=regions, report=report)
+        passes.append({'scale': round(scale, 3), 'width': page.shape[1], 'confidence': round(confidence, 1)})
+        if best is None or confidence > best[1]:
+            # The pass writes its profile and blocks into report, keep the winner's
+            best = (text, confidence, {key: report[key] for key in PASS_FIELDS if report and key in report})
+        if confidence >= MIN_CONFIDENCE or text == TIMEOUT_TEXT:
+            break
+
+    text, confidence, fields = best
+    if report is not None:
+        report.update(fields, x_height=round(x_height, 1) if x_height else None, passes=passes,
+                      confidence=round(confidence, 1))
+    return text
+
+def ocr_image(img, timeout=OCR_TIMEOUT, profile=AUTO_PROFILE, regions=False, resolution=OCR_RESOLUTION,
+              report=None):
+    """Resize, preprocess and OCR a decoded image array.
+
+    The page is first levelled and turned upright, see normalize_geometry.
+    resolution "adaptive" sizes the image by its text, see ocr_adaptive, and
+    "fixed" resizes it to MAX_WIDTH. With regions=True only detected text
+    blocks are OCRed, and the blocks with their bounding boxes are written to
+    report['blocks'].
+    """
+    check_resolution(resolution)
+    if OCR_DESKEW:
+        img = normalize_geometry(img, report=report)
+    if resolution == 'adaptive':
+        return ocr_adaptive(img, timeout=timeout, profile=profile, regions=regions, report=report)
+
+    with timed(report, 'resize'):
+        img = resize_image(img)
+    text, confidence = recognize_page(img, timeout=timeout, profile=profile, regions=regions, report=report)
+    if report is not None:
+        report['confidence'] = round(confidence, 1)
+    return text
+
+def ocr_image_bytes(data, timeout=OCR_TIMEOUT, **options):
+    """Decode raw upload bytes and OCR them. Picklable entry point for worker processes.
+
+    Returns a result dict with the extracted text, the chosen profile and stage timings.
+    """
+    report = {}
+    with timed(report, 'decode'):
+        img = decode_image(data, max_width=decode_width(options.get('resolution', OCR_RESOLUTION)))
+    text = ocr_image(img, timeout=timeout, report=report, **options)
+    return dict(report, extracted_text=text)
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from ocr import pipeline_config
+
+# Memory tier budget in bytes of cached results
+CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Leave unset to keep the cache in memory only
+CACHE_DIR = os.getenv("OCR_CACHE_DIR")
+# Result fields worth keeping, timings and the like describe one particular run
+CACHED_FIELDS = ('extracted_text', 'blocks', 'confidence')
+
+
+class OCRCache:
+    """Content-addressed OCR results with an LRU memory tier and an optional disk tier."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, cache_dir=CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(data, **options):
+        """Hash of the upload bytes plus the pipeline config that produced the result."""
+        config = pipeline_config(**options)
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key):
+        """Return the cached result dict for key, or None."""
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return json.loads(encoded)
+
+        encoded = self._read_disk(key)
+        with self._lock:
+            if encoded is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._store(key, encoded)
+        return json.loads(encoded)
+
+    def set(self, key, result):
+        encoded = json.dumps({field: result[field] for field in CACHED_FIELDS if field in result})
+        with self._lock:
+            self._store(key, encoded)
+        self._write_disk(key, encoded)
+
+    def _store(self, key, encoded):
+        """Insert into the memory tier and evict least recently used entries. Caller holds the lock."""
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = encoded
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats['evictions'] += 1
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"OCR cache read failed for {key}: {e}")
+            return None
+
+    def _write_disk(self, key, encoded):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a concurrent reader never sees a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"OCR cache write failed for {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['disk_hits'] + self._stats['misses']
+            hits = self._stats['hits'] + self._stats['disk_hits']
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                bytes=self._size,
+                max_bytes=self.max_bytes,
+                hit_ratio=hits / lookups if lookups else 0.0,
+            )
+
+
+cache = OCRCache()
@@ -0,0 +1,251 @@
+"""OCR job queue shared by every server worker on the host.
+
+Jobs, their image bytes and their results live in one SQLite file (OCR_JOB_DB),
+so a job submitted through one gunicorn worker can be polled or cancelled
+through any other. Each worker runs dispatcher threads that claim queued jobs
+in priority order and feed them to its own OCR process pool.
+
+Backpressure counts both jobs and bytes: a submission is refused once
+OCR_JOB_QUEUE_SIZE jobs, or OCR_JOB_QUEUE_BYTES of image data, are waiting or
+running. Image bytes are dropped from the row as soon as a job finishes.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from ocr import ocr_image_bytes, OCR_TIMEOUT, TIMEOUT_TEXT
+from ocr_pool import submit, abandon, reset_broken_pool, OCR_WORKERS, BATCH_GRACE_SECONDS
+from ocr_cache import cache
+from metrics import observe_ocr_result
+from shared_sqlite import SharedSQLite, default_path
+
+# Backpressure: submissions beyond this many waiting or running jobs are rejected
+JOB_QUEUE_SIZE = int(os.getenv("OCR_JOB_QUEUE_SIZE", 100))
+# ... or beyond this many bytes of image data held for them
+JOB_QUEUE_BYTES = int(os.getenv("OCR_JOB_QUEUE_BYTES", 256 * 1024 * 1024))
+# Finished jobs are kept this long so clients can poll for the result
+JOB_TTL_SECONDS = int(os.getenv("OCR_JOB_TTL_SECONDS", 600))
+# gunicorn.conf.py points every worker at one file. Unset, the file belongs to this process.
+JOB_DB_PATH = default_path("OCR_JOB_DB", "ocr-jobs")
+# How often idle dispatchers look for jobs submitted through other workers
+POLL_SECONDS = float(os.getenv("OCR_JOB_POLL_SECONDS", 0.25))
+# A running job older than this was claimed by a worker that died, it is failed instead of left running
+STALE_SECONDS = 2 * (OCR_TIMEOUT + BATCH_GRACE_SECONDS)
+
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- Keeps FIFO order within a priority
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    options TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    data BLOB,
+    size INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, rank, seq);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at capacity."""
+
+
+class Job:
+    """A snapshot of one row of the jobs table."""
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.status = row['status']
+        self.priority = row['priority']
+        self.result = json.loads(row['result']) if row['result'] else None
+        self.error = row['error']
+        self.created_at = row['created_at']
+        self.finished_at = row['finished_at']
+
+    def to_dict(self):
+        job = {
+            'job_id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+        if self.status == DONE:
+            job.update(self.result)
+        if self.error:
+            job['error'] = self.error
+        return job
+
+
+_db = SharedSQLite(JOB_DB_PATH, SCHEMA, timeout=10, row_factory=sqlite3.Row)
+_dispatchers = []
+_dispatchers_lock = threading.Lock()
+_wakeup = threading.Event()
+# Futures of the jobs this process is running, so a cancel handled here can stop one before it starts
+_futures = {}
+
+
+def _reset_after_fork():
+    # Dispatcher threads of the parent are no use in a forked worker, _db opens its own connections
+    global _dispatchers, _wakeup
+    _dispatchers = []
+    _wakeup = threading.Event()
+    _futures.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _claim():
+    """Mark the next queued job running and return (id, data, options, cache_key), or None."""
+    with _db.transaction() as conn:
+        row = conn.execute(f"SELECT seq, id, data, options, cache_key FROM jobs WHERE status = '{QUEUED}' "
+                           "ORDER BY rank, seq LIMIT 1").fetchone()
+        if row is None:
+            return None
+        conn.execute(f"UPDATE jobs SET status = '{RUNNING}', started_at = ? WHERE seq = ?", (time.time(), row['seq']))
+    return row['id'], row['data'], json.loads(row['options']), row['cache_key']
+
+
+def _finish(job_id, status, result=None, error=None):
+    # A job cancelled while running keeps its cancelled status
+    with _db.transaction() as conn:
+        conn.execute(f"UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, data = NULL "
+                     f"WHERE id = ? AND status = '{RUNNING}'",
+                     (status, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+
+def _dispatch_loop():
+    """Feed queued jobs into this worker's OCR process pool one at a time."""
+    while True:
+        try:
+            claimed = _claim()
+        except sqlite3.Error as e:
+            logging.error(f"OCR job queue unavailable: {e}")
+            claimed = None
+        if claimed is None:
+            # Submissions through this worker wake us at once, other workers' are found by polling
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+            continue
+
+        job_id, data, options, cache_key = claimed
+        future = submit(ocr_image_bytes, data, OCR_TIMEOUT, **options)
+        _futures[job_id] = future
+        del data
+        try:
+            result = future.result(timeout=OCR_TIMEOUT + BATCH_GRACE_SECONDS)
+            observe_ocr_result(result)
+            status, error = DONE, None
+            if result['extracted_text'] != TIMEOUT_TEXT:
+                cache.set(cache_key, result)
+        except FutureTimeoutError:
+            abandon(future)
+            result, status, error = None, FAILED, TIMEOUT_TEXT
+        except BrokenProcessPool as e:
+            logging.error(f"OCR worker pool crashed: {e}")
+            reset_broken_pool(future)
+            result, status, error = None, FAILED, "OCR worker crashed"
+        except Exception as e:
+            logging.error(f"OCR job {job_id} failed: {e}")
+            result, status, error = None, FAILED, str(e)
+        finally:
+            _futures.pop(job_id, None)
+
+        try:
+            _finish(job_id, status, result, error)
+        except sqlite3.Error as e:
+            logging.error(f"Could not record the result of OCR job {job_id}: {e}")
+
+
+def _start_dispatchers():
+    # One dispatcher per pool worker keeps the pool busy without oversubscribing it
+    with _dispatchers_lock:
+        while len(_dispatchers) < OCR_WORKERS:
+            thread = threading.Thread(target=_dispatch_loop, name="ocr-job-dispatcher", daemon=True)
+            thread.start()
+            _dispatchers.append(thread)
+
+
+def _prune(conn):
+    """Forget finished jobs older than the TTL, and fail running jobs whose worker went away."""
+    now = time.time()
+    conn.execute(f"DELETE FROM jobs WHERE status IN {FINISHED} AND finished_at < ?", (now - JOB_TTL_SECONDS,))
+    conn.execute(f"UPDATE jobs SET status = '{FAILED}', error = 'OCR worker stopped before the job finished', "
+                 f"finished_at = ?, data = NULL WHERE status = '{RUNNING}' AND started_at < ?",
+                 (now, now - STALE_SECONDS))
+
+
+def _insert(conn, job_id, priority, options, cache_key, data=None, status=QUEUED, result=None):
+    conn.execute(
+        "INSERT INTO jobs (id, status, priority, rank, options, cache_key, data, size, result, created_at, finished_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, status, priority, PRIORITIES[priority], json.dumps(options), cache_key, data,
+         len(data) if data is not None else 0, json.dumps(result) if result is not None else None,
+         time.time(), time.time() if status in FINISHED else None),
+    )
+    return Job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def submit_job(data, priority='normal', **options):
+    """Queue raw image bytes for OCR and return the new Job. options are passed to ocr.ocr_image."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Priority must be one of: {', '.join(PRIORITIES)}")
+
+    job_id = uuid.uuid4().hex
+    cache_key = cache.key(data, **options)
+    result = cache.get(cache_key)
+    with _db.transaction() as conn:
+        _prune(conn)
+        if result is not None:
+            # Already seen this image, the job is finished before it is queued
+            return _insert(conn, job_id, priority, options, cache_key, status=DONE, result=dict(result, cached=True))
+        pending, pending_bytes = conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM jobs WHERE status IN ('{QUEUED}', '{RUNNING}')").fetchone()
+        if pending >= JOB_QUEUE_SIZE or pending_bytes + len(data) > JOB_QUEUE_BYTES:
+            raise QueueFull("OCR queue is full, try again later")
+        job = _insert(conn, job_id, priority, options, cache_key, data=data)
+    _start_dispatchers()
+    _wakeup.set()
+    return job
+
+
+def get_job(job_id):
+    # Whichever worker is polled can pick up jobs a stopped worker left queued
+    _start_dispatchers()
+    row = _db.connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return Job(row) if row is not None else None
+
+
+def cancel_job(job_id):
+    """Cancel a queued or running job. Returns the job, or None if unknown."""
+    with _db.transaction() as conn:
+        conn.execute(f"UPDATE jobs SET status = '{CANCELLED}', finished_at = ?, data = NULL "
+                     f"WHERE id = ? AND status IN ('{QUEUED}', '{RUNNING}')", (time.time(), job_id))
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()  # Best effort, a started OCR call runs to completion
+    return Job(row) if row is not None else None
+
+
+def queue_depth():
+    return _db.connection().execute(f"SELECT COUNT(*) FROM jobs WHERE status = '{QUEUED}'").fetchone()[0]
@@ -0,0 +1,174 @@
+import os
+import math
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from ocr import ocr_image_bytes, get_engine, OCR_TIMEOUT, TIMEOUT_TEXT
+from ocr_cache import cache
+from metrics import observe_ocr_result
+
+# One worker per core by default, OCR is CPU bound so more would only thrash
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+MAX_BATCH_IMAGES = int(os.getenv("OCR_MAX_BATCH_IMAGES", 20))
+# Extra seconds on top of the Tesseract timeout for decode/preprocess and IPC
+BATCH_GRACE_SECONDS = 5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    """Keep each worker single threaded so N workers use N cores, not N * N, and load the OCR model.
+
+    Tasks run on the thread that runs this, so the engine warmed up here is
+    the one they use, tesserocr's per-thread API included.
+    """
+    import cv2
+    cv2.setNumThreads(1)
+    os.environ["OMP_THREAD_LIMIT"] = "1"  # Tesseract's own OpenMP threads
+    try:
+        get_engine().warmup()
+    except Exception as e:
+        # The first OCR call will report the problem
+        logging.error(f"OCR engine warmup failed in pool worker {os.getpid()}: {e}")
+
+
+def get_executor():
+    """Return the shared process pool, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            logging.info(f"Starting OCR process pool with {OCR_WORKERS} workers")
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS, initializer=_init_worker)
+        return _executor
+
+
+def warmup():
+    """Start every pool worker now, instead of on the first requests, without waiting for them."""
+    executor = get_executor()
+    # Each submit with no idle worker spawns one, up to OCR_WORKERS
+    for _ in range(OCR_WORKERS):
+        executor.submit(os.getpid)
+
+
+def shutdown(wait=True):
+    """Stop the pool's worker processes, e.g. when the server shuts a worker down."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def reset_broken_pool(future):
+    """Drop the crashed pool future ran in, so the next submit starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is future.executor:
+            _executor = None
+    future.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(func, *args, **kwargs):
+    """Run func in the pool and return its Future, which remembers the pool for abandon()."""
+    executor = get_executor()
+    future = executor.submit(func, *args, **kwargs)
+    future.executor = executor
+    return future
+
+
+def _terminate(processes):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def _retire(executor):
+    """Stop sending work to executor and kill its processes once the work it already has ran out of time.
+
+    The replacement pool starts on the next submit. The old one finishes what
+    it was given, except the stuck call, which only ends with its process.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not executor:
+            return  # Already replaced by another caller
+        _executor = None
+    # Taken before shutdown, which drops the executor's references to them.
+    # There is no public accessor before Python 3.14's terminate_workers().
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False)
+    reaper = threading.Timer(OCR_TIMEOUT + BATCH_GRACE_SECONDS, _terminate, args=(processes,))
+    reaper.daemon = True
+    reaper.start()
+
+
+def abandon(future):
+    """Give up on a future that ran past its timeout.
+
+    A call still queued is cancelled. One already running in a worker cannot
+    be interrupted, and that worker would be lost to the pool, so the pool is
+    replaced and the stuck process killed.
+    """
+    if future.cancel() or future.done():
+        return
+    logging.warning("OCR worker is stuck past its timeout, replacing the pool")
+    _retire(future.executor)
+
+
+def extract_batch(images, timeout=OCR_TIMEOUT, **options):
+    """OCR a list of raw image bytes in parallel and return results in input order.
+
+    Each result is a dict with either "extracted_text" or "error". options are
+    passed through to ocr.ocr_image.
+    """
+    # Only cache misses go to the pool, duplicates in one batch are OCRed once
+    keys = [cache.key(data, **options) for data in images]
+    cached = {}
+    futures = {}
+    for key, data in zip(keys, images):
+        if key in cached or key in futures:
+            continue
+        result = cache.get(key)
+        if result is not None:
+            cached[key] = result
+        else:
+            futures[key] = submit(ocr_image_bytes, data, timeout, **options)
+
+    # Images queue behind each other once there are more than workers,
+    # so the whole batch gets one timeout slot per round of workers.
+    rounds = math.ceil(len(futures) / OCR_WORKERS)
+    deadline = time.monotonic() + rounds * timeout + BATCH_GRACE_SECONDS
+
+    results = []
+    broken = None
+    for index, key in enumerate(keys):
+        if key in cached:
+            results.append(dict(cached[key], index=index, cached=True))
+            continue
+        future = futures[key]
+        try:
+            result = future.result(timeout=max(0, deadline - time.monotonic()))
+            observe_ocr_result(result)
+            if result['extracted_text'] != TIMEOUT_TEXT:
+                cache.set(key, result)
+            results.append(dict(result, index=index))
+        except FutureTimeoutError:
+            abandon(future)
+            logging.warning(f"OCR batch image {index} timed out")
+            results.append({"index": index, "error": TIMEOUT_TEXT})
+        except BrokenProcessPool as e:
+            logging.error(f"OCR worker pool crashed: {e}")
+            broken = future
+            results.append({"index": index, "error": "OCR worker crashed"})
+        except Exception as e:
+            logging.error(f"Error processing batch image {index}: {e}")
+            results.append({"index": index, "error": str(e)})
+
+    if broken is not None:
+        reset_broken_pool(broken)
+
+    return results
@@ -0,0 +1,75 @@
+import base64
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+from serialization import dumps
+
+# Largest page a client can ask for, also the default when no limit is given
+MAX_PAGE_SIZE = 500
+# Documents fetched per round trip while streaming
+STREAM_BATCH_SIZE = 100
+
+
+def encode_cursor(object_id):
+    """Opaque page token for the position after object_id."""
+    return base64.urlsafe_b64encode(object_id.binary).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        return ObjectId(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError, InvalidId):
+        raise ValueError("Invalid 'after' cursor")
+
+
+def parse_page_args(args):
+    """Read limit and after from the query string. Raises ValueError on bad input."""
+    try:
+        limit = int(args.get('limit', MAX_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be a number")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    after = args.get('after')
+    return limit, decode_cursor(after) if after else None
+
+
+def parse_projection(args, allowed_fields):
+    """Turn ?fields=a,b into a MongoDB projection, limited to allowed_fields. None means all fields."""
+    fields = args.get('fields')
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = set(requested) - set(allowed_fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return {field: 1 for field in requested}
+
+
+def page_query(query, after):
+    return dict(query, _id={'$gt': after}) if after else query
+
+
+def find_page(collection, query, limit, after=None, projection=None):
+    """Fetch one page in _id order. Returns the documents and the token for the next page, or None."""
+    cursor = collection.find(page_query(query, after), projection).sort('_id', 1).limit(limit + 1)
+    documents = list(cursor)
+    if len(documents) > limit:
+        documents = documents[:limit]
+        return documents, encode_cursor(documents[-1]['_id'])
+    return documents, None
+
+
+def stream_json_array(collection, query, after=None, projection=None, limit=None,
+                      prefix=b'[', suffix=b']'):
+    """Yield a JSON array chunk by chunk straight from a cursor, one document at a time.
+
+    prefix and suffix let callers wrap the array in an object, e.g. b'{"items":[' and b']}'.
+    """
+    cursor = collection.find(page_query(query, after), projection).sort('_id', 1).batch_size(STREAM_BATCH_SIZE)
+    if limit:
+        cursor = cursor.limit(limit)
+    yield prefix
+    for index, document in enumerate(cursor):
+        yield (b',' if index else b'') + dumps(document)
+    yield suffix
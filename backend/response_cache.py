@@ -0,0 +1,265 @@
+"""Per-user cache of serialized list responses, with ETags.
+
+Entries are keyed by scope ('medicines', 'treatments'), user and the request's
+query string, plus the user's current generation for that scope. Writes bump
+the generation instead of hunting down keys, so every cached page of that user
+goes stale at once and simply ages out of the LRU.
+
+Bodies are kept in process memory by default, and generations in a SQLite
+file (RESPONSE_CACHE_DB) that every worker on the host reads. A write handled by
+one worker therefore invalidates the pages cached by all of them at once.
+Set RESPONSE_CACHE_URL to a redis:// URL to keep both in Redis instead, which
+is needed when the app runs on more than one host.
+"""
+import os
+import json
+import time
+import secrets
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # Only needed for the shared backend
+    redis = None
+
+from serialization import dumps
+from shared_sqlite import SharedSQLite, default_path
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 60))
+# Memory backend budget in bytes of cached bodies
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+# gunicorn.conf.py points every worker at one file. Unset, the file belongs to this process.
+RESPONSE_CACHE_DB = default_path("RESPONSE_CACHE_DB", "response-cache")
+# Generations outlive entries, a lost generation only costs a miss
+GENERATION_TTL = 24 * 60 * 60
+
+
+class MemoryBackend:
+    """Thread-safe LRU of byte strings with per-entry expiry."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """Caller holds the lock."""
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'evictions': self.evictions}
+
+
+class SQLiteBackend:
+    """Same interface as MemoryBackend, in a SQLite file shared by the processes on one host.
+
+    Only used for generations: a lookup is one indexed read, cheap next to the
+    query and serialization a cached page saves.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL);
+    -- set() prunes expired entries on every write, the index keeps that from scanning the table
+    CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_DB):
+        self.path = path
+        self._db = SharedSQLite(path, self.SCHEMA)
+
+    def get(self, key):
+        row = self._db.connection().execute("SELECT value FROM entries WHERE key = ? AND expires_at >= ?",
+                                            (key, time.time())).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._db.connection()
+        conn.execute("INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)", (key, value, now + ttl))
+        conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+
+    def stats(self):
+        return {'entries': self._db.connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]}
+
+
+class RedisBackend:
+    """Same interface as MemoryBackend, backed by a Redis server shared between processes."""
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RESPONSE_CACHE_URL is set but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=max(1, int(ttl)))
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+def create_backend(url=RESPONSE_CACHE_URL):
+    if url:
+        return RedisBackend(url)
+    return MemoryBackend()
+
+
+def create_generations(backend, url=RESPONSE_CACHE_URL):
+    """Where generations live: with the bodies when those are shared, else in the host's SQLite file."""
+    if url:
+        return backend
+    return SQLiteBackend()
+
+
+def etag_for(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers etag."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class CachedResponse:
+    """A serialized body with the headers that go with it."""
+
+    __slots__ = ('body', 'etag', 'next_cursor')
+
+    def __init__(self, body, etag, next_cursor=None):
+        self.body = body
+        self.etag = etag
+        self.next_cursor = next_cursor
+
+    def encode(self):
+        # Header line, then the body untouched, so a hit never re-serializes documents
+        return dumps({'etag': self.etag, 'next': self.next_cursor}) + b'\n' + self.body
+
+    @classmethod
+    def decode(cls, value):
+        header, body = value.split(b'\n', 1)
+        meta = json.loads(header)
+        return cls(body, meta['etag'], meta['next'])
+
+
+class ResponseCache:
+    def __init__(self, backend=None, generations=None, ttl=RESPONSE_CACHE_TTL):
+        self.backend = backend or create_backend()
+        # Must be shared by every worker, or a write in one leaves the others serving stale pages
+        self.generations = generations or create_generations(self.backend)
+        self.ttl = ttl
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _generation(self, scope, user_id):
+        key = f'gen:{scope}:{user_id}'
+        generation = self.generations.get(key)
+        if generation is None:
+            # Random rather than a counter, so a generation lost to eviction never comes back
+            generation = secrets.token_hex(8).encode('ascii')
+            self.generations.set(key, generation, GENERATION_TTL)
+        return generation.decode('ascii')
+
+    def key(self, scope, user_id, variant):
+        """Cache key for one request, variant being the raw query string. None if the backend is down."""
+        if isinstance(variant, str):
+            variant = variant.encode('utf-8')
+        digest = hashlib.blake2b(variant, digest_size=12).hexdigest()
+        try:
+            generation = self._generation(scope, user_id)
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Response cache generation lookup failed: {e}")
+            return None
+        return f'resp:{scope}:{user_id}:{generation}:{digest}'
+
+    def get(self, key):
+        """Return the CachedResponse for key, or None. Backend failures count as misses."""
+        if key is None:
+            self._count('misses')
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Response cache read failed: {e}")
+            value = None
+        if value is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return CachedResponse.decode(value)
+
+    def set(self, key, body, next_cursor=None):
+        """Store a serialized body and return it as a CachedResponse."""
+        entry = CachedResponse(body, etag_for(body), next_cursor)
+        if key is None:
+            return entry
+        try:
+            self.backend.set(key, entry.encode(), self.ttl)
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Response cache write failed: {e}")
+        return entry
+
+    def invalidate(self, scope, *user_ids):
+        """Drop every cached response of these users in scope."""
+        for user_id in set(user_ids):
+            if not user_id:
+                continue
+            try:
+                self.generations.set(f'gen:{scope}:{user_id}', secrets.token_hex(8).encode('ascii'), GENERATION_TTL)
+            except Exception as e:
+                # Entries still expire after the TTL
+                self._count('errors')
+                logging.error(f"Response cache invalidation failed for {scope}/{user_id}: {e}")
+            self._count('invalidations')
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot.update(self.backend.stats(), ttl=self.ttl)
+        return snapshot
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,37 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from bson.objectid import ObjectId
+from bson.decimal128 import Decimal128
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # Plain json is slower but produces the same output
+    orjson = None
+
+
+def _default(value):
+    """Encode the BSON types Mongo documents carry that JSON has no type for."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Serialize to JSON bytes. ObjectId and datetime values are handled at any depth."""
+    if orjson is not None:
+        # orjson writes datetimes natively, in the same format as isoformat()
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(obj, status=200, headers=None):
+    """Drop-in for jsonify that also understands Mongo documents."""
+    return Response(dumps(obj), status=status, headers=headers, mimetype='application/json')
@@ -0,0 +1,57 @@
+"""Production entry point: runs the Flask app, or the ASGI app, under Gunicorn.
+
+    python serve.py                      # Flask app, one worker per core
+    python serve.py --workers 4 --bind 0.0.0.0:8000
+    python serve.py --asgi               # asgi_app on uvicorn workers
+
+Settings come from gunicorn.conf.py, the flags override them.
+"""
+import os
+import argparse
+
+from gunicorn.app.base import Application
+from gunicorn.util import import_app
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+
+class Launcher(Application):
+    def __init__(self, app_uri, options=None):
+        self.app_uri = app_uri
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self):
+        # Replaces Application.load_config, which would parse gunicorn's own command line
+        self.load_config_from_file(CONFIG_PATH)
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return import_app(self.app_uri)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per core)")
+    parser.add_argument('--threads', type=int, help="Threads per worker, Flask app only")
+    parser.add_argument('--bind', help="host:port to listen on")
+    parser.add_argument('--asgi', action='store_true', help="Serve asgi_app with uvicorn workers")
+    args = parser.parse_args()
+
+    # The config file reads these when it is loaded, so set them first
+    if args.workers:
+        os.environ['WEB_CONCURRENCY'] = str(args.workers)
+    if args.threads:
+        os.environ['GUNICORN_THREADS'] = str(args.threads)
+    if args.bind:
+        os.environ['BIND'] = args.bind
+
+    options = {}
+    if args.asgi:
+        options['worker_class'] = 'uvicorn.workers.UvicornWorker'
+    Launcher('asgi_app:app' if args.asgi else 'app:app', options).run()
+
+
+if __name__ == '__main__':
+    main()
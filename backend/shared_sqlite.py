@@ -0,0 +1,63 @@
+"""SQLite files shared by the server workers on one host.
+
+The OCR job queue (OCR_JOB_DB), response cache generations (RESPONSE_CACHE_DB)
+and login attempt buckets (LOGIN_LIMITER_DB) each live in a SQLite file that
+every worker opens. gunicorn.conf.py points all workers at one file per store;
+unset, each process gets a file of its own in the temp directory.
+
+Connections are per thread and in autocommit mode, so transactions are explicit,
+and the file is in WAL mode, so readers do not block the writer and the other
+way round. A forked worker opens its own connections instead of reusing its
+parent's.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+def default_path(env, name):
+    """The file named by environment variable env, else one belonging to this process."""
+    return os.getenv(env) or os.path.join(tempfile.gettempdir(), f"medi-copilot-{name}-{os.getpid()}.db")
+
+
+class SharedSQLite:
+    """Per-thread connections to one SQLite file, schema (a SQL script) applied on each new connection."""
+
+    def __init__(self, path, schema, timeout=5, row_factory=None):
+        self.path = path
+        self.schema = schema
+        self.timeout = timeout
+        self.row_factory = row_factory
+        self._local = threading.local()
+        # A forked worker must not reuse its parent's connection
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def connection(self):
+        """This thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, so check-then-write is atomic across processes."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
@@ -0,0 +1,34 @@
+"""Tests run from the backend directory: python -m pytest tests
+
+The backend modules import each other by bare name, as the app and the
+benchmarks do, so the backend directory goes on sys.path.
+
+Tests that need a real mongod take the mongod fixture, a scratch database on
+MONGO_TEST_URI (default localhost), and are skipped when none answers.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests that import the app log to stderr rather than leaving a server.log behind
+os.environ.setdefault('LOG_FILE', '-')
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI", "mongodb://localhost:27017")
+MONGO_TEST_DB = "medi-copilot-test"
+
+
+@pytest.fixture(scope='session')
+def mongod():
+    pymongo = pytest.importorskip('pymongo')
+    client = pymongo.MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip(f"No mongod at {MONGO_TEST_URI}")
+    client.drop_database(MONGO_TEST_DB)
+    yield client[MONGO_TEST_DB]
+    client.drop_database(MONGO_TEST_DB)
+    client.close()
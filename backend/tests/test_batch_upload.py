@@ -0,0 +1,61 @@
+"""/extract-text/batch rejects bad images one by one instead of failing the whole batch."""
+import io
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('PIL')
+
+from PIL import Image
+
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-long-enough-for-hs256')
+os.environ.setdefault('DEFER_BACKGROUND_WORK', '1')
+
+import app as flask_app
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('L', (64, 32), 255).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    # Stands in for the OCR pool, which needs tesseract, and records what reached it
+    calls = []
+
+    def extract_batch(images, **options):
+        calls.append(images)
+        return [{'index': index, 'extracted_text': 'ok'} for index in range(len(images))]
+
+    monkeypatch.setattr(flask_app, 'extract_batch', extract_batch)
+    return calls
+
+
+def post(files):
+    client = flask_app.app.test_client()
+    data = {'images': [(io.BytesIO(content), name) for name, content in files]}
+    return client.post('/extract-text/batch', data=data, content_type='multipart/form-data')
+
+
+def test_bad_images_get_their_own_error(extracted):
+    image = png()
+    response = post([('a.png', image), ('b.png', b'not an image'), ('c.png', b''), ('d.png', image)])
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert [result['filename'] for result in results] == ['a.png', 'b.png', 'c.png', 'd.png']
+    assert results[0]['extracted_text'] == results[3]['extracted_text'] == 'ok'
+    assert 'error' in results[1] and 'error' in results[2]
+    assert extracted == [[image, image]]
+
+
+def test_batch_of_only_bad_images_skips_ocr(extracted):
+    response = post([('a.png', b'not an image')])
+
+    assert response.status_code == 200
+    assert 'error' in response.get_json()['results'][0]
+    assert extracted == []
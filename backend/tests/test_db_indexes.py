@@ -0,0 +1,61 @@
+"""Index declarations: applied idempotently, enforcing unique phones, and serving every hot query.
+
+The first two run against mongomock and, when one is reachable, a real mongod.
+The query plan checks need the real query planner and are skipped without one:
+
+    MONGO_TEST_URI=mongodb://localhost:27017 python -m pytest tests/test_db_indexes.py
+"""
+import logging
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+from pymongo.errors import DuplicateKeyError
+
+from db_indexes import INDEXES, HOT_QUERIES, ensure_indexes, verify_query_plans
+
+TEST_DB_NAME = "medi-copilot-test-indexes"
+
+
+@pytest.fixture(params=['mongomock', 'mongod'])
+def db(request):
+    if request.param == 'mongomock':
+        mongomock = pytest.importorskip('mongomock')
+        return mongomock.MongoClient()[TEST_DB_NAME]
+    db = request.getfixturevalue('mongod')
+    for collection in INDEXES:
+        db[collection].drop()
+    return db
+
+
+def index_names(db):
+    return {collection: sorted(db[collection].index_information()) for collection in INDEXES}
+
+
+def test_ensure_indexes_is_idempotent(db, caplog):
+    with caplog.at_level(logging.ERROR):
+        ensure_indexes(db)
+        first = index_names(db)
+        ensure_indexes(db)
+    assert index_names(db) == first
+    for collection, models in INDEXES.items():
+        assert {model.document['name'] for model in models} <= set(first[collection])
+    assert not caplog.records
+
+
+def test_unique_phone_stops_duplicate_registration(db):
+    ensure_indexes(db)
+    user = {'name': 'A', 'phone': '0000000000', 'password': 'x', 'gender': None, 'age': None, 'anonymity': True}
+    db.users.insert_one(dict(user))
+    with pytest.raises(DuplicateKeyError):
+        db.users.insert_one(dict(user, name='B'))
+    assert db.users.count_documents({'phone': '0000000000'}) == 1
+
+
+@pytest.mark.parametrize('query', range(len(HOT_QUERIES)),
+                         ids=[f"{collection}-{'-'.join(sorted(query))}" for collection, query, _ in HOT_QUERIES])
+def test_hot_query_uses_an_index_scan(mongod, query):
+    ensure_indexes(mongod)
+    result = verify_query_plans(mongod)[query]
+    assert result['ok'], f"{result['collection']} {result['query']}: {' <- '.join(result['stages'])}"
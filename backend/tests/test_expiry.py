@@ -0,0 +1,47 @@
+"""Expiring medicines copies them into history as they were while active.
+
+mongomock has no $merge, so the batch path only runs against a real mongod.
+"""
+import pytest
+
+pytest.importorskip('pymongo')
+
+from expiry import expire_one, expire_many, EXPIRE_TAG
+
+
+def medicine(number, user_id='u1'):
+    return {'_id': number, 'user_id': user_id, 'medicineName': f'M{number}', 'medicineActive': True}
+
+
+@pytest.fixture
+def mock_db():
+    mongomock = pytest.importorskip('mongomock')
+    return mongomock.MongoClient()['medi-copilot-test']
+
+
+@pytest.fixture
+def mongod_db(mongod):
+    mongod.medicines.drop()
+    mongod.medicines_history.drop()
+    return mongod
+
+
+def test_expire_one_copies_the_active_document(mock_db):
+    mock_db.medicines.insert_many([medicine(1), medicine(2, user_id='u2')])
+
+    expired = expire_one(mock_db.medicines, mock_db.medicines_history, 1, 'u1')
+
+    assert expired == medicine(1)
+    assert list(mock_db.medicines_history.find()) == [medicine(1)]
+    assert mock_db.medicines.find_one({'_id': 1})['medicineActive'] is False
+    assert expire_one(mock_db.medicines, mock_db.medicines_history, 1, 'u1') is None
+    assert expire_one(mock_db.medicines, mock_db.medicines_history, 2, 'u1') is None
+
+
+def test_expire_many_copies_the_active_documents(mongod_db):
+    mongod_db.medicines.insert_many([medicine(1), medicine(2), medicine(3, user_id='u2')])
+
+    assert expire_many(mongod_db.medicines, mongod_db.medicines_history, {'user_id': 'u1'}) == 2
+
+    assert list(mongod_db.medicines_history.find().sort('_id', 1)) == [medicine(1), medicine(2)]
+    assert mongod_db.medicines.count_documents({'medicineActive': False, EXPIRE_TAG: {'$exists': True}}) == 2
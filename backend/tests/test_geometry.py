@@ -0,0 +1,24 @@
+"""Page geometry estimate against the synthetic corpus' known orientations and skews."""
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('PIL')
+
+from benchmarks.corpus import generate
+from benchmarks.geometry import check_corpus
+
+
+@pytest.fixture(scope='module')
+def images():
+    # Seed 11 is the corpus the sideways-skew misreads were first found on
+    return check_corpus(generate(40, seed=11))
+
+
+def test_line_estimate_is_never_trusted_when_wrong(images):
+    wrong = [(image['file'], image['expected'], image['lines_rotation']) for image in images if image['lines'] == 'wrong']
+    assert wrong == []
+
+
+def test_line_estimate_settles_most_pages(images):
+    right = sum(image['lines'] == 'right' for image in images)
+    assert right >= 0.8 * len(images)
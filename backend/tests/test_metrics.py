@@ -0,0 +1,33 @@
+"""/metrics adds up the snapshots of running workers only."""
+import os
+import json
+import subprocess
+import sys
+
+from metrics import Registry, METRICS_STALE_SECONDS
+
+
+def write_snapshot(directory, pid, value, age=0):
+    path = os.path.join(directory, f'metrics-{pid}.json')
+    with open(path, 'w') as f:
+        json.dump({'requests_total': [[['GET'], value]]}, f)
+    mtime = os.path.getmtime(path) - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_collect_skips_exited_and_stale_workers(tmp_path):
+    registry = Registry(str(tmp_path))
+    requests = registry.counter('requests_total', 'Requests', ('method',))
+    requests.inc(method='GET')
+
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                            capture_output=True, text=True, check=True)
+    dead = write_snapshot(tmp_path, int(exited.stdout), 100)
+    # pid 1 is always running, here it stands for a pid reused since an earlier server run
+    stale = write_snapshot(tmp_path, 1, 1000, age=METRICS_STALE_SECONDS + 60)
+    write_snapshot(tmp_path, os.getppid(), 10)
+
+    assert registry._collect()['requests_total'] == {('GET',): 11}
+    assert not os.path.exists(dead)
+    assert os.path.exists(stale)
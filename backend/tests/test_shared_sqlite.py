@@ -0,0 +1,61 @@
+"""The host-shared SQLite stores: one file seen by every connection, explicit transactions, fork safety."""
+import os
+
+import pytest
+
+from shared_sqlite import SharedSQLite
+from response_cache import SQLiteBackend
+from auth_pool import SharedTokenBucketLimiter, RateLimited
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER);"
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'shared.db')
+
+
+def test_transaction_commits_and_rolls_back(path):
+    db = SharedSQLite(path, SCHEMA)
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO counters VALUES ('a', 1)")
+    with pytest.raises(ZeroDivisionError):
+        with db.transaction() as conn:
+            conn.execute("UPDATE counters SET value = 2")
+            1 / 0
+    # A second store on the same file stands in for another worker
+    other = SharedSQLite(path, SCHEMA)
+    assert other.connection().execute("SELECT value FROM counters").fetchall() == [(1,)]
+    assert other.connection().execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+def test_forked_child_opens_its_own_connection(path):
+    db = SharedSQLite(path, SCHEMA)
+    parent = db.connection()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if db.connection() is not parent else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert db.connection() is parent
+
+
+def test_response_cache_prunes_through_the_expiry_index(path):
+    backend = SQLiteBackend(path)
+    backend.set('old', b'1', -1)
+    backend.set('new', b'2', 60)
+    assert backend.get('new') == b'2'
+    assert backend.stats() == {'entries': 1}
+    plan = backend._db.connection().execute(
+        "EXPLAIN QUERY PLAN DELETE FROM entries WHERE expires_at < 0").fetchall()
+    assert any('entries_expires_at' in row[-1] for row in plan)
+
+
+def test_limiter_buckets_are_shared_by_every_instance(path):
+    first = SharedTokenBucketLimiter(2, 0.001, path=path)
+    second = SharedTokenBucketLimiter(2, 0.001, path=path)
+    first.acquire('0000000000')
+    second.acquire('0000000000')
+    with pytest.raises(RateLimited):
+        first.acquire('0000000000')
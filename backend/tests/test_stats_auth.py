@@ -0,0 +1,19 @@
+"""The server-wide stats routes are not public like /metrics."""
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-long-enough-for-hs256')
+os.environ.setdefault('DEFER_BACKGROUND_WORK', '1')
+
+import app as flask_app
+
+
+@pytest.mark.parametrize('path', ['/ocr/cache/stats', '/response-cache/stats', '/auth/tokens/stats'])
+def test_stats_need_a_token(path):
+    client = flask_app.app.test_client()
+    assert client.get(path).status_code == 401
+    token = flask_app.token_auth.issue('000000000000000000000000')['access_token']
+    assert client.get(path, headers={'Authorization': f'Bearer {token}'}).status_code == 200
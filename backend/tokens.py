@@ -0,0 +1,111 @@
+"""Signed access and refresh tokens, verified without touching the database.
+
+A short-lived access token is sent as "Authorization: Bearer <token>" on
+every call. The long-lived refresh token is only sent to /token/refresh, to
+get a new pair. Decoded access claims are kept in a small LRU keyed by a hash
+of the token, so a client repeating the same token skips the HMAC check and
+JSON parsing. The cache never outlives a token's exp.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+JWT_ALGORITHM = 'HS256'
+ACCESS_TOKEN_TTL = timedelta(seconds=int(os.getenv("ACCESS_TOKEN_TTL_SECONDS", 15 * 60)))
+REFRESH_TOKEN_TTL = timedelta(seconds=int(os.getenv("REFRESH_TOKEN_TTL_SECONDS", 30 * 24 * 60 * 60)))
+# Verified tokens remembered, one per active client is plenty
+CLAIMS_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10_000))
+
+
+class TokenError(Exception):
+    """The token is missing, malformed, expired or of the wrong type. Maps to 401."""
+
+
+class TokenAuth:
+    def __init__(self, secret, cache_size=CLAIMS_CACHE_SIZE):
+        if not secret:
+            raise ValueError("A secret is required to sign tokens")
+        self.secret = secret
+        self.cache_size = cache_size
+        self._claims = OrderedDict()  # token hash -> claims
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'rejected': 0}
+
+    def _encode(self, user_id, token_type, ttl):
+        now = datetime.now(timezone.utc)
+        return jwt.encode({'sub': str(user_id), 'type': token_type, 'iat': now, 'exp': now + ttl},
+                          self.secret, algorithm=JWT_ALGORITHM)
+
+    def issue(self, user_id):
+        """A fresh access and refresh token pair for user_id."""
+        return {
+            'access_token': self._encode(user_id, 'access', ACCESS_TOKEN_TTL),
+            'refresh_token': self._encode(user_id, 'refresh', REFRESH_TOKEN_TTL),
+            'token_type': 'Bearer',
+            'expires_in': int(ACCESS_TOKEN_TTL.total_seconds()),
+        }
+
+    def _decode(self, token, token_type):
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[JWT_ALGORITHM], options={'require': ['exp', 'sub']})
+        except jwt.ExpiredSignatureError:
+            raise TokenError('Token has expired')
+        except jwt.InvalidTokenError:
+            raise TokenError('Token is invalid')
+        if claims.get('type') != token_type:
+            raise TokenError('Token is invalid')
+        return claims
+
+    def verify(self, token, token_type='access'):
+        """Return the claims of a valid token. Raises TokenError otherwise."""
+        if not token:
+            raise TokenError('Token is missing')
+        if token_type != 'access':
+            # Refresh tokens are rare, not worth a cache slot
+            return self._decode(token, token_type)
+
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self._lock:
+            claims = self._claims.get(key)
+            if claims is not None:
+                if claims['exp'] > time.time():
+                    self._claims.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return claims
+                del self._claims[key]
+
+        try:
+            claims = self._decode(token, token_type)
+        except TokenError:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise
+        with self._lock:
+            self._stats['misses'] += 1
+            self._claims[key] = claims
+            if len(self._claims) > self.cache_size:
+                self._claims.popitem(last=False)
+        return claims
+
+    def refresh(self, refresh_token):
+        """Trade a valid refresh token for a new pair."""
+        return self.issue(self.verify(refresh_token, 'refresh')['sub'])
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cached=len(self._claims))
+
+
+def bearer_token(authorization):
+    """The token from an "Authorization: Bearer <token>" header value, or None."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer':
+        return None
+    return token.strip() or None
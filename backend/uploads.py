@@ -0,0 +1,91 @@
+"""Image uploads held on disk rather than in memory, with size limits checked before decoding.
+
+Flask spools each file part of a request into spool_stream: a BytesIO when the
+whole request is at most UPLOAD_SPOOL_BYTES, a temporary file otherwise (also
+when the length is unknown, as with chunked uploads). MAX_REQUEST_BYTES caps the
+request body, so a large upload is refused with 413 while it is still arriving.
+
+Before any pixel is decoded, check_upload refuses files over MAX_UPLOAD_BYTES and
+images over OCR_MAX_IMAGE_PIXELS, reading only the image header. upload_buffer then
+hands the decoder a read-only mmap of the spooled file, so the compressed bytes
+live in the page cache instead of being copied into the worker's heap.
+"""
+import io
+import os
+import mmap
+import tempfile
+from contextlib import contextmanager
+
+from ocr import read_image_header, ImageTooLarge
+from ocr_pool import MAX_BATCH_IMAGES
+
+MIB = 1024 * 1024
+
+# Requests up to this size are spooled in memory, anything larger to a temporary file
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", MIB))
+# One image. Phone photos are 2-8 MB, scans of a page rarely more than 15 MB.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * MIB))
+# A whole request body, a full batch included
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_BYTES", min(MAX_BATCH_IMAGES, 5) * MAX_UPLOAD_BYTES))
+
+
+def spool_stream(total_content_length):
+    """Where one incoming file part is written while the request body is parsed."""
+    if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_BYTES:
+        return io.BytesIO()
+    return tempfile.TemporaryFile('w+b')
+
+
+def upload_size(stream):
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def check_upload(stream):
+    """Refuse an empty, oversized or too many pixel upload from its size and image header alone."""
+    size = upload_size(stream)
+    if size == 0:
+        raise ValueError("Empty file uploaded")
+    if size > MAX_UPLOAD_BYTES:
+        raise ImageTooLarge(f"Image is larger than {MAX_UPLOAD_BYTES // MIB} MB")
+    read_image_header(stream)
+    stream.seek(0)
+    return size
+
+
+def read_upload(stream):
+    """The checked upload as bytes, for the OCR pool and job queue which pickle it to a worker."""
+    check_upload(stream)
+    return stream.read()
+
+
+@contextmanager
+def upload_buffer(stream):
+    """The checked upload as something np.frombuffer and hashlib read without copying.
+
+    Small uploads spooled in memory come back as bytes, larger ones as a
+    read-only mmap that is only valid inside the with block.
+    """
+    check_upload(stream)
+    if isinstance(stream, io.BytesIO):
+        yield stream.getvalue()
+        return
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is None:
+        yield stream.read()
+        return
+
+    buffer = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    try:
+        yield buffer
+    finally:
+        try:
+            buffer.close()
+        except BufferError:
+            # An exception's traceback still holds an array over it, it is unmapped when that is collected
+            pass
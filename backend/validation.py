@@ -0,0 +1,136 @@
+"""Request validation shared by the Flask app and the ASGI app."""
+from datetime import datetime
+
+from ocr import AUTO_PROFILE, OCR_RESOLUTION, check_profile, check_resolution
+from expiry import expires_at
+
+# Upper bound on medicines in one bulk request
+MAX_BULK_MEDICINES = 100
+
+
+class ValidationError(ValueError):
+    """Request data failed validation. The message is safe to send back to the client."""
+
+
+def with_user(data, field, user_id):
+    """data with field set to the authenticated user, whatever the client sent."""
+    return dict(data, **{field: user_id}) if isinstance(data, dict) else data
+
+
+def require_fields(data, fields):
+    if not isinstance(data, dict) or not all(k in data for k in fields):
+        raise ValidationError('Missing required fields')
+
+
+def build_medicine(data):
+    """Validate a medicine payload and return the document to insert."""
+    # Check for required fields (including userId)
+    require_fields(data, ('title', 'qty', 'purchaseDate', 'expiryDate', 'userId'))
+
+    # Validate date formats
+    try:
+        datetime.strptime(data['purchaseDate'], '%Y-%m-%d')
+        datetime.strptime(data['expiryDate'], '%Y-%m-%d')
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid date format. Use YYYY-MM-DD')
+
+    # Validate quantity
+    try:
+        qty = int(data['qty'])
+    except (ValueError, TypeError):
+        raise ValidationError('Invalid quantity, must be a number')
+
+    # Create medicine document with medicineActive set to True
+    return {
+        'user_id': data['userId'],  # Get user_id from the request body
+        'title': data['title'],
+        'qty': qty,
+        'purchaseDate': data['purchaseDate'],
+        'expiryDate': data['expiryDate'],
+        # Real date for the expiry sweeper, expiryDate stays as the client sent it
+        'expiresAt': expires_at(data['expiryDate']),
+        'medicineActive': True  # Default value
+    }
+
+
+def build_medicine_batch(data, user_id=None):
+    """Validate a bulk medicine payload in one pass.
+
+    Items may leave out userId and inherit the top-level one. user_id, when
+    given, is used for every item instead. Returns the
+    documents to insert and one result per input item, in input order: either
+    {'index', 'document'} pointing into the documents list, or {'index', 'error'}.
+    """
+    if user_id:
+        data = with_user(data, 'userId', user_id)
+    require_fields(data, ('userId', 'medicines'))
+    items = data['medicines']
+    if not isinstance(items, list) or not items:
+        raise ValidationError('No medicines provided')
+    if len(items) > MAX_BULK_MEDICINES:
+        raise ValidationError(f'At most {MAX_BULK_MEDICINES} medicines per request')
+
+    documents, results = [], []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValidationError('Medicine must be an object')
+            item_user_id = user_id or item.get('userId', data['userId'])
+            documents.append(build_medicine(dict(item, userId=item_user_id)))
+            results.append({'index': index, 'document': len(documents) - 1})
+        except ValidationError as e:
+            results.append({'index': index, 'error': str(e)})
+    return documents, results
+
+
+def resolve_batch_results(documents, results, write_errors):
+    """Fill in inserted ids, or the database error, for the items build_medicine_batch accepted.
+
+    write_errors maps positions in documents to error messages, as reported by BulkWriteError.
+    """
+    for result in results:
+        if 'document' in result:
+            position = result.pop('document')
+            if position in write_errors:
+                result['error'] = write_errors[position]
+            else:
+                # insert_many sets _id on each document before sending it
+                result['medicine_id'] = str(documents[position]['_id'])
+    return sum('medicine_id' in result for result in results)
+
+
+def build_treatment(data):
+    """Validate a treatment payload and return the document to insert."""
+    require_fields(data, ('user_id', 'treatment_name', 'medicines'))
+
+    # Validate the medicines list
+    medicines_list = data.get('medicines', [])
+    if not medicines_list:
+        raise ValidationError('No medicines provided in the treatment')
+
+    return {
+        'user_id': data['user_id'],
+        'treatment_name': data['treatment_name'],
+        'medicines': medicines_list,
+        'start_date': data.get('start_date', datetime.now()),
+        'end_date': data.get('end_date'),
+        'notes': data.get('notes', ''),
+        'added_on': datetime.now()
+    }
+
+
+def form_flag(form, name):
+    return form.get(name, 'false').lower() in ('1', 'true', 'yes')
+
+
+def ocr_options(form):
+    """Read the OCR pipeline options shared by every OCR route from a submitted form."""
+    profile = form.get('profile', AUTO_PROFILE)
+    check_profile(profile)
+    resolution = form.get('resolution', OCR_RESOLUTION)
+    check_resolution(resolution)
+    return {
+        'profile': profile,
+        'regions': form_flag(form, 'regions'),
+        'resolution': resolution,
+    }
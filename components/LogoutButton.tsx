@@ -1,7 +1,7 @@
 import React from "react";
 import { Button } from "react-native";
 import { useRouter } from "expo-router";
-import { removeUserId } from "../services/authService"; // Import session-based service
+import { removeUserId, removeToken } from "../services/authService"; // Import session-based service
 
 export default function LogoutButton() {
   const router = useRouter();
@@ -9,6 +9,7 @@ export default function LogoutButton() {
   const handleLogout = async () => {
     console.log("Logout started");
     await removeUserId(); // Use session-based removal
+    await removeToken();
     console.log("User ID removal complete");
     router.replace("../auth/login");
     console.log("Navigation to login");
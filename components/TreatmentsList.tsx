@@ -35,7 +35,7 @@ const TreatmentsList: React.FC<TreatmentsListProps> = ({ onRefresh }) => {
         return;
       }
 
-      const data = await getTreatments(userId);
+      const data = await getTreatments();
       setTreatments(data);
       setIsLoading(false);
     } catch (err: any) {
@@ -1,5 +1,5 @@
 import Constants from 'expo-constants';
-import { saveUserId, getUserId } from '@/services/authService'; // Import new services
+import { saveUserId, getUserId, saveTokens, getToken, getRefreshToken, removeToken } from '@/services/authService'; // Import new services
 
 const API_BASE_URL = Constants.expoConfig?.extra?.API_BASE_URL || 'http://10.0.16.189:5002'; //10.0.16.189
 const LOGIN_URL = `${API_BASE_URL}/login`;
@@ -7,6 +7,43 @@ const REGISTER_URL = `${API_BASE_URL}/register`;
 const MEDICINES_URL = `${API_BASE_URL}/medicines`;
 const TREATMENTS_URL = `${API_BASE_URL}/add_treatment`;
 const TREATMENTS_GET_URL = `${API_BASE_URL}/treatments`;
+const REFRESH_URL = `${API_BASE_URL}/token/refresh`;
+
+// Trade the stored refresh token for a new pair, returns the new access token or null
+const refreshAccessToken = async (): Promise<string | null> => {
+  const refreshToken = await getRefreshToken();
+  if (!refreshToken) {
+    return null;
+  }
+  const response = await fetch(REFRESH_URL, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ refresh_token: refreshToken }),
+  });
+  if (!response.ok) {
+    await removeToken();
+    return null;
+  }
+  const data = await response.json();
+  await saveTokens(data.access_token, data.refresh_token);
+  return data.access_token;
+};
+
+// fetch with the access token attached, refreshing it once when the server says it has expired
+export const authFetch = async (url: string, options: RequestInit = {}): Promise<Response> => {
+  const send = (token: string | null) =>
+    fetch(url, {
+      ...options,
+      headers: { ...(options.headers as Record<string, string>), ...(token ? { Authorization: `Bearer ${token}` } : {}) },
+    });
+
+  const response = await send(await getToken());
+  if (response.status !== 401) {
+    return response;
+  }
+  const token = await refreshAccessToken();
+  return token ? send(token) : response;
+};
 
 interface Treatment {
   _id: string;
@@ -21,9 +58,9 @@ interface Treatment {
   }[];
 }
 
-export const getTreatments = async (userId: string): Promise<Treatment[]> => {
+export const getTreatments = async (): Promise<Treatment[]> => {
   try {
-    const response = await fetch(`${TREATMENTS_GET_URL}?user_id=${userId}`);
+    const response = await authFetch(TREATMENTS_GET_URL);
     if (!response.ok) {
       throw new Error("Failed to fetch treatments");
     }
@@ -68,6 +105,9 @@ export const loginUser = async (phone: string, password: string) => {
     if(userId){
       saveUserId(userId); // Save user ID
     }
+    if (responseData.access_token) {
+      await saveTokens(responseData.access_token, responseData.refresh_token);
+    }
     console.log("Login Response Data:", responseData);
     return responseData;
   } catch (error: any) {
@@ -132,12 +172,12 @@ export const addMedicine = async (medicineData: {
       body: JSON.stringify({ ...medicineData, userId }), // Send userId in body
     });
 
-    const response = await fetch(MEDICINES_URL, {
+    const response = await authFetch(MEDICINES_URL, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ ...medicineData, userId }), // Send userID in body
+      body: JSON.stringify({ ...medicineData, userId }), // The server takes the user from the token
     });
 
     console.log("Add Medicine Response:", {
@@ -178,7 +218,7 @@ export const addMedicine = async (medicineData: {
   
   export const addTreatment = async (treatmentData: TreatmentData) => {
     try {
-      const response = await fetch(TREATMENTS_URL, {
+      const response = await authFetch(TREATMENTS_URL, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -57,6 +57,7 @@ export const isUserLoggedIn = async (): Promise<boolean> => {
 
 const TOKEN_KEY = "squashTomatoes"; // Corrected key
 //squashTomatoes
+const REFRESH_TOKEN_KEY = "squashTomatoesRefresh";
 
 export const saveToken = async (token: string) => {
   try {
@@ -78,9 +79,27 @@ export const getToken = async () => {
   }
 };
 
+// Store the access and refresh tokens returned by /login and /token/refresh
+export const saveTokens = async (accessToken: string, refreshToken: string) => {
+  try {
+    await AsyncStorage.multiSet([[TOKEN_KEY, accessToken], [REFRESH_TOKEN_KEY, refreshToken]]);
+  } catch (error) {
+    console.error("Error saving tokens:", error);
+  }
+};
+
+export const getRefreshToken = async () => {
+  try {
+    return await AsyncStorage.getItem(REFRESH_TOKEN_KEY);
+  } catch (error) {
+    console.error("Error retrieving refresh token:", error);
+    return null;
+  }
+};
+
 export const removeToken = async () => {
   try {
-    await AsyncStorage.removeItem(TOKEN_KEY);
+    await AsyncStorage.multiRemove([TOKEN_KEY, REFRESH_TOKEN_KEY]);
     console.log("Token removed from AsyncStorage");
   } catch (error) {
     console.error("Error removing token:", error);